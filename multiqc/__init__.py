@@ -4,3 +4,6 @@ from multiqc.utils import config
 config.logger = logging.getLogger(__name__)
 
 __version__ = config.version
+
+# Main function to run MultiQC, see multiqc/multiqc.py
+from multiqc.multiqc import run
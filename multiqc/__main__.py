@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+""" MultiQC command line. Used by the multiqc script and 'python -m multiqc' """
+
+from __future__ import print_function
+import click
+import sys
+
+from multiqc import __version__
+from multiqc.multiqc import run_cli
+from multiqc.utils import registry, serve
+
+def run_multiqc():
+    """ Run MultiQC from the command line """
+    # 'multiqc merge <reports>' is the same as 'multiqc --merge <reports>'
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        sys.argv[1] = '--merge'
+    # Add any extra plugin command line options
+    command = run_cli
+    for entry_point in registry.get_entry_points('multiqc.cli_options.v1'):
+        opt_func = entry_point.load()
+        command = opt_func(command)
+    # Modify the default click error handling
+    modify_usage_error(command)
+    # 'multiqc serve' runs a daemon that makes reports with the main function
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve.serve(args=sys.argv[2:], prog_name='multiqc serve', obj={'command': command})
+    # Call the main function
+    command(prog_name='multiqc')
+
+def modify_usage_error(main_command):
+    ''' Function to modify the default click error handling.
+    Used here to tell the user about how to find additional help.
+    With thanks to this Stack Overflow answer: http://stackoverflow.com/a/43922088/713980
+    :param main_command: top-level group or command object constructed by click wrapper
+    :return: None
+    '''
+    def show(self, file=None):
+        if file is None:
+            file = click._compat.get_text_stderr()
+        color = None
+        if self.ctx is not None:
+            color = self.ctx.color
+            click.utils.echo(self.ctx.get_usage() + '\n', file=file, color=color)
+        click.utils.echo('Error: %s\n\nThis is MultiQC v{}\n\nFor more help, run \'multiqc --help\' or visit http://multiqc.info\n'.format(__version__) % self.format_message(), file=file, color=color)
+    click.exceptions.UsageError.show = show
+
+if __name__ == "__main__":
+    run_multiqc()
@@ -7,14 +7,16 @@ from collections import OrderedDict
 import io
 import fnmatch
 import logging
-import markdown
 import os
 import re
 import textwrap
 
-from multiqc.utils import report, config, util_functions
+from multiqc.utils import report, config, util_functions, parallel, parse_cache, runtime_profile
 logger = logging.getLogger(__name__)
 
+# Used to tell missing cache entries from cached None results
+_not_cached = object()
+
 class BaseMultiqcModule(object):
 
     def __init__(self, name='base', anchor='base', target=None, href=None, info=None, comment=None, extra=None,
@@ -53,7 +55,7 @@ class BaseMultiqcModule(object):
             if self.comment is not None:
                 self.comment = textwrap.dedent(self.comment)
                 if autoformat_type == 'markdown':
-                    self.comment = markdown.markdown(self.comment)
+                    self.comment = render_markdown(self.comment)
 
         self.sections = list()
 
@@ -113,20 +115,110 @@ class BaseMultiqcModule(object):
             f['s_name'] = self.clean_s_name(f['fn'], f['root'])
             if filehandles or filecontents:
                 try:
-                    with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
+                    # Compressed files are decompressed as they are read, and
+                    # files inside archives are read without extracting them
+                    with util_functions.open_found_file(f) as fh:
                         if filehandles:
                             f['f'] = fh
                             yield f
                         elif filecontents:
                             f['f'] = fh.read()
                             yield f
-                except (IOError, OSError, ValueError, UnicodeDecodeError):
+                except util_functions.log_read_errors:
                     if config.report_readerrors:
                         logger.debug("Couldn't open filehandle when returning file: {}".format(f['fn']))
                         f['f'] = None
             else:
                 yield f
 
+    def parse_log_files(self, sp_key, parser_fn, filecontents=True, filehandles=False, workers=None, cache=True, cache_extra=None):
+        """
+        Find log files and parse them in parallel. Each file is read and passed to
+        parser_fn in a pool of worker threads (or processes, with config.parse_processes),
+        so parser_fn should return what it finds instead of saving it in the module.
+        Results are saved in the parse results cache, so files that haven't changed
+        since the last run are not parsed again. parser_fn must therefore only depend
+        on the file, its sample name and the config - it must not read anything that
+        the module has saved (eg. samples already found), or use cache=False.
+        Results of None (or a tuple of only None) are never cached.
+        :param sp_key: Search pattern key specified in config
+        :param parser_fn: Function called with each file dict, as yielded by find_log_files()
+        :param filecontents: Set to false to call parser_fn without reading the file
+        :param filehandles: Set to true to give parser_fn a file handle instead of slurped file contents
+        :param workers: Number of files to parse at once. Defaults to config.parse_workers
+        :param cache: Set to false if the results of parser_fn depend on more than the file,
+                      its sample name, the module config and cache_extra
+        :param cache_extra: Anything else that the results of parser_fn depend on, eg. config values
+        :return: Yields a tuple with the file dict (without the 'f' key) and the result of
+                 parser_fn, in the same order as find_log_files()
+        """
+        if workers is None:
+            workers = config.parse_workers
+        results_cache = parse_cache.get_cache() if cache else None
+        if workers <= 1 and results_cache is None:
+            for f in self.find_log_files(sp_key, filecontents=filecontents, filehandles=filehandles):
+                result = parser_fn(f)
+                f.pop('f', None)
+                yield f, result
+            return
+        files = list(self.find_log_files(sp_key, filecontents=False, filehandles=False))
+        if results_cache is None:
+            for f, result in parallel.parse_files(files, parser_fn, filecontents, filehandles, workers):
+                yield f, result
+            return
+
+        # Only parse the files that aren't in the cache
+        parser = '{} {}'.format(sp_key, parse_cache.parser_id(parser_fn))
+        keys = [ results_cache.key(f, self, parser, cache_extra) for f in files ]
+        cached = dict()
+        for idx, key in enumerate(keys):
+            result = results_cache.get(key, _not_cached)
+            if result is not _not_cached:
+                cached[idx] = result
+        parsed = parallel.parse_files([ f for idx, f in enumerate(files) if idx not in cached ], parser_fn, filecontents, filehandles, workers)
+        try:
+            next_parsed = next(parsed, None)
+            for idx, f in enumerate(files):
+                if idx in cached:
+                    report.last_found_file = os.path.join(f['root'], f['fn'])
+                    yield f, cached[idx]
+                # Files that couldn't be read are skipped by parse_files()
+                elif next_parsed is not None and next_parsed[0] is f:
+                    results_cache.add(keys[idx], next_parsed[1])
+                    yield next_parsed
+                    next_parsed = next(parsed, None)
+        finally:
+            results_cache.flush()
+
+    def get_cached_result(self, f, name, default=None):
+        """
+        Get a result saved with cache_result() by a previous run, if the file
+        hasn't changed since then. For modules that don't use parse_log_files().
+        :param f: File dict, as yielded by find_log_files()
+        :param name: Name for the result, eg. the parser function name
+        :param default: Returned if there isn't a cached result
+        :return: The cached result, or default
+        """
+        results_cache = parse_cache.get_cache()
+        if results_cache is None:
+            return default
+        return results_cache.get(results_cache.key(f, self, name), default)
+
+    def cache_result(self, f, name, result):
+        """
+        Save what was parsed from a file in the parse results cache, to be
+        found by get_cached_result() on the next run. The result should only
+        depend on the file, its sample name and the module config.
+        :param f: File dict, as yielded by find_log_files()
+        :param name: Name for the result, eg. the parser function name
+        :param result: Parse results. Must be picklable
+        :return: None
+        """
+        results_cache = parse_cache.get_cache()
+        if results_cache is not None:
+            results_cache.add(results_cache.key(f, self, name), result)
+
+    @runtime_profile.profiled('section')
     def add_section(self, name=None, anchor=None, description='', comment='', helptext='', plot='', content='', autoformat=True, autoformat_type='markdown'):
         """ Add a section to the module report output """
 
@@ -156,15 +248,15 @@ class BaseMultiqcModule(object):
             if len(description) > 0:
                 description = textwrap.dedent(description)
                 if autoformat_type == 'markdown':
-                    description = markdown.markdown(description)
+                    description = render_markdown(description)
             if len(comment) > 0:
                 comment = textwrap.dedent(comment)
                 if autoformat_type == 'markdown':
-                    comment = markdown.markdown(comment)
+                    comment = render_markdown(comment)
             if len(helptext) > 0:
                 helptext = textwrap.dedent(helptext)
                 if autoformat_type == 'markdown':
-                    helptext = markdown.markdown(helptext)
+                    helptext = render_markdown(helptext)
 
         # Strip excess whitespace
         description = description.strip()
@@ -311,6 +403,10 @@ class BaseMultiqcModule(object):
             if source is None:
                 source = os.path.abspath(os.path.join(f['root'], f['fn']))
             report.data_sources[module][section][s_name] = source
+            # Other paths that the same file was found at (symlinks, hard links)
+            aliases = report.get_aliases(source)
+            if len(aliases) > 0:
+                report.data_sources[module]['{}_aliases'.format(section)][s_name] = ', '.join(aliases)
         except AttributeError:
             logger.warning('Tried to add data source for {}, but was missing fields data'.format(self.name))
 
@@ -336,3 +432,9 @@ class BaseMultiqcModule(object):
         if pconfig is None:
             pconfig = {}
         return linegraph.plot(data, pconfig)
+
+def render_markdown(text):
+    """ Convert a markdown string to HTML. The markdown library is
+    slow to import, so is only loaded when it's first needed. """
+    import markdown
+    return markdown.markdown(text)
@@ -39,33 +39,23 @@ class MultiqcModule(BaseMultiqcModule):
         self.fastqc_data = dict()
 
         # Find and parse unzipped FastQC reports
-        for f in self.find_log_files('fastqc/data'):
+        for f, parsed in self.parse_log_files('fastqc/data', self.parse_fastqc_file):
             s_name = self.clean_s_name(os.path.basename(f['root']), os.path.dirname(f['root']))
-            self.parse_fastqc_report(f['f'], s_name, f)
+            self.add_fastqc_report(parsed, s_name, f)
 
         # Find and parse zipped FastQC reports
-        for f in self.find_log_files('fastqc/zip', filecontents=False):
-            s_name = f['fn']
-            if s_name.endswith('_fastqc.zip'):
-                s_name = s_name[:-11]
+        for f, (parsed, err) in self.parse_log_files('fastqc/zip', self.parse_fastqc_zip, filecontents=False):
+            s_name = self.fastqc_zip_s_name(f['fn'])
             # Skip if we already have this report - parsing zip files is slow..
             if s_name in self.fastqc_data.keys():
                 log.debug("Skipping '{}' as already parsed '{}'".format(f['fn'], s_name))
                 continue
-            try:
-                fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
-            except Exception as e:
-                log.warn("Couldn't read '{}' - Bad zip file".format(f['fn']))
-                log.debug("Bad zip file error:\n{}".format(e))
+            if err is not None:
+                log.warning(err[0])
+                if err[1] is not None:
+                    log.debug(err[1])
                 continue
-            # FastQC zip files should have just one directory inside, containing report
-            d_name = fqc_zip.namelist()[0]
-            try:
-                with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
-                    r_data = fh.read().decode('utf8')
-                    self.parse_fastqc_report(r_data, s_name, f)
-            except KeyError:
-                log.warning("Error - can't find fastqc_raw_data.txt in {}".format(f))
+            self.add_fastqc_report(parsed, s_name, f)
 
         # Filter to strip out ignored sample names
         self.fastqc_data = self.ignore_samples(self.fastqc_data)
@@ -118,21 +108,64 @@ class MultiqcModule(BaseMultiqcModule):
         """ Takes contents from a fastq_data.txt file and parses out required
         statistics and data. Returns a dict with keys 'stats' and 'data'.
         Data is for plotting graphs, stats are for top table. """
+        self.add_fastqc_report(self.parse_fastqc_data(file_contents), s_name, f)
+
+    def fastqc_zip_s_name(self, fn):
+        """ Sample name for a FastQC zip file, before looking inside """
+        if fn.endswith('_fastqc.zip'):
+            return fn[:-11]
+        return fn
+
+    def parse_fastqc_file(self, f):
+        """ Parse a fastqc_data.txt file. Called by parse_log_files(), so returns
+        the parsed report instead of saving anything. """
+        return self.parse_fastqc_data(f['f'])
+
+    def parse_fastqc_zip(self, f):
+        """ Read and parse the report in a FastQC zip file. Called by parse_log_files(),
+        so returns a tuple with the parsed report and an error message instead of
+        saving anything. Reports that have already been found unzipped
+        are skipped by the caller, as this must only depend on the file. """
+        try:
+            fqc_zip = zipfile.ZipFile(os.path.join(f['root'], f['fn']))
+        except Exception as e:
+            return None, ("Couldn't read '{}' - Bad zip file".format(f['fn']), "Bad zip file error:\n{}".format(e))
+        # FastQC zip files should have just one directory inside, containing report
+        try:
+            d_name = fqc_zip.namelist()[0]
+            with fqc_zip.open(os.path.join(d_name, 'fastqc_data.txt')) as fh:
+                r_data = fh.read().decode('utf8')
+        except KeyError:
+            return None, ("Error - can't find fastqc_raw_data.txt in {}".format(f), None)
+        finally:
+            fqc_zip.close()
+        return self.parse_fastqc_data(r_data), None
+
+    def add_fastqc_report(self, parsed, s_name=None, f=None):
+        """ Save a report parsed by parse_fastqc_data() """
 
         # Make the sample name from the input filename if we find it
-        fn_search = re.search(r"Filename\s+(.+)", file_contents)
-        if fn_search:
-            s_name = self.clean_s_name(fn_search.group(1) , f['root'])
+        if parsed['filename'] is not None:
+            s_name = self.clean_s_name(parsed['filename'], f['root'])
 
         if s_name in self.fastqc_data.keys():
             log.debug("Duplicate sample name found! Overwriting: {}".format(s_name))
         self.add_data_source(f, s_name)
-        self.fastqc_data[s_name] = { 'statuses': dict() }
+        self.fastqc_data[s_name] = parsed['data']
+        self.dup_keys = parsed['dup_keys']
+
+    def parse_fastqc_data(self, file_contents):
+        """ Parse the contents of a fastqc_data.txt file, without saving anything.
+        Returns a dict with the sample filename given in the report (filename),
+        the report data (data) and the order of the duplication keys (dup_keys). """
+
+        fn_search = re.search(r"Filename\s+(.+)", file_contents)
+        data = { 'statuses': dict() }
+        dup_keys = []
 
         # Parse the report
         section = None
         s_headers = None
-        self.dup_keys = []
         for l in file_contents.splitlines():
             if l == '>>END_MODULE':
                 section = None
@@ -140,13 +173,13 @@ class MultiqcModule(BaseMultiqcModule):
             elif l.startswith('>>'):
                 (section, status) = l[2:].split("\t", 1)
                 section = section.lower().replace(' ', '_')
-                self.fastqc_data[s_name]['statuses'][section] = status
+                data['statuses'][section] = status
             elif section is not None:
                 if l.startswith('#'):
                     s_headers = l[1:].split("\t")
                     # Special case: Total Deduplicated Percentage header line
                     if s_headers[0] == 'Total Deduplicated Percentage':
-                        self.fastqc_data[s_name]['basic_statistics'].append({
+                        data['basic_statistics'].append({
                             'measure': 'total_deduplicated_percentage',
                             'value': float(s_headers[1])
                         })
@@ -155,7 +188,7 @@ class MultiqcModule(BaseMultiqcModule):
                         if s_headers[1] == 'Relative count':
                             s_headers[1] = 'Percentage of total'
                         s_headers = [s.lower().replace(' ', '_') for s in s_headers]
-                        self.fastqc_data[s_name][section] = list()
+                        data[section] = list()
 
                 elif s_headers is not None:
                     s = l.split("\t")
@@ -167,25 +200,31 @@ class MultiqcModule(BaseMultiqcModule):
                         except ValueError:
                             pass
                         row[s_headers[i]] = v
-                    self.fastqc_data[s_name][section].append(row)
+                    data[section].append(row)
                     # Special case - need to remember order of duplication keys
                     if section == 'sequence_duplication_levels':
                         try:
-                            self.dup_keys.append(float(s[0]))
+                            dup_keys.append(float(s[0]))
                         except ValueError:
-                            self.dup_keys.append(s[0])
+                            dup_keys.append(s[0])
 
         # Tidy up the Basic Stats
-        self.fastqc_data[s_name]['basic_statistics'] = {d['measure']: d['value'] for d in self.fastqc_data[s_name]['basic_statistics']}
+        data['basic_statistics'] = {d['measure']: d['value'] for d in data['basic_statistics']}
 
         # Calculate the average sequence length (Basic Statistics gives a range)
         length_bp = 0
         total_count = 0
-        for d in self.fastqc_data[s_name].get('sequence_length_distribution', {}):
+        for d in data.get('sequence_length_distribution', {}):
             length_bp += d['count'] * self.avg_bp_from_range(d['length'])
             total_count += d['count']
         if total_count > 0:
-            self.fastqc_data[s_name]['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+            data['basic_statistics']['avg_sequence_length'] = length_bp / total_count
+
+        return {
+            'filename': fn_search.group(1) if fn_search else None,
+            'data': data,
+            'dup_keys': dup_keys
+        }
 
     def fastqc_general_stats(self):
         """ Add some single-number stats to the basic statistics
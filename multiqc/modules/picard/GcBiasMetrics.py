@@ -2,6 +2,7 @@
 
 """ MultiQC submodule to parse output from Picard InsertSizeMetrics """
 
+import functools
 import logging
 import os
 import re
@@ -12,6 +13,61 @@ from multiqc.plots import linegraph
 log = logging.getLogger(__name__)
 
 
+def parse_file(self, f):
+    """ Parse a single GcBiasMetrics file. Called in parallel by parse_log_files(),
+    so returns the parsed data and the sample names found instead of saving them. """
+    data = dict()
+    summary_data = dict()
+    sources = list()
+    s_name = None
+    gc_col = None
+    cov_col = None
+    for l in f['f']:
+        # New log starting
+        if 'GcBiasMetrics' in l and 'INPUT' in l:
+            s_name = None
+
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
+            if fn_search:
+                s_name = os.path.basename(fn_search.group(1).strip('[]'))
+                s_name = self.clean_s_name(s_name, f['root'])
+
+        if s_name is not None:
+            if gc_col is not None and cov_col is not None :
+                try:
+                    # Note that GC isn't always the first column.
+                    s = l.strip("\n").split("\t")
+                    data[s_name][ int(s[gc_col]) ] = float(s[cov_col])
+                except IndexError:
+                    s_name = None
+                    gc_col = None
+                    cov_col = None
+
+            if 'GcBiasDetailMetrics' in l and '## METRICS CLASS' in l:
+                sources.append((s_name, 'GcBiasDetailMetrics'))
+                data[s_name] = dict()
+                # Get header - find columns with the data we want
+                l = f['f'].readline()
+                s = l.strip("\n").split("\t")
+                gc_col = s.index('GC')
+                cov_col = s.index('NORMALIZED_COVERAGE')
+
+            if 'GcBiasSummaryMetrics' in l and '## METRICS CLASS' in l:
+                sources.append((s_name, 'GcBiasSummaryMetrics'))
+                summary_data[s_name] = dict()
+
+                keys = f['f'].readline().rstrip("\n").split("\t")
+                vals = f['f'].readline().rstrip("\n").split("\t")
+                for i, k in enumerate(keys):
+                    try:
+                        summary_data[s_name][k] = float(vals[i])
+                    except ValueError:
+                        summary_data[s_name][k] = vals[i]
+
+    return data, summary_data, sources
+
+
 def parse_reports(self):
     """ Find Picard InsertSizeMetrics reports and parse their data """
 
@@ -19,58 +75,15 @@ def parse_reports(self):
     self.picard_GCbias_data = dict()
     self.picard_GCbiasSummary_data = dict()
 
-    # Go through logs and find Metrics
-    for f in self.find_log_files('picard/gcbias', filehandles=True):
-        s_name = None
-        gc_col = None
-        cov_col = None
-        for l in f['f']:
-            # New log starting
-            if 'GcBiasMetrics' in l and 'INPUT' in l:
-                s_name = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if gc_col is not None and cov_col is not None :
-                    try:
-                        # Note that GC isn't always the first column.
-                        s = l.strip("\n").split("\t")
-                        self.picard_GCbias_data[s_name][ int(s[gc_col]) ] = float(s[cov_col])
-                    except IndexError:
-                        s_name = None
-                        gc_col = None
-                        cov_col = None
-
-                if 'GcBiasDetailMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_GCbias_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='GcBiasDetailMetrics')
-                    self.picard_GCbias_data[s_name] = dict()
-                    # Get header - find columns with the data we want
-                    l = f['f'].readline()
-                    s = l.strip("\n").split("\t")
-                    gc_col = s.index('GC')
-                    cov_col = s.index('NORMALIZED_COVERAGE')
-
-                if 'GcBiasSummaryMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_GCbias_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='GcBiasSummaryMetrics')
-                    self.picard_GCbiasSummary_data[s_name] = dict()
-
-                    keys = f['f'].readline().rstrip("\n").split("\t")
-                    vals = f['f'].readline().rstrip("\n").split("\t")
-                    for i, k in enumerate(keys):
-                        try:
-                            self.picard_GCbiasSummary_data[s_name][k] = float(vals[i])
-                        except ValueError:
-                            self.picard_GCbiasSummary_data[s_name][k] = vals[i]
-
+    # Go through logs and find Metrics. Files are parsed in parallel and saved in order.
+    for f, parsed in self.parse_log_files('picard/gcbias', functools.partial(parse_file, self), filehandles=True):
+        data, summary_data, sources = parsed
+        for s_name, section in sources:
+            if s_name in self.picard_GCbias_data:
+                log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.add_data_source(f, s_name, section=section)
+        self.picard_GCbias_data.update(data)
+        self.picard_GCbiasSummary_data.update(summary_data)
 
         for s_name in list(self.picard_GCbias_data.keys()):
             if len(self.picard_GCbias_data[s_name]) == 0:
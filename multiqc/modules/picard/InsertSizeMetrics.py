@@ -3,6 +3,7 @@
 """ MultiQC submodule to parse output from Picard InsertSizeMetrics """
 
 from collections import OrderedDict
+import functools
 import logging
 import os
 import re
@@ -14,6 +15,80 @@ from multiqc.plots import linegraph
 log = logging.getLogger(__name__)
 
 
+def parse_file(self, f):
+    """ Parse a single InsertSizeMetrics file. Called in parallel by parse_log_files(),
+    so returns the parsed data and the sample names found instead of saving them. """
+    data = dict()
+    histogram = dict()
+    samplestats = dict()
+    sources = list()
+    s_name = None
+    in_hist = False
+    for l in f['f']:
+
+        # Catch the histogram values
+        if s_name is not None and in_hist is True:
+            try:
+                sections = l.split("\t")
+                ins = int(sections[0])
+                tot_count = sum( [int(x) for x in sections[1:]] )
+                histogram[s_name][ins] = tot_count
+                samplestats[s_name]['total_count'] += tot_count
+            except ValueError:
+                # Reset in case we have more in this log file
+                s_name = None
+                in_hist = False
+
+        # New log starting
+        if 'InsertSizeMetrics' in l and 'INPUT' in l:
+            s_name = None
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
+            if fn_search:
+                s_name = os.path.basename(fn_search.group(1).strip('[]'))
+                s_name = self.clean_s_name(s_name, f['root'])
+
+        if s_name is not None:
+            if 'InsertSizeMetrics' in l and '## METRICS CLASS' in l:
+                sources.append((s_name, 'InsertSizeMetrics'))
+                keys = f['f'].readline().strip("\n").split("\t")
+                vals = f['f'].readline().strip("\n").split("\t")
+                samplestats[s_name] = {'total_count': 0, 'meansum':0, 'total_pairs':0 }
+                orientation_idx = keys.index('PAIR_ORIENTATION')
+                while len(vals) == len(keys):
+                    pair_orientation = vals[orientation_idx]
+                    rowkey = '{}_{}'.format(s_name, pair_orientation)
+                    data[rowkey] = OrderedDict()
+                    data[rowkey]['SAMPLE_NAME'] = s_name
+                    for i, k in enumerate(keys):
+                        try:
+                            data[rowkey][k] = float(vals[i])
+                        except ValueError:
+                            try:
+                                data[rowkey][k] = float(vals[i].replace(',','.'))
+                                log.debug("Switching commas for points in '{}': {} - {}".format(f['fn'], vals[i], vals[i].replace(',','.')))
+                            except ValueError:
+                                data[rowkey][k] = vals[i]
+                        except IndexError:
+                            pass # missing data
+                    # Add to mean sums
+                    rp = data[rowkey]['READ_PAIRS']
+                    mis = data[rowkey]['MEAN_INSERT_SIZE']
+                    samplestats[s_name]['meansum'] += (rp * mis)
+                    samplestats[s_name]['total_pairs'] += rp
+
+                    vals = f['f'].readline().strip("\n").split("\t")
+
+                # Skip lines on to histogram
+                l = f['f'].readline().strip("\n")
+                l = f['f'].readline().strip("\n")
+
+                histogram[s_name] = OrderedDict()
+                in_hist = True
+
+    return data, histogram, samplestats, sources
+
+
 def parse_reports(self):
     """ Find Picard InsertSizeMetrics reports and parse their data """
 
@@ -22,73 +97,16 @@ def parse_reports(self):
     self.picard_insertSize_histogram = dict()
     self.picard_insertSize_samplestats = dict()
 
-    # Go through logs and find Metrics
-    for f in self.find_log_files('picard/insertsize', filehandles=True):
-        s_name = None
-        in_hist = False
-        for l in f['f']:
-
-            # Catch the histogram values
-            if s_name is not None and in_hist is True:
-                try:
-                    sections = l.split("\t")
-                    ins = int(sections[0])
-                    tot_count = sum( [int(x) for x in sections[1:]] )
-                    self.picard_insertSize_histogram[s_name][ins] = tot_count
-                    self.picard_insertSize_samplestats[s_name]['total_count'] += tot_count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            # New log starting
-            if 'InsertSizeMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if 'InsertSizeMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_insertSize_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='InsertSizeMetrics')
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    self.picard_insertSize_samplestats[s_name] = {'total_count': 0, 'meansum':0, 'total_pairs':0 }
-                    orientation_idx = keys.index('PAIR_ORIENTATION')
-                    while len(vals) == len(keys):
-                        pair_orientation = vals[orientation_idx]
-                        rowkey = '{}_{}'.format(s_name, pair_orientation)
-                        self.picard_insertSize_data[rowkey] = OrderedDict()
-                        self.picard_insertSize_data[rowkey]['SAMPLE_NAME'] = s_name
-                        for i, k in enumerate(keys):
-                            try:
-                                self.picard_insertSize_data[rowkey][k] = float(vals[i])
-                            except ValueError:
-                                try:
-                                    self.picard_insertSize_data[rowkey][k] = float(vals[i].replace(',','.'))
-                                    log.debug("Switching commas for points in '{}': {} - {}".format(f['fn'], vals[i], vals[i].replace(',','.')))
-                                except ValueError:
-                                    self.picard_insertSize_data[rowkey][k] = vals[i]
-                            except IndexError:
-                                pass # missing data
-                        # Add to mean sums
-                        rp = self.picard_insertSize_data[rowkey]['READ_PAIRS']
-                        mis = self.picard_insertSize_data[rowkey]['MEAN_INSERT_SIZE']
-                        self.picard_insertSize_samplestats[s_name]['meansum'] += (rp * mis)
-                        self.picard_insertSize_samplestats[s_name]['total_pairs'] += rp
-
-                        vals = f['f'].readline().strip("\n").split("\t")
-
-                    # Skip lines on to histogram
-                    l = f['f'].readline().strip("\n")
-                    l = f['f'].readline().strip("\n")
-
-                    self.picard_insertSize_histogram[s_name] = OrderedDict()
-                    in_hist = True
+    # Go through logs and find Metrics. Files are parsed in parallel and saved in order.
+    for f, parsed in self.parse_log_files('picard/insertsize', functools.partial(parse_file, self), filehandles=True):
+        data, histogram, samplestats, sources = parsed
+        for s_name, section in sources:
+            if s_name in self.picard_insertSize_data:
+                log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.add_data_source(f, s_name, section=section)
+        self.picard_insertSize_data.update(data)
+        self.picard_insertSize_histogram.update(histogram)
+        self.picard_insertSize_samplestats.update(samplestats)
 
         for key in list(self.picard_insertSize_data.keys()):
             if len(self.picard_insertSize_data[key]) == 0:
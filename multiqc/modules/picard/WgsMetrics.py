@@ -3,6 +3,7 @@
 """ MultiQC submodule to parse output from Picard WgsMetrics """
 
 from collections import OrderedDict
+import functools
 import logging
 import os
 import re
@@ -14,6 +15,61 @@ from multiqc.plots import linegraph, bargraph
 log = logging.getLogger(__name__)
 
 
+def parse_file(self, f):
+    """ Parse a single WgsMetrics file. Called in parallel by parse_log_files(),
+    so returns the parsed data and the sample names found instead of saving them. """
+    data = dict()
+    histogram = dict()
+    sources = list()
+    s_name = None
+    in_hist = False
+    for l in f['f']:
+
+        # Catch the histogram values
+        if s_name is not None and in_hist is True:
+            try:
+                sections = l.split("\t")
+                cov = int(sections[0])
+                count = int(sections[1])
+                histogram[s_name][cov] = count
+            except ValueError:
+                # Reset in case we have more in this log file
+                s_name = None
+                in_hist = False
+
+        # New log starting
+        if 'WgsMetrics' in l and 'INPUT' in l:
+            s_name = None
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
+            if fn_search:
+                s_name = os.path.basename(fn_search.group(1).strip('[]'))
+                s_name = self.clean_s_name(s_name, f['root'])
+
+        if s_name is not None:
+            if 'CollectWgsMetrics$WgsMetrics' in l and '## METRICS CLASS' in l:
+                sources.append((s_name, 'WgsMetrics'))
+                data[s_name] = dict()
+                keys = f['f'].readline().strip("\n").split("\t")
+                vals = f['f'].readline().strip("\n").split("\t")
+                if len(vals) == len(keys):
+                    for i, k in enumerate(keys):
+                        try:
+                            data[s_name][k] = float(vals[i])
+                        except ValueError:
+                            data[s_name][k] = vals[i]
+
+                # Skip lines on to histogram
+                next(f['f'])
+                next(f['f'])
+                next(f['f'])
+
+                histogram[s_name] = OrderedDict()
+                in_hist = True
+
+    return data, histogram, sources
+
+
 def parse_reports(self):
     """ Find Picard WgsMetrics reports and parse their data """
 
@@ -22,55 +78,15 @@ def parse_reports(self):
     self.picard_wgsmetrics_histogram = dict()
     self.picard_wgsmetrics_samplestats = dict()
 
-    # Go through logs and find Metrics
-    for f in self.find_log_files('picard/wgs_metrics', filehandles=True):
-        s_name = None
-        in_hist = False
-        for l in f['f']:
-
-            # Catch the histogram values
-            if s_name is not None and in_hist is True:
-                try:
-                    sections = l.split("\t")
-                    cov = int(sections[0])
-                    count = int(sections[1])
-                    self.picard_wgsmetrics_histogram[s_name][cov] = count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            # New log starting
-            if 'WgsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if 'CollectWgsMetrics$WgsMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_wgsmetrics_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='WgsMetrics')
-                    self.picard_wgsmetrics_data[s_name] = dict()
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        for i, k in enumerate(keys):
-                            try:
-                                self.picard_wgsmetrics_data[s_name][k] = float(vals[i])
-                            except ValueError:
-                                self.picard_wgsmetrics_data[s_name][k] = vals[i]
-
-                    # Skip lines on to histogram
-                    next(f['f'])
-                    next(f['f'])
-                    next(f['f'])
-
-                    self.picard_wgsmetrics_histogram[s_name] = OrderedDict()
-                    in_hist = True
+    # Go through logs and find Metrics. Files are parsed in parallel and saved in order.
+    for f, parsed in self.parse_log_files('picard/wgs_metrics', functools.partial(parse_file, self), filehandles=True):
+        data, histogram, sources = parsed
+        for s_name, section in sources:
+            if s_name in self.picard_wgsmetrics_data:
+                log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.add_data_source(f, s_name, section=section)
+        self.picard_wgsmetrics_data.update(data)
+        self.picard_wgsmetrics_histogram.update(histogram)
 
         for key in list(self.picard_wgsmetrics_data.keys()):
             if len(self.picard_wgsmetrics_data[key]) == 0:
@@ -17,29 +17,31 @@ log = logging.getLogger(__name__)
 def parse_reports(self):
     """ Find Qualimap BamQC reports and parse their data """
 
+    # Files are read and parsed in parallel, then saved in the usual order
+
     # General stats - genome_results.txt
     self.qualimap_bamqc_genome_results = dict()
-    for f in self.find_log_files('qualimap/bamqc/genome_results'):
-        parse_genome_results(self, f)
+    for f, d in self.parse_log_files('qualimap/bamqc/genome_results', parse_genome_results):
+        save_genome_results(self, f, d)
     self.qualimap_bamqc_genome_results = self.ignore_samples(self.qualimap_bamqc_genome_results)
 
     # Coverage - coverage_histogram.txt
     self.qualimap_bamqc_coverage_hist = dict()
-    for f in self.find_log_files('qualimap/bamqc/coverage', filehandles=True):
-        parse_coverage(self, f)
+    for f, d in self.parse_log_files('qualimap/bamqc/coverage', parse_coverage, filehandles=True):
+        save_coverage(self, f, d)
     self.qualimap_bamqc_coverage_hist = self.ignore_samples(self.qualimap_bamqc_coverage_hist)
 
     # Insert size - insert_size_histogram.txt
     self.qualimap_bamqc_insert_size_hist = dict()
-    for f in self.find_log_files('qualimap/bamqc/insert_size', filehandles=True):
-        parse_insert_size(self, f)
+    for f, d in self.parse_log_files('qualimap/bamqc/insert_size', parse_insert_size, filehandles=True):
+        save_insert_size(self, f, d)
     self.qualimap_bamqc_insert_size_hist = self.ignore_samples(self.qualimap_bamqc_insert_size_hist)
 
     # GC distribution - mapped_reads_gc-content_distribution.txt
     self.qualimap_bamqc_gc_content_dist = dict()
     self.qualimap_bamqc_gc_by_species = dict()  # {'HUMAN': data_dict, 'MOUSE': data_dict}
-    for f in self.find_log_files('qualimap/bamqc/gc_dist', filehandles=True):
-        parse_gc_dist(self, f)
+    for f, d in self.parse_log_files('qualimap/bamqc/gc_dist', parse_gc_dist, filehandles=True):
+        save_gc_dist(self, f, d)
     self.qualimap_bamqc_gc_by_species = self.ignore_samples(self.qualimap_bamqc_gc_by_species)
 
     num_parsed = max(
@@ -73,7 +75,7 @@ def parse_reports(self):
     # Return the number of reports we found
     return num_parsed
 
-def parse_genome_results(self, f):
+def parse_genome_results(f):
     """ Parse the contents of the Qualimap BamQC genome_results.txt file """
     regexes = {
         'bam_file': r"bam file = (.+)",
@@ -94,6 +96,10 @@ def parse_genome_results(self, f):
                 d[k] = float(r_search.group(1).replace(',',''))
             except ValueError:
                 d[k] = r_search.group(1)
+    return d
+
+def save_genome_results(self, f, d):
+    """ Save the results parsed from a Qualimap BamQC genome_results.txt file """
     # Check we have an input filename
     if 'bam_file' not in d:
         log.debug("Couldn't find an input filename in genome_results file {}".format(f['fn']))
@@ -119,12 +125,8 @@ def parse_genome_results(self, f):
     self.add_data_source(f, s_name=s_name, section='genome_results')
 
 
-def parse_coverage(self, f):
+def parse_coverage(f):
     """ Parse the contents of the Qualimap BamQC Coverage Histogram file """
-    # Get the sample name from the parent parent directory
-    # Typical path: <sample name>/raw_data_qualimapReport/coverage_histogram.txt
-    s_name = self.get_s_name(f)
-
     d = dict()
     for l in f['f']:
         if l.startswith('#'):
@@ -133,6 +135,13 @@ def parse_coverage(self, f):
         coverage = int(round(float(coverage)))
         count = float(count)
         d[coverage] = count
+    return d
+
+def save_coverage(self, f, d):
+    """ Save the results parsed from a Qualimap BamQC Coverage Histogram file """
+    # Get the sample name from the parent parent directory
+    # Typical path: <sample name>/raw_data_qualimapReport/coverage_histogram.txt
+    s_name = self.get_s_name(f)
 
     if len(d) == 0:
         log.debug("Couldn't parse contents of coverage histogram file {}".format(f['fn']))
@@ -155,24 +164,24 @@ def parse_coverage(self, f):
     self.qualimap_bamqc_coverage_hist[s_name] = d
     self.add_data_source(f, s_name=s_name, section='coverage_histogram')
 
-def parse_insert_size(self, f):
+def parse_insert_size(f):
     """ Parse the contents of the Qualimap BamQC Insert Size Histogram file """
-    # Get the sample name from the parent parent directory
-    # Typical path: <sample name>/raw_data_qualimapReport/insert_size_histogram.txt
-    s_name = self.get_s_name(f)
-
     d = dict()
-    zero_insertsize = 0
     for l in f['f']:
         if l.startswith('#'):
             continue
         insertsize, count = l.split(None, 1)
         insertsize = int(round(float(insertsize)))
         count = float(count) / 1000000
-        if(insertsize == 0):
-            zero_insertsize = count
-        else:
+        if(insertsize != 0):
             d[insertsize] = count
+    return d
+
+def save_insert_size(self, f, d):
+    """ Save the results parsed from a Qualimap BamQC Insert Size Histogram file """
+    # Get the sample name from the parent parent directory
+    # Typical path: <sample name>/raw_data_qualimapReport/insert_size_histogram.txt
+    s_name = self.get_s_name(f)
 
     # Find median without importing anything to do it for us
     num_counts = sum(d.values())
@@ -192,12 +201,8 @@ def parse_insert_size(self, f):
     self.qualimap_bamqc_insert_size_hist[s_name] = d
     self.add_data_source(f, s_name=s_name, section='insert_size_histogram')
 
-def parse_gc_dist(self, f):
+def parse_gc_dist(f):
     """ Parse the contents of the Qualimap BamQC Mapped Reads GC content distribution file """
-    # Get the sample name from the parent parent directory
-    # Typical path: <sample name>/raw_data_qualimapReport/mapped_reads_gc-content_distribution.txt
-    s_name = self.get_s_name(f)
-
     d = dict()
     reference_species = None
     reference_d = dict()
@@ -216,16 +221,24 @@ def parse_gc_dist(self, f):
         if len(sections) > 2:
             reference_content = float(sections[2])
             reference_d[gc] = reference_content
+    return {'gc_dist': d, 'avg_gc': avg_gc, 'reference_species': reference_species, 'reference_gc_dist': reference_d}
+
+def save_gc_dist(self, f, d):
+    """ Save the results parsed from a Qualimap BamQC Mapped Reads GC content distribution file """
+    # Get the sample name from the parent parent directory
+    # Typical path: <sample name>/raw_data_qualimapReport/mapped_reads_gc-content_distribution.txt
+    s_name = self.get_s_name(f)
 
     # Add average GC to the general stats table
-    self.general_stats_data[s_name]['avg_gc'] = avg_gc
+    self.general_stats_data[s_name]['avg_gc'] = d['avg_gc']
 
     # Save results
     if s_name in self.qualimap_bamqc_gc_content_dist:
         log.debug("Duplicate Mapped Reads GC content distribution sample name found! Overwriting: {}".format(s_name))
-    self.qualimap_bamqc_gc_content_dist[s_name] = d
+    self.qualimap_bamqc_gc_content_dist[s_name] = d['gc_dist']
+    reference_species = d['reference_species']
     if reference_species and reference_species not in self.qualimap_bamqc_gc_by_species:
-        self.qualimap_bamqc_gc_by_species[reference_species] = reference_d
+        self.qualimap_bamqc_gc_by_species[reference_species] = d['reference_gc_dist']
     self.add_data_source(f, s_name=s_name, section='mapped_gc_distribution')
 
 
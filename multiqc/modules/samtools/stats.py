@@ -19,24 +19,8 @@ class StatsReportMixin():
         """ Find Samtools stats logs and parse their data """
 
         self.samtools_stats = dict()
-        for f in self.find_log_files('samtools/stats'):
-            parsed_data = dict()
-            for line in f['f'].splitlines():
-                if not line.startswith("SN"):
-                    continue
-                sections = line.split("\t")
-                field = sections[1].strip()[:-1]
-                field = field.replace(' ', '_')
-                value = float(sections[2].strip())
-                parsed_data[field] = value
-
+        for f, parsed_data in self.parse_log_files('samtools/stats', self.parse_samtools_stats_file, filehandles=True):
             if len(parsed_data) > 0:
-                # Work out some percentages
-                if 'raw_total_sequences' in parsed_data:
-                    for k in list(parsed_data.keys()):
-                        if k.startswith('reads_') and k != 'raw_total_sequences' and parsed_data['raw_total_sequences'] > 0:
-                            parsed_data['{}_percent'.format(k)] = (parsed_data[k] / parsed_data['raw_total_sequences']) * 100
-
                 if f['s_name'] in self.samtools_stats:
                     log.debug("Duplicate sample name found! Overwriting: {}"
                               .format(f['s_name']))
@@ -157,6 +141,26 @@ class StatsReportMixin():
         return len(self.samtools_stats)
 
 
+    def parse_samtools_stats_file(self, f):
+        """ Parse the summary numbers from a single Samtools stats file.
+        Called in parallel by parse_log_files(), so returns the results. """
+        parsed_data = dict()
+        for line in f['f']:
+            if not line.startswith("SN"):
+                continue
+            sections = line.split("\t")
+            field = sections[1].strip()[:-1]
+            field = field.replace(' ', '_')
+            value = float(sections[2].strip())
+            parsed_data[field] = value
+
+        # Work out some percentages
+        if 'raw_total_sequences' in parsed_data:
+            for k in list(parsed_data.keys()):
+                if k.startswith('reads_') and k != 'raw_total_sequences' and parsed_data['raw_total_sequences'] > 0:
+                    parsed_data['{}_percent'.format(k)] = (parsed_data[k] / parsed_data['raw_total_sequences']) * 100
+        return parsed_data
+
     def alignment_section(self, samples_data):
         bedgraph_data = {}
         for sample_id, data in samples_data.items():
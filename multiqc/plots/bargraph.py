@@ -12,23 +12,10 @@ import math
 import os
 import random
 import re
-import sys
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, report, runtime_profile, util_functions
 logger = logging.getLogger(__name__)
 
-try:
-    # Import matplot lib but avoid default X environment
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-except Exception as e:
-    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
-    # The lack of the library will be handled when plots are attempted
-    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
-    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
-    print(e)
-
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
 # Load the template so that we can access its configuration
@@ -40,6 +27,7 @@ def get_template_mod():
         _template_mod = config.avail_templates[config.template].load()
     return _template_mod
 
+@runtime_profile.profiled('plot')
 def plot (data, cats=None, pconfig=None):
     """ Plot a horizontal bar graph. Expects a 2D dict of sample
     data. Also can take info about categories. There are quite a
@@ -274,6 +262,9 @@ def matplotlib_bargraph (plotdata, plotsamples, pconfig=None):
     encoded image within HTML or writes the plot and links to it. Should be called by
     plot_bargraph, which properly formats the input data.
     """
+    # MatPlotLib is slow to import, so is only loaded when needed
+    plt = util_functions.get_pyplot()
+
 
     if pconfig is None:
         pconfig = {}
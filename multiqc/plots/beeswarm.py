@@ -5,13 +5,14 @@
 import logging
 import random
 
-from multiqc.utils import config, report
+from multiqc.utils import config, report, runtime_profile
 from multiqc.plots import table_object
 
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@runtime_profile.profiled('plot')
 def plot (data, headers=None, pconfig=None):
     """ Helper HTML for a beeswarm plot.
     :param data: A list of data dicts
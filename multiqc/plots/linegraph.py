@@ -9,23 +9,10 @@ import io
 import logging
 import os
 import random
-import sys
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, report, runtime_profile, util_functions
 logger = logging.getLogger(__name__)
 
-try:
-    # Import matplot lib but avoid default X environment
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-except Exception as e:
-    # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
-    # The lack of the library will be handled when plots are attempted
-    print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
-    print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
-    print(e)
-
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
 # Load the template so that we can access its configuration
@@ -37,6 +24,7 @@ def get_template_mod():
         _template_mod = config.avail_templates[config.template].load()
     return _template_mod
 
+@runtime_profile.profiled('plot')
 def plot (data, pconfig=None):
     """ Plot a line graph with X,Y data.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
@@ -129,6 +117,16 @@ def plot (data, pconfig=None):
                 thisplotdata.append(this_series)
         plotdata.append(thisplotdata)
 
+    # Downsample very long lines, keeping their shape
+    downsample_points = pconfig.get('downsample_points', config.linegraph_downsample_points)
+    if downsample_points and 'categories' not in pconfig:
+        for data_index, thisplotdata in enumerate(plotdata):
+            series_config = pconfig.copy()
+            if 'data_labels' in pconfig and type(pconfig['data_labels'][data_index]) is dict:
+                series_config.update(pconfig['data_labels'][data_index])
+            downsample_series(thisplotdata, downsample_points,
+                xlog=series_config.get('xLog', False), ylog=series_config.get('yLog', False))
+
     # Add on annotation data series
     try:
         if pconfig.get('extra_series'):
@@ -224,6 +222,9 @@ def matplotlib_linegraph (plotdata, pconfig=None):
     encoded image within HTML or writes the plot and links to it. Should be called by
     plot_bargraph, which properly formats the input data.
     """
+    # MatPlotLib is slow to import, so is only loaded when needed
+    plt = util_functions.get_pyplot()
+
     if pconfig is None:
         pconfig = {}
 
@@ -457,7 +458,8 @@ def matplotlib_linegraph (plotdata, pconfig=None):
 def smooth_line_data(data, numpoints, sumcounts=True):
     """
     Function to take an x-y dataset and use binning to
-    smooth to a maximum number of datapoints.
+    smooth to a maximum number of datapoints. Each bin
+    is labelled with the x value of its last point.
     """
     smoothed = {}
     for s_name, d in data.items():
@@ -467,23 +469,123 @@ def smooth_line_data(data, numpoints, sumcounts=True):
             smoothed[s_name] = d
             continue
 
-        smoothed[s_name] = OrderedDict();
-        p = 0
-        binsize = len(d) / numpoints
-        if binsize < 1:
-            binsize = 1
+        smoothed[s_name] = OrderedDict()
+        xs = sorted(d)
+        binsize = max(len(xs) / float(numpoints), 1)
         binvals = []
-        for x in sorted(d):
-            y = d[x]
-            if p < binsize:
-                binvals.append(y)
-                p += 1
-            else:
+        for i, x in enumerate(xs):
+            binvals.append(d[x])
+            # Last point in this bin, or the last point of all
+            if int((i + 1) / binsize) > int(i / binsize) or i == len(xs) - 1:
                 if sumcounts is True:
                     v = sum(binvals)
                 else:
-                    v = sum(binvals) / binsize
+                    v = sum(binvals) / float(len(binvals))
                 smoothed[s_name][x] = v
-                p = 0
                 binvals = []
     return smoothed
+
+
+def downsample_series(plotdata, numpoints, xlog=False, ylog=False):
+    """
+    Reduce the number of points in long line graph series, keeping the shape
+    of each line (including peaks) with lttb_downsample(). Series that aren't
+    all numbers, eg. with missing values, are left as they are.
+    :param plotdata: list of series dicts for one dataset, as made by plot()
+    :param numpoints: maximum number of points for each series
+    :param xlog: downsample using log10 x values, for logarithmic x axes
+    :param ylog: downsample using log10 y values, for logarithmic y axes
+    :return: None. The series data is changed in place.
+    """
+    # Slow to import, so only imported when first needed
+    import numpy as np
+    numpoints = max(int(numpoints), 3)
+    long_series = list()
+    for series in plotdata:
+        if not isinstance(series.get('data'), list) or len(series['data']) <= numpoints:
+            continue
+        try:
+            xy = np.array(series['data'], dtype=np.float64)
+        except (TypeError, ValueError):
+            continue
+        if xy.ndim != 2 or xy.shape[1] != 2 or not np.isfinite(xy).all():
+            continue
+        for axis, use_log in [(0, xlog), (1, ylog)]:
+            if use_log and (xy[:, axis] > 0).all():
+                xy[:, axis] = np.log10(xy[:, axis])
+        long_series.append((series, xy))
+    if len(long_series) == 0:
+        return
+    keep = lttb_downsample([ (xy[:, 0], xy[:, 1]) for series, xy in long_series ], numpoints)
+    for (series, xy), idx in zip(long_series, keep):
+        series['data'] = [ series['data'][i] for i in idx ]
+    logger.debug("Downsampled {} lines from up to {} to {} points".format(
+        len(long_series), max([ len(xy) for series, xy in long_series ]), numpoints))
+
+
+def lttb_downsample(series, numpoints):
+    """
+    Choose the points to keep in line graph series with the Largest-Triangle-
+    Three-Buckets algorithm (Steinarsson 2013). The first and last points
+    are kept and the others are split into numpoints - 2 buckets. In each
+    bucket the point that makes the largest triangle with the point kept
+    from the previous bucket and the average of the next bucket is kept.
+
+    Buckets have to be done in order, but all series are done together:
+    series with buckets of a similar size are padded into one array and
+    each bucket is done with a few numpy operations for all of them.
+    :param series: list of (x, y) tuples of 1D numpy arrays, sorted by x
+    :param numpoints: maximum number of points for each series, at least 3
+    :return: list with a sorted numpy array of the indexes of the points to keep for each series
+    """
+    import numpy as np
+    keep = [ np.arange(len(x)) for x, y in series ]
+    num_buckets = numpoints - 2
+    # Group series with buckets of a similar size, to limit the padding
+    groups = dict()
+    for i, (x, y) in enumerate(series):
+        if len(x) > numpoints:
+            bucket_size = (len(x) - 2) / float(num_buckets)
+            groups.setdefault(int(np.log2(bucket_size)), list()).append(i)
+
+    for group in groups.values():
+        lengths = np.array([ len(series[i][0]) for i in group ])
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        all_x = np.concatenate([ series[i][0] for i in group ])
+        all_y = np.concatenate([ series[i][1] for i in group ])
+
+        # Bucket start and end positions in all_x and all_y, for points 1 to n-2 of each series
+        edges = 1 + np.floor(np.arange(num_buckets + 1) * ((lengths - 2) / float(num_buckets))[:, None]).astype(np.int64)
+        edges += offsets[:, None]
+        starts = edges[:, :-1]
+        counts = edges[:, 1:] - starts
+
+        # Average of each bucket, and the point after each bucket to make the triangles with
+        cum_x = np.concatenate([[0], np.cumsum(all_x)])
+        cum_y = np.concatenate([[0], np.cumsum(all_y)])
+        last = offsets + lengths - 1
+        next_x = np.concatenate([ ((cum_x[edges[:, 2:]] - cum_x[starts[:, 1:]]) / counts[:, 1:]), all_x[last][:, None] ], axis=1)
+        next_y = np.concatenate([ ((cum_y[edges[:, 2:]] - cum_y[starts[:, 1:]]) / counts[:, 1:]), all_y[last][:, None] ], axis=1)
+
+        # Points in each bucket, padded with the first point of the bucket
+        pos = np.arange(counts.max())
+        idx = np.where(pos < counts[:, :, None], starts[:, :, None] + pos, starts[:, :, None])
+
+        rows = np.arange(len(group))
+        chosen = np.empty((len(group), num_buckets), dtype=np.int64)
+        prev_x = all_x[offsets]
+        prev_y = all_y[offsets]
+        for b in range(num_buckets):
+            cand = idx[:, b, :]
+            cand_x = all_x[cand]
+            cand_y = all_y[cand]
+            # Twice the triangle area, which is enough to compare them
+            area = np.abs((prev_x - next_x[:, b])[:, None] * (cand_y - prev_y[:, None]) -
+                          (prev_x[:, None] - cand_x) * (next_y[:, b] - prev_y)[:, None])
+            chosen[:, b] = cand[rows, area.argmax(axis=1)]
+            prev_x = all_x[chosen[:, b]]
+            prev_y = all_y[chosen[:, b]]
+
+        for k, i in enumerate(group):
+            keep[i] = np.concatenate([[0], chosen[k] - offsets[k], [lengths[k] - 1]])
+    return keep
@@ -6,12 +6,13 @@ from collections import defaultdict, OrderedDict
 import logging
 import random
 
-from multiqc.utils import config, report, util_functions, mqc_colour
+from multiqc.utils import config, report, runtime_profile, util_functions, mqc_colour
 from multiqc.plots import table_object, beeswarm
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@runtime_profile.profiled('plot')
 def plot (data, headers=None, pconfig=None):
     """ Return HTML for a MultiQC table.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
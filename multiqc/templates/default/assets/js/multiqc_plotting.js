@@ -4,6 +4,8 @@
 
 // Global plot data variable
 mqc_plots = {};
+// Plot data files that are being loaded, with functions to call when they have loaded
+mqc_plot_data_callbacks = {};
 
 // Initialise the toolbox filters
 window.mqc_highlight_f_texts = [];
@@ -24,7 +26,8 @@ $(function () {
   $('.mqc_loading_warning').show();
 
   // Decompress the JSON plot data
-  mqc_plots = JSON.parse(LZString.decompressFromBase64(mqc_compressed_plotdata));
+  mqc_plots = mqc_decompress_plotdata(mqc_compressed_plotdata);
+  $.each(mqc_plots, function(target, plot){ mqc_decode_plot(plot); });
 
   // HighCharts Defaults
   window.HCDefaults = $.extend(true, {}, Highcharts.getOptions(), {});
@@ -62,20 +65,38 @@ $(function () {
   });
 
   // Render plots on page load
-  $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
-    var target = $(this).attr('id');
-    // Only one point per dataset, so multiply limit by arbitrary number.
-    var max_num = num_datasets_plot_limit * 50;
-    // Deferring each plot call prevents browser from locking up
-    setTimeout(function(){
-        plot_graph(target, undefined, max_num);
-        if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
-          $('.mqc_loading_warning').hide();
+  // Only one point per dataset, so multiply limit by arbitrary number.
+  var max_num = num_datasets_plot_limit * 50;
+  if(Object.keys(mqc_plot_data_files).length > 0 && 'IntersectionObserver' in window){
+    // Plot data is in separate files: load and render each plot when it scrolls into view
+    var plot_observer = new IntersectionObserver(function(entries){
+      $.each(entries, function(i, entry){
+        if(entry.isIntersecting){
+          plot_observer.unobserve(entry.target);
+          if($(entry.target).hasClass('not_rendered')){
+            plot_graph(entry.target.id, undefined, max_num);
+          }
         }
-    }, 50);
-  });
-  if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+      });
+    }, { rootMargin: '500px 0px' });
+    $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
+      plot_observer.observe(this);
+    });
     $('.mqc_loading_warning').hide();
+  } else {
+    $('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').each(function(){
+      var target = $(this).attr('id');
+      // Deferring each plot call prevents browser from locking up
+      setTimeout(function(){
+          plot_graph(target, undefined, max_num);
+          if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+            $('.mqc_loading_warning').hide();
+          }
+      }, 50);
+    });
+    if($('.hc-plot.not_rendered:visible:not(.gt_max_num_ds)').length == 0){
+      $('.mqc_loading_warning').hide();
+    }
   }
 
   // Render a plot when clicked
@@ -223,6 +244,11 @@ $(function () {
 
 // Call to render any plot
 function plot_graph(target, ds, max_num){
+  // Plot data in a separate file: plot once it has loaded
+  if(mqc_plots[target] === undefined && mqc_plot_data_files[target] !== undefined){
+    mqc_load_plot_data(target, function(){ plot_graph(target, ds, max_num); });
+    return false;
+  }
   if(mqc_plots[target] === undefined){ return false; }
   else {
     // XY Line charts
@@ -1555,4 +1581,322 @@ function highlight_fade_text(obj){
       'transition'       : 'background-color 0.5s, color 0.5s'
     });
   }, 500);
-}
\ No newline at end of file
+}
+
+// Decompress the plot data made by report.compress_json() and parse the JSON.
+// zlib data is base64 encoded and starts with 'zlib:', anything else is lzstring.
+function mqc_decompress_plotdata(data){
+  // Empty if all plot data is in separate files
+  if(data === ''){
+    return {};
+  }
+  if(data.substr(0, 5) !== 'zlib:'){
+    return JSON.parse(LZString.decompressFromBase64(data));
+  }
+  return JSON.parse(mqc_utf8_decode(mqc_inflate(mqc_base64_bytes(data.substr(5)))));
+}
+
+// Convert a base64 string to a Uint8Array
+function mqc_base64_bytes(data){
+  var binary = atob(data);
+  var bytes = new Uint8Array(binary.length);
+  for(var i = 0; i < binary.length; i++){
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+}
+
+// Line graph series are saved as typed arrays by plot_encoding.py.
+// Turn them back into lists of [x, y] points (or y values), in place.
+function mqc_decode_plot(plot){
+  if(plot === undefined || plot['xvals'] === undefined){
+    return plot;
+  }
+  var xvals = [];
+  for(var i = 0; i < plot['xvals'].length; i++){
+    xvals.push(mqc_decode_array(plot['xvals'][i]));
+  }
+  for(var i = 0; i < plot['datasets'].length; i++){
+    for(var j = 0; j < plot['datasets'][i].length; j++){
+      var series = plot['datasets'][i][j];
+      if(series['data'] === undefined || series['data']['y'] === undefined || Array.isArray(series['data'])){
+        continue;
+      }
+      var ys = mqc_decode_array(series['data']['y']);
+      if(series['data']['x'] === undefined){
+        series['data'] = ys;
+      } else {
+        var xs = xvals[series['data']['x']];
+        var points = new Array(ys.length);
+        for(var k = 0; k < ys.length; k++){
+          points[k] = [xs[k], ys[k]];
+        }
+        series['data'] = points;
+      }
+    }
+  }
+  delete plot['xvals'];
+  return plot;
+}
+
+// Decode a typed array made by plot_encoding.encode_array() to a list of numbers
+function mqc_decode_array(encoded){
+  var buffer = mqc_base64_bytes(encoded['data']).buffer;
+  var values;
+  if(encoded['dtype'] == 'int32'){
+    values = Array.prototype.slice.call(new Int32Array(buffer));
+    if(encoded['delta']){
+      for(var i = 1; i < values.length; i++){
+        values[i] += values[i - 1];
+      }
+    }
+    return values;
+  }
+  var typed = encoded['dtype'] == 'float32' ? new Float32Array(buffer) : new Float64Array(buffer);
+  values = new Array(typed.length);
+  for(var i = 0; i < typed.length; i++){
+    if(isNaN(typed[i])){
+      values[i] = null;
+    } else if(encoded['dtype'] == 'float32'){
+      // Float32 can only hold about 7 significant digits, so don't show the made up ones
+      values[i] = parseFloat(typed[i].toPrecision(7));
+    } else {
+      values[i] = typed[i];
+    }
+  }
+  return values;
+}
+
+// Load the data for a plot from its own file, for reports made with split_plot_data.
+// The files are loaded as scripts, as browsers don't allow reports opened from disk
+// to fetch other files. Each one calls mqc_plot_data_loaded() with the plot data.
+function mqc_load_plot_data(target, callback){
+  if(mqc_plot_data_callbacks[target] !== undefined){
+    mqc_plot_data_callbacks[target].push(callback);
+    return;
+  }
+  mqc_plot_data_callbacks[target] = [callback];
+  $('#'+target).html('<small>loading..</small>');
+  var script = document.createElement('script');
+  script.src = mqc_plot_data_files[target];
+  script.onerror = function(){
+    console.error('Could not load plot data file: '+mqc_plot_data_files[target]);
+    $('#'+target).html('<div class="alert alert-danger">Could not load the data for this plot from <code>'+mqc_plot_data_files[target]+'</code></div>');
+    // Don't try again
+    delete mqc_plot_data_files[target];
+    mqc_plot_data_done(target);
+  };
+  document.head.appendChild(script);
+}
+
+// Called by each plot data file when it has loaded
+function mqc_plot_data_loaded(target, data){
+  try {
+    mqc_plots[target] = mqc_decode_plot(mqc_decompress_plotdata(data));
+  } catch(e){
+    console.error('Could not read plot data for '+target+': '+e);
+    delete mqc_plot_data_files[target];
+  }
+  mqc_plot_data_done(target);
+}
+
+function mqc_plot_data_done(target){
+  var callbacks = mqc_plot_data_callbacks[target] || [];
+  delete mqc_plot_data_callbacks[target];
+  $.each(callbacks, function(i, callback){ callback(); });
+}
+
+// Convert UTF-8 bytes to a string
+function mqc_utf8_decode(bytes){
+  if(typeof TextDecoder !== 'undefined'){
+    return new TextDecoder('utf-8').decode(bytes);
+  }
+  // Older browsers: make a binary string in chunks, then decode it
+  var parts = [];
+  for(var i = 0; i < bytes.length; i += 8192){
+    parts.push(String.fromCharCode.apply(null, bytes.subarray(i, i + 8192)));
+  }
+  return decodeURIComponent(escape(parts.join('')));
+}
+
+// Decompress raw deflate data (RFC 1951), as made by Python's zlib with wbits=-15.
+// Takes and returns a Uint8Array. Synchronous, so that the plot data is ready before
+// the page is set up (DecompressionStream would mean setting up the page asynchronously).
+function mqc_inflate(src){
+  var LEN_BASE = [3,4,5,6,7,8,9,10,11,13,15,17,19,23,27,31,35,43,51,59,67,83,99,115,131,163,195,227,258];
+  var LEN_EXTRA = [0,0,0,0,0,0,0,0,1,1,1,1,2,2,2,2,3,3,3,3,4,4,4,4,5,5,5,5,0];
+  var DIST_BASE = [1,2,3,4,5,7,9,13,17,25,33,49,65,97,129,193,257,385,513,769,1025,1537,2049,3073,4097,6145,8193,12289,16385,24577];
+  var DIST_EXTRA = [0,0,0,0,1,1,2,2,3,3,4,4,5,5,6,6,7,7,8,8,9,9,10,10,11,11,12,12,13,13];
+  var CODE_LENGTH_ORDER = [16,17,18,0,8,7,9,6,10,5,11,4,12,3,13,2,14,1,15];
+
+  var out = new Uint8Array(Math.max(src.length * 4, 1024));
+  var out_len = 0;
+  var pos = 0;
+  var bit_buf = 0;
+  var bit_count = 0;
+
+  // Make sure that there's room for n more bytes of output
+  function reserve(n){
+    if(out_len + n > out.length){
+      var bigger = new Uint8Array(Math.max(out.length * 2, out_len + n));
+      bigger.set(out.subarray(0, out_len));
+      out = bigger;
+    }
+  }
+
+  // Read n bits, least significant first
+  function bits(n){
+    while(bit_count < n){
+      if(pos >= src.length){ throw new Error('Unexpected end of compressed plot data'); }
+      bit_buf |= src[pos++] << bit_count;
+      bit_count += 8;
+    }
+    var val = bit_buf & ((1 << n) - 1);
+    bit_buf >>>= n;
+    bit_count -= n;
+    return val;
+  }
+
+  // Lookup table for a Huffman code, indexed by the next max_len bits (reversed)
+  function huffman_table(lengths){
+    var max_len = 0;
+    var count = new Uint16Array(16);
+    var next_code = new Uint16Array(16);
+    for(var i = 0; i < lengths.length; i++){
+      count[lengths[i]]++;
+      max_len = Math.max(max_len, lengths[i]);
+    }
+    count[0] = 0;
+    var code = 0;
+    for(var len = 1; len < 16; len++){
+      code = (code + count[len - 1]) << 1;
+      next_code[len] = code;
+    }
+    var size = 1 << max_len;
+    var table = new Int32Array(size);
+    for(var sym = 0; sym < lengths.length; sym++){
+      var sym_len = lengths[sym];
+      if(sym_len === 0){ continue; }
+      var c = next_code[sym_len]++;
+      var rev = 0;
+      for(var b = 0; b < sym_len; b++){
+        rev = (rev << 1) | (c & 1);
+        c >>= 1;
+      }
+      for(var j = rev; j < size; j += (1 << sym_len)){
+        table[j] = (sym << 4) | sym_len;
+      }
+    }
+    return { table: table, max_len: max_len, mask: size - 1 };
+  }
+
+  // Read one symbol using a Huffman code table
+  function decode(h){
+    while(bit_count < h.max_len){
+      // Pad with zeros at the end of the data, the last codes can be shorter than max_len
+      if(pos < src.length){ bit_buf |= src[pos] << bit_count; }
+      pos++;
+      bit_count += 8;
+    }
+    var entry = h.table[bit_buf & h.mask];
+    if(entry === 0){ throw new Error('Invalid code in compressed plot data'); }
+    bit_buf >>>= (entry & 15);
+    bit_count -= (entry & 15);
+    return entry >> 4;
+  }
+
+  var fixed_lit = null;
+  var fixed_dist = null;
+  var is_final = 0;
+  while(!is_final){
+    is_final = bits(1);
+    var type = bits(2);
+    if(type === 0){
+      // Stored block, starts at the next byte. Give back any whole bytes
+      // that decode() read ahead but didn't use.
+      pos -= bit_count >> 3;
+      bit_buf = 0;
+      bit_count = 0;
+      var stored_len = src[pos] | (src[pos + 1] << 8);
+      pos += 4;
+      reserve(stored_len);
+      out.set(src.subarray(pos, pos + stored_len), out_len);
+      out_len += stored_len;
+      pos += stored_len;
+      continue;
+    }
+    var lit, dist;
+    if(type === 1){
+      // Fixed Huffman codes
+      if(fixed_lit === null){
+        var fl = new Uint8Array(288);
+        for(var i = 0; i < 288; i++){ fl[i] = i < 144 ? 8 : (i < 256 ? 9 : (i < 280 ? 7 : 8)); }
+        var fd = new Uint8Array(30);
+        for(var i = 0; i < 30; i++){ fd[i] = 5; }
+        fixed_lit = huffman_table(fl);
+        fixed_dist = huffman_table(fd);
+      }
+      lit = fixed_lit;
+      dist = fixed_dist;
+    } else if(type === 2){
+      // Dynamic Huffman codes
+      var num_lit = bits(5) + 257;
+      var num_dist = bits(5) + 1;
+      var num_code_len = bits(4) + 4;
+      var code_lengths = new Uint8Array(19);
+      for(var i = 0; i < num_code_len; i++){
+        code_lengths[CODE_LENGTH_ORDER[i]] = bits(3);
+      }
+      var code_len_table = huffman_table(code_lengths);
+      var lengths = new Uint8Array(num_lit + num_dist);
+      var n = 0;
+      while(n < num_lit + num_dist){
+        var sym = decode(code_len_table);
+        if(sym < 16){
+          lengths[n++] = sym;
+          continue;
+        }
+        var repeat, val = 0;
+        if(sym === 16){
+          if(n === 0){ throw new Error('Invalid code lengths in compressed plot data'); }
+          val = lengths[n - 1];
+          repeat = 3 + bits(2);
+        } else if(sym === 17){
+          repeat = 3 + bits(3);
+        } else {
+          repeat = 11 + bits(7);
+        }
+        if(n + repeat > num_lit + num_dist){ throw new Error('Invalid code lengths in compressed plot data'); }
+        while(repeat--){ lengths[n++] = val; }
+      }
+      lit = huffman_table(lengths.subarray(0, num_lit));
+      dist = huffman_table(lengths.subarray(num_lit));
+    } else {
+      throw new Error('Invalid block type in compressed plot data');
+    }
+    // Decompress the block
+    while(true){
+      var sym = decode(lit);
+      if(sym < 256){
+        reserve(1);
+        out[out_len++] = sym;
+      } else if(sym === 256){
+        break;
+      } else {
+        sym -= 257;
+        if(sym >= 29){ throw new Error('Invalid length in compressed plot data'); }
+        var len = LEN_BASE[sym] + bits(LEN_EXTRA[sym]);
+        var dsym = decode(dist);
+        if(dsym >= 30){ throw new Error('Invalid distance in compressed plot data'); }
+        var d = DIST_BASE[dsym] + bits(DIST_EXTRA[dsym]);
+        if(d > out_len){ throw new Error('Invalid distance in compressed plot data'); }
+        reserve(len);
+        for(var k = 0; k < len; k++){
+          out[out_len] = out[out_len - d];
+          out_len++;
+        }
+      }
+    }
+  }
+  return out.subarray(0, out_len);
+}
@@ -57,6 +57,8 @@ $(function () {
   $(document).on('mqc_config_loaded', function(e){
     $('.hc-plot').each(function(){
       var target = $(this).attr('id');
+      // Plot data in a separate file that hasn't been loaded yet: plotted when it scrolls into view
+      if(mqc_plots[target] === undefined && mqc_plot_data_files[target] !== undefined){ return true; }
       plot_graph(target, undefined, num_datasets_plot_limit);
     });
   });
@@ -243,6 +245,20 @@ $(function () {
       ////// EXPORT PLOT DATA
       //////
       else if($('#mqc_data_download').is(':visible')){
+        // Load the data for plots with separate data files that haven't been shown yet, then export
+        var unloaded = $('#mqc_export_selectplots input:checked').map(function(){ return $(this).val(); }).get().filter(function(target){
+          return mqc_plots[target] === undefined && mqc_plot_data_files[target] !== undefined;
+        });
+        if(unloaded.length > 0){
+          var num_loading = unloaded.length;
+          $.each(unloaded, function(i, target){
+            mqc_load_plot_data(target, function(){
+              num_loading -= 1;
+              if(num_loading == 0){ $('#mqc_exportplots').submit(); }
+            });
+          });
+          return;
+        }
         $('#mqc_export_selectplots input:checked').each(function(){
           try {
             var target = $(this).val();
@@ -8,72 +8,153 @@ from datetime import datetime
 import inspect
 import collections
 import os
-import pkg_resources
-import subprocess
+import pickle
+import re
 import sys
 import yaml
 
 import multiqc
+from multiqc.utils import registry
 
 # Default logger will be replaced by caller
 import logging
 logger = logging.getLogger(__name__)
 
 # Get the MultiQC version
-version = pkg_resources.get_distribution("multiqc").version
-short_version = pkg_resources.get_distribution("multiqc").version
+# Installed packages are only scanned when something changes, see utils/registry.py
+version = registry.get_version()
+short_version = version
 script_path = os.path.dirname(os.path.realpath(__file__))
-git_hash = None
+
+def get_git_hash(repo_dir):
+    """
+    Find the commit checked out in a git repository, by reading the files in
+    the .git directory (much quicker than running git). Used to add the commit
+    to the version when MultiQC is run from a clone of the repository.
+    :param repo_dir: path to the repository
+    :return: full commit hash, or None if it can't be found
+    """
+    try:
+        git_dir = os.path.join(repo_dir, '.git')
+        # Worktrees and submodules have a file pointing to the real git directory
+        if os.path.isfile(git_dir):
+            with open(git_dir) as fh:
+                gitdir_line = fh.read().strip()
+            if not gitdir_line.startswith('gitdir:'):
+                return None
+            git_dir = os.path.join(repo_dir, gitdir_line[7:].strip())
+        with open(os.path.join(git_dir, 'HEAD')) as fh:
+            head = fh.read().strip()
+        git_hash = head
+        if head.startswith('ref:'):
+            ref = head[4:].strip()
+            git_hash = None
+            # Branches of worktrees are kept in the main git directory
+            git_dirs = [git_dir]
+            if os.path.isfile(os.path.join(git_dir, 'commondir')):
+                with open(os.path.join(git_dir, 'commondir')) as fh:
+                    git_dirs.append(os.path.join(git_dir, fh.read().strip()))
+            for d in git_dirs:
+                if os.path.isfile(os.path.join(d, ref)):
+                    with open(os.path.join(d, ref)) as fh:
+                        git_hash = fh.read().strip()
+                    break
+                if os.path.isfile(os.path.join(d, 'packed-refs')):
+                    with open(os.path.join(d, 'packed-refs')) as fh:
+                        for l in fh:
+                            s = l.strip().split(' ', 1)
+                            if len(s) == 2 and s[1] == ref:
+                                git_hash = s[0]
+                                break
+                    if git_hash is not None:
+                        break
+        if git_hash is None or re.match(r'^[0-9a-f]{40}$', git_hash) is None:
+            return None
+        return git_hash
+    except (IOError, OSError):
+        return None
+
+git_hash = get_git_hash(os.path.dirname(os.path.dirname(script_path)))
 git_hash_short = None
-try:
-    git_hash = subprocess.check_output( ['git', 'rev-parse', 'HEAD'],
-                                        cwd=script_path,
-                                        stderr=subprocess.STDOUT,
-                                        universal_newlines=True ).strip()
+if git_hash is not None:
     git_hash_short = git_hash[:7]
     version = '{} ({})'.format(version, git_hash_short)
-except:
-    pass
 
 # Constants
 MULTIQC_DIR = os.path.dirname(os.path.realpath(inspect.getfile(multiqc)))
 
 ##### MultiQC Defaults
-# Default MultiQC config
-searchp_fn = os.path.join( MULTIQC_DIR, 'utils', 'config_defaults.yaml')
-with open(searchp_fn) as f:
-    configs = yaml.load(f)
-    for c, v in configs.items():
-        globals()[c] = v
-# Module filename search patterns
-searchp_fn = os.path.join( MULTIQC_DIR, 'utils', 'search_patterns.yaml')
-with open(searchp_fn) as f:
-    sp = yaml.load(f)
-
-# Other defaults that can't be set in YAML
-data_tmp_dir = '/tmp' # will be overwritten by core script
-modules_dir = os.path.join(MULTIQC_DIR, 'modules')
-creation_date = datetime.now().strftime("%Y-%m-%d, %H:%M")
-working_dir = os.getcwd()
-analysis_dir = [os.getcwd()]
-output_dir = os.path.realpath(os.getcwd())
-megaqc_access_token = os.environ.get('MEGAQC_ACCESS_TOKEN')
+# Use the fast C YAML parser if PyYAML was built with it
+yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+def load_defaults():
+    """
+    Load the default config and the module filename search patterns. Parsing
+    the YAML files is slow, so a pickled copy is kept in the user cache
+    directory and only made again when the YAML files change.
+    :return: config dict, search patterns dict
+    """
+    yaml_fns = [
+        os.path.join( MULTIQC_DIR, 'utils', 'config_defaults.yaml'),
+        os.path.join( MULTIQC_DIR, 'utils', 'search_patterns.yaml')
+    ]
+    signature = [defaults_cache_format, short_version]
+    for fn in yaml_fns:
+        fstat = os.stat(fn)
+        signature.append((fn, fstat.st_size, fstat.st_mtime))
+    cache_fn = registry.user_cache_path('config_defaults_{}.pkl')
+    try:
+        with open(cache_fn, 'rb') as fh:
+            cached = pickle.load(fh)
+        if cached['signature'] == signature:
+            return cached['configs'], cached['sp']
+    except Exception:
+        pass
+    parsed = list()
+    for fn in yaml_fns:
+        with open(fn) as f:
+            parsed.append(yaml.load(f, Loader=yaml_loader))
+    configs, sp = parsed
+    cached = { 'signature': signature, 'configs': configs, 'sp': sp }
+    registry.write_cache_file(cache_fn, pickle.dumps(cached, pickle.HIGHEST_PROTOCOL))
+    return configs, sp
+
+# Change this if the format of the cached defaults changes
+defaults_cache_format = 1
+
+configs, sp = load_defaults()
+# Kept so that the config can be set back to the defaults, see reset()
+pickled_defaults = pickle.dumps((configs, sp), pickle.HIGHEST_PROTOCOL)
+for c, v in configs.items():
+    globals()[c] = v
+
+def set_run_defaults():
+    """ Other defaults that can't be set in YAML """
+    global data_tmp_dir, modules_dir, creation_date, working_dir, analysis_dir, output_dir, megaqc_access_token
+    data_tmp_dir = '/tmp' # will be overwritten by core script
+    modules_dir = os.path.join(MULTIQC_DIR, 'modules')
+    creation_date = datetime.now().strftime("%Y-%m-%d, %H:%M")
+    working_dir = os.getcwd()
+    analysis_dir = [os.getcwd()]
+    output_dir = os.path.realpath(os.getcwd())
+    megaqc_access_token = os.environ.get('MEGAQC_ACCESS_TOKEN')
+
+set_run_defaults()
 
 ##### Available modules
 # Modules must be listed in setup.py under entry_points['multiqc.modules.v1']
-# Get all modules, including those from other extension packages
+# Get all modules, including those from other extension packages.
+# Modules are not imported until they are run.
 avail_modules = dict()
-for entry_point in pkg_resources.iter_entry_points('multiqc.modules.v1'):
-    nicename = str(entry_point).split('=')[0].strip()
-    avail_modules[nicename] = entry_point
+for entry_point in registry.get_entry_points('multiqc.modules.v1'):
+    avail_modules[entry_point.name] = entry_point
 
 ##### Available templates
 # Templates must be listed in setup.py under entry_points['multiqc.templates.v1']
 # Get all templates, including those from other extension packages
 avail_templates = {}
-for entry_point in pkg_resources.iter_entry_points('multiqc.templates.v1'):
-    nicename = str(entry_point).split('=')[0].strip()
-    avail_templates[nicename] = entry_point
+for entry_point in registry.get_entry_points('multiqc.templates.v1'):
+    avail_templates[entry_point.name] = entry_point
 
 ##### Check we have modules & templates
 # Check that we were able to find some modules and templates
@@ -206,6 +287,19 @@ def load_sample_names(snames_file):
         logger.error("Error loading sample names file: {}".format(e))
     logger.debug("Found {} sample renaming patterns".format(len(sample_names_rename_buttons)))
 
+def reset():
+    """ Set the config back to the defaults, removing anything added by config
+    files, command line options or the last run. Called at the end of each run,
+    so that MultiQC can be run more than once in the same process. """
+    global configs, sp
+    for c in list(globals().keys()):
+        if c not in import_names:
+            del globals()[c]
+    configs, sp = pickle.loads(pickled_defaults)
+    for c, v in configs.items():
+        globals()[c] = v
+    set_run_defaults()
+
 def update(u):
     return update_dict(globals(), u)
 
@@ -218,3 +312,6 @@ def update_dict(d, u):
         else:
             d[key] = u[key]
     return d
+
+# Everything that is set when the config is first imported. Anything else is removed by reset()
+import_names = set(globals().keys()) | set(['import_names'])
@@ -14,6 +14,7 @@ from multiqc.utils import config, util_functions
 LEVELS = {0: 'INFO', 1: 'DEBUG'}
 log_tmp_dir = None
 log_tmp_fn = '/dev/null'
+log_handlers = list()
 
 def init_log(logger, loglevel=0):
     """
@@ -28,6 +29,12 @@ def init_log(logger, loglevel=0):
     # File for logging
     global log_tmp_dir, log_tmp_fn
     log_tmp_dir = tempfile.mkdtemp()
+
+    # Remove the handlers from any earlier run in this process
+    for handler in log_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    del log_handlers[:]
     log_tmp_fn = os.path.join(log_tmp_dir, 'multiqc.log')
 
     # Logging templates
@@ -45,12 +52,14 @@ def init_log(logger, loglevel=0):
     else:
         console.setFormatter(logging.Formatter(info_template))
     logger.addHandler(console)
+    log_handlers.append(console)
 
     # Now set up the file logging stream if we have a data directory
     file_handler = logging.FileHandler(log_tmp_fn, encoding='utf-8')
     file_handler.setLevel(getattr(logging, 'DEBUG')) # always DEBUG for the file
     file_handler.setFormatter(logging.Formatter(debug_template))
     logger.addHandler(file_handler)
+    log_handlers.append(file_handler)
 
 def move_tmp_log(logger):
     """ Move the temporary log file to the MultiQC data directory
@@ -58,12 +67,28 @@ def move_tmp_log(logger):
 
     try:
         # https://stackoverflow.com/questions/15435652/python-does-not-release-filehandles-to-logfile
-        logging.shutdown()
+        # Only close the log file, so that other logging in this process isn't affected
+        for handler in [ h for h in log_handlers if isinstance(h, logging.FileHandler) ]:
+            logger.removeHandler(handler)
+            log_handlers.remove(handler)
+            handler.close()
         shutil.move(log_tmp_fn, os.path.join(config.data_dir, 'multiqc.log'))
         util_functions.robust_rmtree(log_tmp_dir)
     except (AttributeError, TypeError, IOError):
         pass
 
+def close_log(logger):
+    """ Remove the log handlers added by init_log() and delete the
+    temporary log directory, at the end of every run. """
+    global log_tmp_dir
+    for handler in log_handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    del log_handlers[:]
+    if log_tmp_dir is not None and os.path.exists(log_tmp_dir):
+        util_functions.robust_rmtree(log_tmp_dir)
+    log_tmp_dir = None
+
 
 def get_log_stream(logger):
     """
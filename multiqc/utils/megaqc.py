@@ -7,7 +7,7 @@ import gzip
 import io
 import json
 import os
-import requests
+import re
 
 from multiqc import config
 log = config.logger
@@ -65,9 +65,36 @@ def multiqc_dump_json(report):
                 exported_data['config_analysis_dir_abs'].append(os.path.abspath(d))
             except:
                 pass
+    # Module and section names with their plot IDs, so that reports can be merged later
+    exported_data['report_modules'] = modules_summary(report)
     return exported_data
 
 
+def modules_summary(report):
+    """ Module and section names, text and plot IDs, without the HTML for plots and tables """
+    modules = list()
+    for m in getattr(report, 'modules_output', []):
+        sections = list()
+        for s in getattr(m, 'sections', []):
+            html = '{} {}'.format(s.get('plot') or '', s.get('content') or '')
+            sections.append({
+                'name': s.get('name'),
+                'anchor': s.get('anchor'),
+                'description': s.get('description'),
+                'comment': s.get('comment'),
+                'helptext': s.get('helptext'),
+                'plot_ids': [ pid for pid in re.findall(r'id="([^"]+)"', html) if pid in report.plot_data ]
+            })
+        modules.append({
+            'name': getattr(m, 'name', None),
+            'anchor': getattr(m, 'anchor', None),
+            'intro': getattr(m, 'intro', ''),
+            'comment': getattr(m, 'comment', ''),
+            'sections': sections
+        })
+    return modules
+
+
 def multiqc_api_post(exported_data):
     headers = { 'Content-Type': 'application/json', 'content-encoding': 'gzip' }
     if config.megaqc_access_token is not None:
@@ -82,6 +109,9 @@ def multiqc_api_post(exported_data):
     gzfh.close()
     request_body = sio_obj.getvalue()
 
+    # Requests is slow to import, so is only loaded when data is sent
+    import requests
+
     log.debug("Sending data to MegaQC")
     log.debug("MegaQC URL: {}".format(config.megaqc_url))
     try:
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+""" MultiQC report merging. Combines the multiqc_data.json files saved
+by earlier MultiQC runs (see megaqc.multiqc_dump_json()) into a single
+report, without finding or parsing any log files again. """
+
+from __future__ import print_function
+from collections import OrderedDict
+import copy
+import io
+import json
+import logging
+import os
+
+from multiqc.plots import bargraph, heatmap, linegraph, scatter
+from multiqc.utils import config, report, util_functions
+
+logger = logging.getLogger(__name__)
+
+# Plot types that are merged sample by sample. Other plots are taken from one report.
+sample_plot_types = ['xy_line', 'scatter', 'bar_graph', 'beeswarm']
+
+class MergedModule(object):
+    """ Stands in for a module object in the merged report """
+
+    def __init__(self, name, anchor, intro='', comment=''):
+        self.name = name
+        self.anchor = anchor
+        self.intro = intro
+        self.comment = comment
+        self.sections = list()
+
+def find_data_file(path):
+    """ Find the multiqc_data.json file for a report: either the file itself,
+    the data directory, or the directory that holds the report """
+    if os.path.isfile(path):
+        return path
+    candidates = [ os.path.join(path, 'multiqc_data.json') ]
+    if os.path.isdir(path):
+        for d in sorted(os.listdir(path)):
+            if d.endswith('_data'):
+                candidates.append(os.path.join(path, d, 'multiqc_data.json'))
+    for fn in candidates:
+        if os.path.isfile(fn):
+            return fn
+    return None
+
+def report_label(fn):
+    """ Name for a report in renamed samples, from the directory of its data directory """
+    data_dir = os.path.dirname(os.path.abspath(fn))
+    label = os.path.basename(os.path.dirname(data_dir))
+    if os.path.basename(data_dir) not in ['multiqc_data', ''] and data_dir.endswith('_data'):
+        label = os.path.basename(data_dir)[:-5]
+    return label
+
+def load_reports(paths):
+    """
+    Load the multiqc_data.json files for a list of reports
+    :param paths: list of data files, data directories or report directories
+    :return: list of (label, data) tuples, in the order given
+    """
+    reports = list()
+    labels = set()
+    for path in paths:
+        fn = find_data_file(path)
+        if fn is None:
+            logger.warning("Could not find multiqc_data.json for '{}', skipping".format(path))
+            continue
+        try:
+            with io.open(fn, 'r', encoding='utf-8') as fh:
+                data = json.load(fh, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError) as e:
+            logger.error("Could not load '{}': {}".format(fn, e))
+            continue
+        label = report_label(fn)
+        if label in labels:
+            label = '{}_{}'.format(label, len(reports) + 1)
+        labels.add(label)
+        if data.get('config_short_version') != config.short_version:
+            logger.debug("{} was made with MultiQC v{}".format(fn, data.get('config_short_version')))
+        logger.info("Merging     : {}  ({})".format(fn, label))
+        reports.append((label, data))
+    return reports
+
+def report_samples(data):
+    """ Sample names in a loaded report, for finding samples in more than one report """
+    samples = set()
+    for d in data.get('report_general_stats_data', []):
+        samples.update(d.keys())
+    for plot in data.get('report_plot_data', {}).values():
+        if plot.get('plot_type') in ['xy_line', 'scatter']:
+            for ds in plot.get('datasets', []):
+                samples.update([ s.get('name') for s in ds if isinstance(s, dict) ])
+        elif plot.get('plot_type') in ['bar_graph', 'beeswarm']:
+            for ss in plot.get('samples', []):
+                samples.update(ss)
+    samples.discard(None)
+    return samples
+
+def rename_samples(data, renames):
+    """ Rename samples everywhere in a loaded report. Used for samples
+    found in more than one report, with merge_conflicts: rename """
+    if len(renames) == 0:
+        return
+    rn = lambda s: renames.get(s, s)
+    data['report_general_stats_data'] = [ OrderedDict([ (rn(s), v) for s, v in d.items() ]) for d in data.get('report_general_stats_data', []) ]
+    for plot in data.get('report_plot_data', {}).values():
+        if plot.get('plot_type') in ['xy_line', 'scatter']:
+            for ds in plot.get('datasets', []):
+                for s in ds:
+                    if isinstance(s, dict) and 'name' in s:
+                        s['name'] = rn(s['name'])
+        elif plot.get('plot_type') in ['bar_graph', 'beeswarm']:
+            plot['samples'] = [ [ rn(s) for s in ss ] for ss in plot.get('samples', []) ]
+    for fn, d in data.get('report_saved_raw_data', {}).items():
+        data['report_saved_raw_data'][fn] = OrderedDict([ (rn(s), v) for s, v in d.items() ])
+    for mod in data.get('report_data_sources', {}).values():
+        for sec, sources in mod.items():
+            mod[sec] = OrderedDict([ (rn(s), v) for s, v in sources.items() ])
+
+class Merger(object):
+    """ Merges loaded reports one at a time, sample by sample. When a sample is
+    in more than one report, config.merge_conflicts decides what happens:
+    'last' (default) uses the last report, 'first' uses the first report and
+    'rename' keeps both, adding the report name to the sample names. """
+
+    def __init__(self):
+        self.rule = config.merge_conflicts
+        if self.rule not in ['first', 'last', 'rename']:
+            logger.warning("Unknown merge_conflicts value '{}', using 'last'".format(self.rule))
+            self.rule = 'last'
+        self.modules = OrderedDict()
+        self.plots = OrderedDict()
+        self.general_stats = OrderedDict()
+        self.raw_data = OrderedDict()
+        self.data_sources = OrderedDict()
+
+    def merge_dict(self, target, new):
+        """ Add the samples (keys) in new to target """
+        for s, v in new.items():
+            if s in target and self.rule == 'first':
+                continue
+            target[s] = v
+
+    def add(self, data):
+        """ Merge a loaded report """
+        self.add_modules(data)
+        for pid, plot in data.get('report_plot_data', {}).items():
+            self.add_plot(pid, plot)
+        for idx, d in enumerate(data.get('report_general_stats_data', [])):
+            try:
+                headers = data['report_general_stats_headers'][idx]
+            except (KeyError, IndexError):
+                headers = OrderedDict()
+            self.add_general_stats(d, headers)
+        for fn, d in data.get('report_saved_raw_data', {}).items():
+            self.merge_dict(self.raw_data.setdefault(fn, OrderedDict()), d)
+        for mod, sections in data.get('report_data_sources', {}).items():
+            for sec, sources in sections.items():
+                self.merge_dict(self.data_sources.setdefault(mod, OrderedDict()).setdefault(sec, OrderedDict()), sources)
+
+    def add_modules(self, data):
+        """ Module and section names, in the order first seen """
+        for m in data.get('report_modules', []):
+            if m['anchor'] not in self.modules:
+                self.modules[m['anchor']] = {
+                    'name': m.get('name'),
+                    'anchor': m['anchor'],
+                    'intro': m.get('intro', ''),
+                    'comment': m.get('comment', ''),
+                    'sections': OrderedDict()
+                }
+            sections = self.modules[m['anchor']]['sections']
+            for s in m.get('sections', []):
+                if s['anchor'] not in sections:
+                    sections[s['anchor']] = dict(s)
+                    sections[s['anchor']]['plot_ids'] = list()
+                for pid in s.get('plot_ids', []):
+                    if pid not in sections[s['anchor']]['plot_ids']:
+                        sections[s['anchor']]['plot_ids'].append(pid)
+
+    def add_plot(self, pid, plot):
+        """ Merge the data for one plot """
+        ptype = plot.get('plot_type')
+        if pid not in self.plots:
+            self.plots[pid] = copy.deepcopy(plot)
+        elif ptype != self.plots[pid].get('plot_type') or ptype not in sample_plot_types:
+            logger.debug("Plot '{}' can't be merged, using the {} one".format(pid, self.rule if self.rule != 'rename' else 'first'))
+            if self.rule == 'last':
+                self.plots[pid] = copy.deepcopy(plot)
+        else:
+            self.merge_axes(self.plots[pid], plot)
+            if ptype in ['xy_line', 'scatter']:
+                self.merge_series(self.plots[pid], plot)
+            elif ptype == 'bar_graph':
+                self.merge_bargraph(self.plots[pid], plot)
+            elif ptype == 'beeswarm':
+                self.merge_beeswarm(self.plots[pid], plot)
+
+    def merge_axes(self, merged, plot):
+        """ Widen axis limits worked out from the data, so that all samples fit """
+        m_config = merged.get('config', {})
+        for k, fn in [('xmax', max), ('ymax', max), ('xmin', min), ('ymin', min)]:
+            vals = [ v for v in [m_config.get(k), plot.get('config', {}).get(k)] if isinstance(v, (int, float)) ]
+            if len(vals) == 2:
+                m_config[k] = fn(vals)
+
+    def merge_series(self, merged, plot):
+        """ Line graphs and scatter plots: one series or point per sample in each dataset """
+        for idx, ds in enumerate(plot.get('datasets', [])):
+            if idx >= len(merged['datasets']):
+                merged['datasets'].append(copy.deepcopy(ds))
+                continue
+            positions = dict([ (s.get('name'), i) for i, s in enumerate(merged['datasets'][idx]) ])
+            for s in ds:
+                if s.get('name') in positions:
+                    if self.rule != 'first':
+                        merged['datasets'][idx][positions[s.get('name')]] = copy.deepcopy(s)
+                else:
+                    positions[s.get('name')] = len(merged['datasets'][idx])
+                    merged['datasets'][idx].append(copy.deepcopy(s))
+
+    def merge_bargraph(self, merged, plot):
+        """ Bar graphs: each category has a list of values, one for each sample """
+        for idx, ds in enumerate(plot.get('datasets', [])):
+            samples = plot['samples'][idx]
+            if idx >= len(merged['datasets']):
+                merged['datasets'].append(copy.deepcopy(ds))
+                merged['samples'].append(list(samples))
+                continue
+            m_samples = merged['samples'][idx]
+            # Values by sample, then category
+            values = OrderedDict([ (s, dict()) for s in m_samples ])
+            cats = OrderedDict()
+            for cat in merged['datasets'][idx]:
+                cats[cat['name']] = cat
+                for s, v in zip(m_samples, cat['data']):
+                    values[s][cat['name']] = v
+            new_values = OrderedDict([ (s, dict()) for s in samples ])
+            for cat in ds:
+                if cat['name'] not in cats:
+                    cats[cat['name']] = copy.deepcopy(cat)
+                for s, v in zip(samples, cat['data']):
+                    new_values[s][cat['name']] = v
+            self.merge_dict(values, new_values)
+            all_samples = list(values.keys())
+            if m_samples == sorted(m_samples) and list(samples) == sorted(samples):
+                all_samples = sorted(all_samples)
+            merged['samples'][idx] = all_samples
+            merged['datasets'][idx] = list()
+            for name, cat in cats.items():
+                cat['data'] = [ values[s].get(name, float('nan')) for s in all_samples ]
+                merged['datasets'][idx].append(cat)
+
+    def merge_beeswarm(self, merged, plot):
+        """ Beeswarm plots: a list of values and samples for each category """
+        positions = dict([ ((c.get('namespace'), c.get('title')), i) for i, c in enumerate(merged['categories']) ])
+        for idx, cat in enumerate(plot.get('categories', [])):
+            key = (cat.get('namespace'), cat.get('title'))
+            if key not in positions:
+                positions[key] = len(merged['categories'])
+                merged['categories'].append(copy.deepcopy(cat))
+                merged['samples'].append(list(plot['samples'][idx]))
+                merged['datasets'].append(list(plot['datasets'][idx]))
+                continue
+            midx = positions[key]
+            values = OrderedDict(zip(merged['samples'][midx], merged['datasets'][midx]))
+            self.merge_dict(values, OrderedDict(zip(plot['samples'][idx], plot['datasets'][idx])))
+            merged['samples'][midx] = list(values.keys())
+            merged['datasets'][midx] = list(values.values())
+            for k, fn in [('max', max), ('min', min)]:
+                vals = [ v for v in [merged['categories'][midx].get(k), cat.get(k)] if v is not None ]
+                if len(vals) > 0:
+                    merged['categories'][midx][k] = fn(vals)
+
+    def add_general_stats(self, data, headers):
+        """ General Statistics: merged for each module namespace """
+        namespace = None
+        for h in headers.values():
+            namespace = h.get('namespace')
+            break
+        if namespace is None:
+            namespace = 'section_{}'.format(len(self.general_stats))
+        if namespace not in self.general_stats:
+            self.general_stats[namespace] = (OrderedDict(), OrderedDict())
+        m_data, m_headers = self.general_stats[namespace]
+        for k, h in headers.items():
+            if k not in m_headers:
+                m_headers[k] = general_stats_header(h)
+        self.merge_dict(m_data, data)
+
+def general_stats_header(h):
+    """ Clean up a General Statistics header saved in multiqc_data.json, so it can be used again """
+    h = OrderedDict(h)
+    # These are worked out again for the merged table
+    for k in ['rid', 'dmax', 'dmin']:
+        h.pop(k, None)
+    # Functions are saved as their result for 1, so numbers are usually a multiplier
+    if 'modify' in h:
+        multiplier = h['modify']
+        if isinstance(multiplier, (int, float)) and not isinstance(multiplier, bool):
+            h['modify'] = lambda x, m=multiplier: x * m
+        else:
+            h['modify'] = None
+    return h
+
+def merge_reports(paths):
+    """
+    Merge the multiqc_data.json files of existing reports into the report
+    variables, as if the modules had been run.
+    :param paths: list of data files, data directories or report directories
+    :return: list of module objects for report.modules_output
+    """
+    reports = load_reports(paths)
+    if len(reports) == 0:
+        return list()
+    merger = Merger()
+
+    # Find samples that are in more than one report
+    seen = dict()
+    for label, data in reports:
+        for s in report_samples(data):
+            seen.setdefault(s, list()).append(label)
+    duplicates = dict([ (s, labels) for s, labels in seen.items() if len(labels) > 1 ])
+    renames = dict()
+    if len(duplicates) > 0:
+        if merger.rule == 'rename':
+            logger.info("Found {} samples in more than one report, adding the report name to them".format(len(duplicates)))
+            for s, labels in duplicates.items():
+                for label in labels:
+                    renames.setdefault(label, dict())[s] = '{} ({})'.format(s, label)
+        else:
+            logger.warning("Found {} samples in more than one report, using the results from the {} report".format(len(duplicates), merger.rule))
+
+    for label, data in reports:
+        rename_samples(data, renames.get(label, {}))
+        merger.add(data)
+
+    # Report variables used to build the rest of the report
+    for namespace, (data, headers) in merger.general_stats.items():
+        report.general_stats_data.append(data)
+        report.general_stats_headers.append(headers)
+    for mod, sections in merger.data_sources.items():
+        for sec, sources in sections.items():
+            report.data_sources[mod][sec].update(sources)
+    for fn, data in merger.raw_data.items():
+        # Written again when the General Statistics table is made
+        if fn != 'multiqc_general_stats':
+            util_functions.write_data_file(data, fn)
+            report.saved_raw_data[fn] = data
+
+    # Make the report sections, with the merged plots
+    modules_output = list()
+    plotted = set()
+    for m in merger.modules.values():
+        mod = MergedModule(m['name'], report.save_htmlid(m['anchor']), m['intro'], m['comment'])
+        for s in m['sections'].values():
+            plot_html = ''.join([ render_plot(pid, merger.plots[pid]) for pid in s['plot_ids'] if pid in merger.plots and pid not in plotted ])
+            plotted.update(s['plot_ids'])
+            if plot_html == '':
+                logger.debug("Skipping section '{}' as it has no plots to merge".format(s['anchor']))
+                continue
+            mod.sections.append(section(s.get('name'), s['anchor'], s.get('description', ''), s.get('comment', ''), s.get('helptext', ''), plot_html))
+        if len(mod.sections) > 0 or len(m['sections']) == 0:
+            modules_output.append(mod)
+
+    # Plots from reports made before sections were saved
+    other_plots = [ pid for pid in merger.plots if pid not in plotted and pid != 'general_stats_table' ]
+    if len(other_plots) > 0:
+        mod = MergedModule('Other plots', report.save_htmlid('merged_plots'))
+        for pid in other_plots:
+            title = merger.plots[pid].get('config', {}).get('title', pid)
+            mod.sections.append(section(title, '{}_section'.format(pid), '', '', '', render_plot(pid, merger.plots[pid])))
+        modules_output.append(mod)
+
+    return modules_output
+
+def section(name, anchor, description, comment, helptext, plot):
+    """ Section dict, as made by BaseMultiqcModule.add_section() """
+    return {
+        'name': name,
+        'anchor': report.save_htmlid(anchor),
+        'description': description,
+        'comment': comment,
+        'helptext': helptext,
+        'plot': plot,
+        'content': '',
+        'print_section': True
+    }
+
+def render_plot(pid, plot):
+    """ Make the HTML for a merged plot and add its data to the report """
+    ptype = plot.get('plot_type')
+    pconfig = plot.get('config', {})
+    pconfig['id'] = pid
+    if ptype == 'xy_line':
+        return linegraph.highcharts_linegraph(plot['datasets'], pconfig)
+    if ptype == 'bar_graph':
+        return bargraph.highcharts_bargraph(plot['datasets'], plot['samples'], pconfig)
+    if ptype == 'scatter':
+        return scatter.highcharts_scatter_plot(plot['datasets'], pconfig)
+    if ptype == 'heatmap':
+        rows = [ [ None for x in plot['xcats'] ] for y in plot['ycats'] ]
+        for x, y, val in plot['data']:
+            rows[y][x] = val
+        return heatmap.highcharts_heatmap(rows, plot['xcats'], plot['ycats'], pconfig)
+    if ptype == 'beeswarm':
+        pid = report.save_htmlid(pid)
+        report.num_hc_plots += 1
+        report.plot_data[pid] = plot
+        return """<div class="hc-plot-wrapper">
+        <div id="{bid}" class="hc-plot not_rendered hc-beeswarm-plot"><small>loading..</small></div>
+    </div>""".format(bid=pid)
+    logger.warning("Can't merge plot '{}' with unknown type '{}'".format(pid, ptype))
+    return ''
@@ -4,8 +4,6 @@ Helper functions to manipulate colours and colour scales
 """
 
 from __future__ import print_function
-import spectra
-import numpy as np
 import re
 
 # Default logger will be replaced by caller
@@ -49,7 +47,9 @@ class mqc_colour_scale(object):
 			val = max(val, self.minval)
 			val = min(val, self.maxval)
 
-			domain_nums = list( np.linspace(self.minval, self.maxval, len(self.colours)) )
+			# Spectra (and numpy, which it uses) is slow to import, so is only loaded when needed
+			import spectra
+			domain_nums = linspace(self.minval, self.maxval, len(self.colours))
 			my_scale = spectra.scale(self.colours).domain(domain_nums)
 
 			# Weird, I know. I ported this from the original JavaScript for continuity
@@ -144,3 +144,13 @@ class mqc_colour_scale(object):
 			return list(reversed(colorbrewer_scales[name]))
 		else:
 			return colorbrewer_scales[name]
+
+
+def linspace(start, stop, num):
+	""" Evenly spaced numbers from start to stop, as with numpy.linspace() """
+	if num == 1:
+		return [start]
+	step = (stop - start) / float(num - 1)
+	nums = [ start + (i * step) for i in range(num) ]
+	nums[-1] = stop
+	return nums
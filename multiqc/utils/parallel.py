@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+
+""" MultiQC parallel module execution. Runs modules in separate
+worker processes and merges their results back into the report in
+the usual module order, so that the report is the same as if the
+modules had been run one after another. Also used by modules to
+parse their log files in parallel. """
+
+from __future__ import print_function
+from collections import defaultdict
+import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import pickle
+import shutil
+import traceback
+
+from multiqc.utils import config, parse_cache, report, runtime_profile, util_functions
+
+logger = logging.getLogger(__name__)
+
+# Attributes of module objects that are used when building the report
+module_output_attrs = ['name', 'anchor', 'intro', 'comment', 'sections', 'css', 'js']
+
+def run_module(mod_dict):
+    """
+    Load and run a single module.
+    :param mod_dict: dict with the module name as key and the custom module config as value
+    :return: list of module objects
+    """
+    this_module = list(mod_dict.keys())[0]
+    mod_cust_config = list(mod_dict.values())[0]
+    with runtime_profile.stage(this_module, 'module'):
+        mod = config.avail_modules[this_module].load()
+        mod.mod_cust_config = mod_cust_config # feels bad doing this, but seems to work
+        try:
+            output = mod()
+        finally:
+            # Save anything added with BaseMultiqcModule.cache_result()
+            parse_cache.flush()
+    if type(output) != list:
+        output = [output]
+    return output
+
+def fork_context():
+    """ Get a multiprocessing context that starts workers with fork, or None if
+    this isn't possible. Workers need to be forked so that they start with all
+    of the config and search results of the main process. """
+    if os.name == 'nt':
+        return None
+    try:
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 always forks on unix
+        return multiprocessing
+
+def run_modules(run_modules, processes, tmp_dir):
+    """
+    Run modules in a pool of worker processes.
+    :param run_modules: list of module dicts, as given to run_module()
+    :param processes: number of worker processes
+    :param tmp_dir: temporary directory for files written by the workers
+    :return: Yields (mod_dict, ModuleResult) in the order of run_modules
+    """
+    global _run_modules, _tmp_dir
+    ctx = fork_context()
+    if ctx is None:
+        logger.warning("Can't run modules in parallel on this system, running one at a time")
+        for mod_dict in run_modules:
+            yield mod_dict, None
+        return
+
+    logger.info("Running modules using {} processes".format(processes))
+    # Workers are forked and so can see these
+    _run_modules = run_modules
+    _tmp_dir = tmp_dir
+    pool = ctx.Pool(processes)
+    try:
+        results = [ pool.apply_async(_run_module_worker, (idx,)) for idx in range(len(run_modules)) ]
+        pool.close()
+        for idx, mod_dict in enumerate(run_modules):
+            yield mod_dict, ModuleResult(mod_dict, results[idx], os.path.join(tmp_dir, 'module_{}'.format(idx)))
+    finally:
+        pool.terminate()
+        pool.join()
+        _run_modules = None
+
+_run_modules = None
+_tmp_dir = None
+
+def _run_module_worker(idx):
+    """
+    Run a single module in a worker process. Starts with empty report
+    variables, so that only the results of this module are sent back.
+    :return: tuple with a status and details:
+             ('ok', pickled results), ('nosamples', None),
+             ('error', (traceback, last found file)) or ('rerun', reason)
+    """
+    # Write any files to a separate directory, to be moved into place in module order
+    worker_dir = os.path.join(_tmp_dir, 'module_{}'.format(idx))
+    if config.data_dir is not None:
+        config.data_dir = os.path.join(worker_dir, 'data')
+        os.makedirs(config.data_dir)
+    if getattr(config, 'plots_dir', None) is not None:
+        config.plots_dir = os.path.join(worker_dir, 'plots')
+        os.makedirs(config.plots_dir)
+
+    report.general_stats_data = list()
+    report.general_stats_headers = list()
+    report.plot_data = dict()
+    report.data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
+    report.saved_raw_data = dict()
+    report.lint_errors = list()
+    report.num_hc_plots = 0
+    report.num_mpl_plots = 0
+    num_html_ids = len(report.html_ids)
+    num_profile_events = len(runtime_profile.events)
+
+    try:
+        output = run_module(_run_modules[idx])
+    except UserWarning:
+        return ('nosamples', None)
+    except Exception:
+        return ('error', (traceback.format_exc(), report.last_found_file))
+
+    # Anonymous functions can't be sent back, so work out their results now
+    for data, headers in zip(report.general_stats_data, report.general_stats_headers):
+        for k, h in headers.items():
+            if callable(h.get('modify')):
+                h['modify'] = PrecomputedModify(h['modify'], [ s[k] for s in data.values() if k in s ])
+
+    results = {
+        'modules_output': [ ModuleOutput(m) for m in output ],
+        'general_stats_data': report.general_stats_data,
+        'general_stats_headers': report.general_stats_headers,
+        'plot_data': report.plot_data,
+        'data_sources': dict([ (m, dict([ (s, dict(d)) for s, d in ss.items() ])) for m, ss in report.data_sources.items() ]),
+        'saved_raw_data': report.saved_raw_data,
+        'lint_errors': report.lint_errors,
+        'html_ids': report.html_ids[num_html_ids:],
+        'num_hc_plots': report.num_hc_plots,
+        'num_mpl_plots': report.num_mpl_plots,
+        'last_found_file': report.last_found_file,
+        'profile_events': runtime_profile.events[num_profile_events:]
+    }
+    try:
+        return ('ok', pickle.dumps(results, pickle.HIGHEST_PROTOCOL))
+    except Exception as e:
+        return ('rerun', "results could not be sent back from the worker process ({})".format(e))
+
+class ModuleResult(object):
+    """ Results of a module run in a worker process, waiting to be added to the report """
+
+    def __init__(self, mod_dict, async_result, worker_dir):
+        self.mod_dict = mod_dict
+        self.async_result = async_result
+        self.worker_dir = worker_dir
+
+    def merge(self):
+        """
+        Wait for the module to finish and add its results to the report. If the
+        results would be different to running the module in this process
+        (eg. clashing HTML IDs), the module is run again here instead.
+        Raises UserWarning if no samples were found, like the module itself.
+        :return: list of module objects
+        """
+        status, details = self.async_result.get()
+        if status == 'nosamples':
+            raise UserWarning
+        if status == 'error':
+            report.last_found_file = details[1]
+            raise ModuleError(details[0])
+        if status == 'ok':
+            results = pickle.loads(details)
+            clashes = set(results['html_ids']).intersection(report.html_ids)
+            if len(clashes) > 0:
+                status = 'rerun'
+                details = "HTML IDs already used by another module: {}".format(', '.join(sorted(clashes)))
+        if status == 'rerun':
+            logger.debug("Running module '{}' again in main process, as {}".format(list(self.mod_dict.keys())[0], details))
+            shutil.rmtree(self.worker_dir, ignore_errors=True)
+            return run_module(self.mod_dict)
+
+        report.general_stats_data.extend(results['general_stats_data'])
+        report.general_stats_headers.extend(results['general_stats_headers'])
+        report.plot_data.update(results['plot_data'])
+        for m, ss in results['data_sources'].items():
+            for s, d in ss.items():
+                report.data_sources[m][s].update(d)
+        report.saved_raw_data.update(results['saved_raw_data'])
+        report.lint_errors.extend(results['lint_errors'])
+        report.html_ids.extend(results['html_ids'])
+        report.num_hc_plots += results['num_hc_plots']
+        report.num_mpl_plots += results['num_mpl_plots']
+        report.last_found_file = results['last_found_file']
+        runtime_profile.events.extend(results['profile_events'])
+        _move_files(os.path.join(self.worker_dir, 'data'), config.data_dir)
+        _move_files(os.path.join(self.worker_dir, 'plots'), getattr(config, 'plots_dir', None))
+        shutil.rmtree(self.worker_dir, ignore_errors=True)
+        return results['modules_output']
+
+class ModuleError(Exception):
+    """ A module raised an exception in a worker process. The message is the original traceback. """
+    pass
+
+class ModuleOutput(object):
+    """ Copy of the parts of a module object that are needed for the report """
+
+    def __init__(self, mod):
+        for attr in module_output_attrs:
+            if hasattr(mod, attr):
+                setattr(self, attr, getattr(mod, attr))
+
+class PrecomputedModify(object):
+    """
+    Stand-in for a General Statistics 'modify' function, which can't be sent
+    between processes. Holds the results of the function for every value in
+    the column, both as given and converted to a float, plus the value 1 which
+    is used to describe the function when saving the report data as JSON.
+    Other values are returned unchanged.
+    """
+
+    def __init__(self, fn, values):
+        self.results = dict()
+        for val in list(values) + [1]:
+            for v in _modify_inputs(val):
+                if v not in self.results:
+                    try:
+                        self.results[v] = fn(v)
+                    except Exception:
+                        pass
+
+    def __call__(self, val):
+        try:
+            return self.results.get(val, val)
+        except TypeError:
+            return val
+
+def _modify_inputs(val):
+    """ Values that a 'modify' function can be called with by the table code """
+    inputs = [val]
+    try:
+        inputs.append(float(val))
+    except (TypeError, ValueError):
+        pass
+    try:
+        hash(val)
+    except TypeError:
+        inputs = inputs[1:]
+    return inputs
+
+def _move_files(src_dir, dest_dir):
+    """ Move files written by a worker process into place """
+    if dest_dir is None or not os.path.isdir(src_dir):
+        return
+    for root, dirs, files in os.walk(src_dir):
+        dest_root = os.path.join(dest_dir, os.path.relpath(root, src_dir))
+        if not os.path.isdir(dest_root):
+            os.makedirs(dest_root)
+        for fn in files:
+            dest = os.path.join(dest_root, fn)
+            if os.path.exists(dest):
+                os.remove(dest)
+            shutil.move(os.path.join(root, fn), dest)
+
+def parse_files(files, parser_fn, filecontents=True, filehandles=False, workers=1):
+    """
+    Read and parse log files in a pool of worker threads, or processes if
+    config.parse_processes is set. Processes can't be started from inside a
+    module that is already running in a worker process, so threads are used there.
+    :param files: list of file dicts, as given by find_log_files(filecontents=False)
+    :param parser_fn: function called with each file dict, with the contents
+                      or file handle in the 'f' key. Its return value is sent
+                      back, so must be picklable when using processes.
+    :param filecontents: pass the file contents to parser_fn
+    :param filehandles: pass a file handle to parser_fn
+    :param workers: number of files to parse at once. With 1, files are parsed in this thread
+    :return: Yields (f, result) in the order of files. Files that can't be read are skipped
+    """
+    global _parse_job
+    if len(files) == 0:
+        return
+    ctx = None
+    if config.parse_processes and not multiprocessing.current_process().daemon:
+        ctx = fork_context()
+    workers = max(1, min(workers, len(files)))
+    if workers == 1:
+        ctx = None
+        pool = None
+        results = ( _parse_file_worker(idx) for idx in range(len(files)) )
+    elif ctx is not None:
+        pool = ctx.Pool(workers)
+    else:
+        pool = ThreadPool(workers)
+    _parse_job = (files, parser_fn, filecontents, filehandles, ctx is not None)
+    if pool is not None:
+        results = pool.imap(_parse_file_worker, range(len(files)), chunksize=1)
+    try:
+        for idx, (status, details) in enumerate(results):
+            f = files[idx]
+            # Make a note of the filename so that we can report it if something crashes
+            report.last_found_file = os.path.join(f['root'], f['fn'])
+            if status == 'ok':
+                yield f, details
+            elif status == 'readerror':
+                if config.report_readerrors:
+                    logger.debug("Couldn't open filehandle when returning file: {}".format(f['fn']))
+            elif ctx is not None:
+                raise ModuleError(details)
+            else:
+                raise details
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _parse_job = None
+
+_parse_job = None
+
+def _parse_file_worker(idx):
+    """
+    Read and parse a single file in a worker thread or process.
+    :return: tuple with a status and details:
+             ('ok', result), ('readerror', None) or ('error', exception or traceback)
+    """
+    files, parser_fn, filecontents, filehandles, in_process = _parse_job
+    f = dict(files[idx])
+    try:
+        if filehandles or filecontents:
+            try:
+                fh = util_functions.open_found_file(f)
+                if filehandles:
+                    f['f'] = fh
+                else:
+                    with fh:
+                        f['f'] = fh.read()
+            except util_functions.log_read_errors:
+                return ('readerror', None)
+        try:
+            return ('ok', parser_fn(f))
+        finally:
+            if filehandles:
+                f['f'].close()
+    except Exception as e:
+        # Exceptions can't always be sent between processes, so send the traceback
+        if in_process:
+            return ('error', traceback.format_exc())
+        return ('error', e)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+""" MultiQC parse results cache. Saves what modules found in each
+log file, so that re-running MultiQC only needs to parse files that
+are new or have changed since the last run. """
+
+from __future__ import print_function
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from multiqc import config
+from multiqc.utils import search_cache
+logger = config.logger
+
+# Change this if the format of the cached results changes
+cache_format = 1
+
+# Config options that change sample names, which parsers often make
+sample_name_config = [
+    'fn_clean_exts',
+    'fn_clean_trim',
+    'fn_clean_sample_names',
+    'prepend_dirs',
+    'prepend_dirs_depth',
+    'prepend_dirs_sep'
+]
+
+_cache = None
+_source_hashes = dict()
+
+def get_cache():
+    """ The parse results cache for this process, or None if caching is turned off.
+    Module worker processes each open their own connection to the cache. """
+    global _cache
+    if config.no_cache or not config.parse_cache:
+        return None
+    if _cache is None or _cache.pid != os.getpid():
+        _cache = ParseCache()
+    if _cache.db is None:
+        return None
+    return _cache
+
+def flush():
+    """ Save new results, if the cache has been used by this process """
+    if _cache is not None and _cache.pid == os.getpid():
+        _cache.flush()
+
+def file_signature(f):
+    """
+    Describe a found file, so that the cache knows when it changes
+    :param f: file dict, as given by find_log_files()
+    :return: list with the file path, archive member, size and modification
+             time (or checksum, with config.parse_cache_checksum)
+    """
+    path = f['archive'] if f.get('archive') is not None else os.path.join(f['root'], f['fn'])
+    fstat = os.stat(path)
+    if config.parse_cache_checksum:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(1048576), b''):
+                sha1.update(block)
+        changed = sha1.hexdigest()
+    else:
+        changed = fstat.st_mtime
+    return [os.path.abspath(path), f.get('archive_member'), fstat.st_size, changed]
+
+def parser_id(parser_fn):
+    """ Name of a parser function plus a hash of the source file that it is
+    defined in, so that results are not reused after the parser (or anything
+    else in its file that it calls) is changed. functools.partial objects are
+    named after the function that they wrap. """
+    while isinstance(parser_fn, functools.partial):
+        parser_fn = parser_fn.func
+    fn = getattr(parser_fn, '__func__', parser_fn)
+    module = getattr(fn, '__module__', None)
+    name = '{}.{}'.format(module, getattr(fn, '__qualname__', getattr(fn, '__name__', fn)))
+    source_hash = _source_hash(module)
+    if source_hash is None:
+        # No source file to read, eg. a frozen module
+        code = getattr(fn, '__code__', None)
+        if code is not None:
+            source_hash = hashlib.sha1(code.co_code).hexdigest()[:12]
+    if source_hash is not None:
+        name = '{}:{}'.format(name, source_hash)
+    return name
+
+def _source_hash(module_name):
+    """ Hash of the source file of a module, or None if it can't be read """
+    if module_name not in _source_hashes:
+        _source_hashes[module_name] = None
+        fn = getattr(sys.modules.get(module_name), '__file__', None)
+        if fn is not None:
+            # Use the .py file rather than compiled bytecode when possible
+            if fn.endswith(('.pyc', '.pyo')) and os.path.exists(fn[:-1]):
+                fn = fn[:-1]
+            try:
+                with open(fn, 'rb') as fh:
+                    _source_hashes[module_name] = hashlib.sha1(fh.read()).hexdigest()[:12]
+            except (IOError, OSError):
+                pass
+    return _source_hashes[module_name]
+
+def _is_skipped(result):
+    """ True if a parse result is None, or a tuple or list of only None """
+    if isinstance(result, (tuple, list)) and len(result) > 0:
+        return all([ r is None for r in result ])
+    return result is None
+
+class ParseCache(object):
+    """
+    On-disk SQLite cache of parse results. Each result is pickled and saved
+    with a key made from everything that the result depends on: the file (see
+    file_signature()), the module, the parser, the MultiQC version, the sample
+    name config and anything else given by the module. Results that haven't
+    been used recently are removed when the cache is bigger than
+    config.parse_cache_max_size (in megabytes).
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.db = None
+        self.new_results = list()
+        self.used_keys = list()
+        self.num_hits = 0
+        if sqlite3 is None:
+            logger.debug("Python sqlite3 library not available, not using parse results cache")
+            return
+        cache_dir = search_cache.get_cache_dir()
+        cache_fn = os.path.join(cache_dir, 'parse_cache.sqlite')
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.db = sqlite3.connect(cache_fn, timeout=30)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result BLOB, size INTEGER, last_used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self.db.commit()
+        except (sqlite3.Error, IOError, OSError) as e:
+            logger.warning("Could not open parse results cache '{}': {}".format(cache_fn, e))
+            self.db = None
+
+    def key(self, f, module, parser, extra=None):
+        """
+        Make the cache key for a file
+        :param f: file dict, as given by find_log_files()
+        :param module: module object parsing the file
+        :param parser: name of the parser, eg. from parser_id()
+        :param extra: anything else that the result depends on, eg. module config
+        :return: key string, or None if the file can't be found
+        """
+        try:
+            signature = file_signature(f)
+        except (IOError, OSError):
+            return None
+        return hashlib.sha1(json.dumps({
+            'format': cache_format,
+            'version': config.version,
+            'file': signature,
+            'fn': f['fn'],
+            'root': f['root'],
+            's_name': f.get('s_name'),
+            'module': module.anchor,
+            'module_config': getattr(module, 'mod_cust_config', {}),
+            'parser': parser,
+            'sample_name_config': [ getattr(config, c, None) for c in sample_name_config ],
+            'extra': extra
+        }, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        """ Return the cached result for a key, or default if it isn't cached """
+        if self.db is None or key is None:
+            return default
+        try:
+            row = self.db.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.debug("Could not read from parse results cache: {}".format(e))
+            return default
+        if row is None:
+            return default
+        try:
+            result = pickle.loads(bytes(row[0]))
+        except Exception as e:
+            logger.debug("Could not load cached parse result: {}".format(e))
+            return default
+        self.num_hits += 1
+        self.used_keys.append(key)
+        return result
+
+    def add(self, key, result):
+        """ Remember a parse result. Saved on flush(). Results that are None (or
+        only contain None) are not cached, as parsers use them to mean that a
+        file was skipped rather than parsed. """
+        if self.db is None or key is None or _is_skipped(result):
+            return
+        try:
+            data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug("Could not cache parse result: {}".format(e))
+            return
+        self.new_results.append((key, sqlite3.Binary(data), len(data)))
+
+    def flush(self):
+        """ Write new results to disk, then remove the least recently used
+        results if the cache is too big """
+        if self.db is None or (len(self.new_results) == 0 and len(self.used_keys) == 0):
+            return
+        now = time.time()
+        try:
+            self.db.executemany("INSERT OR REPLACE INTO results (key, result, size, last_used) VALUES (?, ?, ?, ?)",
+                [ (key, data, size, now) for key, data, size in self.new_results ])
+            self.db.executemany("UPDATE results SET last_used = ? WHERE key = ?", [ (now, key) for key in self.used_keys ])
+            self.evict()
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Could not save parse results cache: {}".format(e))
+        logger.debug("Parse results cache: {} files unchanged, {} files parsed".format(self.num_hits, len(self.new_results)))
+        self.new_results = list()
+        self.used_keys = list()
+        self.num_hits = 0
+
+    def evict(self):
+        """ Remove the least recently used results until the cache fits in config.parse_cache_max_size """
+        max_size = float(config.parse_cache_max_size) * 1048576
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total_size <= max_size:
+            return
+        removed = 0
+        for key, size in self.db.execute("SELECT key, size FROM results ORDER BY last_used ASC").fetchall():
+            if total_size <= max_size:
+                break
+            self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total_size -= size
+            removed += 1
+        logger.debug("Removed {} old results from the parse results cache".format(removed))
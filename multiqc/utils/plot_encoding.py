@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+""" MultiQC plot data encoding. Line graph series are saved in the report
+as columns of typed numbers instead of lists of [x, y] pairs in JSON text:
+x values are stored once for each plot and shared by all series that
+use them, and numbers are stored as base64 encoded Int32 or Float32 (or
+Float64) arrays. Decoded again by mqc_decode_plot() in multiqc_plotting.js. """
+
+from __future__ import print_function
+import base64
+import logging
+import numbers
+
+from multiqc.utils import config
+
+logger = logging.getLogger(__name__)
+
+# Shorter series are smaller as JSON text
+min_points = 10
+
+# Whole numbers in this range are saved as Int32
+int32_max = 2**31 - 1
+
+# Whole numbers in this range can be saved as Float32 without losing anything
+float32_int_max = 2**24
+
+# Largest number that can be saved as Float32
+float32_max = 3.4e38
+
+def encode_plot_data(plot_data):
+    """
+    Encode the data for all plots, for the report
+    :param plot_data: dict of plot data, keyed by plot ID (see report.plot_data)
+    :return: new dict with the encoded plot data. plot_data is not changed.
+    """
+    if not config.plot_data_typed_arrays:
+        return plot_data
+    return dict([ (pid, encode_plot(plot)) for pid, plot in plot_data.items() ])
+
+def encode_plot(plot):
+    """
+    Encode the data for one plot. Only line graphs are encoded, other plots
+    and any series that aren't all numbers are returned as they are.
+    :param plot: plot data dict, eg. from linegraph.highcharts_linegraph()
+    :return: encoded plot data dict. plot is not changed.
+    """
+    if not config.plot_data_typed_arrays or not isinstance(plot, dict) or plot.get('plot_type') != 'xy_line':
+        return plot
+    encoded = dict(plot)
+    encoded['datasets'] = list()
+    xvals = list()
+    xval_idx = dict()
+    num_encoded = 0
+    for ds in plot.get('datasets', []):
+        encoded_ds = list()
+        for series in ds:
+            encoded_data = encode_series(series.get('data') if isinstance(series, dict) else None)
+            if encoded_data is None:
+                encoded_ds.append(series)
+                continue
+            xs, ys = encoded_data
+            num_encoded += 1
+            encoded_series = dict(series)
+            encoded_series['data'] = { 'y': ys }
+            if xs is not None:
+                # Series with the same x values share them
+                key = (xs['dtype'], xs.get('delta', False), xs['data'])
+                if key not in xval_idx:
+                    xval_idx[key] = len(xvals)
+                    xvals.append(xs)
+                encoded_series['data']['x'] = xval_idx[key]
+            encoded_ds.append(encoded_series)
+        encoded['datasets'].append(encoded_ds)
+    if num_encoded == 0:
+        return plot
+    encoded['xvals'] = xvals
+    return encoded
+
+def encode_series(data):
+    """
+    Encode the data for one line graph series
+    :param data: list of [x, y] pairs, or list of y values for plots with categories
+    :return: (x, y) tuple of encoded arrays (x is None for y values only),
+             or None if the series can't be encoded
+    """
+    if not isinstance(data, list) or len(data) < min_points:
+        return None
+    if all([ isinstance(p, (list, tuple)) and len(p) == 2 for p in data ]):
+        xs = encode_array([ p[0] for p in data ], allow_none=False)
+        ys = encode_array([ p[1] for p in data ])
+        if xs is None or ys is None:
+            return None
+        return xs, ys
+    ys = encode_array(data)
+    if ys is None:
+        return None
+    return None, ys
+
+def encode_array(values, allow_none=True):
+    """
+    Encode a list of numbers as a base64 typed array. Whole numbers are saved
+    as Int32, with delta encoding if that makes the numbers smaller (eg. for
+    x values counting up). Other numbers are saved as Float32, or Float64 if
+    config.plot_data_float32 is False. None and NaN values are saved as NaN.
+    :param values: list of numbers
+    :param allow_none: if False, lists containing None can't be encoded
+    :return: dict with the 'dtype', 'data' and optionally 'delta', or None if
+             the values can't be encoded
+    """
+    for t in set(map(type, values)):
+        if t is not type(None) and (t is bool or not issubclass(t, numbers.Real)):
+            return None
+    # Slow to import, so only imported when first needed
+    import numpy as np
+    arr = np.array(values, dtype=np.float64)
+    nans = np.isnan(arr)
+    has_none = bool(nans.any())
+    if has_none:
+        if not allow_none:
+            return None
+        finite = arr[~nans]
+    else:
+        finite = arr
+    if np.isinf(finite).any():
+        return None
+    max_abs = float(np.abs(finite).max()) if finite.size > 0 else 0
+    whole = bool((finite == np.floor(finite)).all())
+
+    if whole and not has_none and max_abs <= int32_max:
+        ints = arr.astype(np.int64)
+        encoded = { 'dtype': 'int32' }
+        deltas = np.empty_like(ints)
+        deltas[:1] = ints[:1]
+        deltas[1:] = ints[1:] - ints[:-1]
+        max_delta = int(np.abs(deltas).max()) if deltas.size > 0 else 0
+        if max_delta < max_abs and max_delta <= int32_max:
+            ints = deltas
+            encoded['delta'] = True
+        encoded['data'] = _base64_array(ints, '<i4')
+        return encoded
+
+    if config.plot_data_float32 and max_abs <= float32_max and (not whole or max_abs <= float32_int_max):
+        return { 'dtype': 'float32', 'data': _base64_array(arr, '<f4') }
+    return { 'dtype': 'float64', 'data': _base64_array(arr, '<f8') }
+
+def _base64_array(arr, dtype):
+    """ Base64 encoded bytes of a numpy array, as the given type """
+    return base64.b64encode(arr.astype(dtype).tobytes()).decode('ascii')
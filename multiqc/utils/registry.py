@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+""" MultiQC entry point registry. Finds the modules, templates and plugins
+provided by installed packages and caches the results on disk, so that the
+installed packages don't need to be scanned every time that MultiQC starts.
+Entry points are only imported when they are used. """
+
+from __future__ import print_function
+from collections import OrderedDict
+import hashlib
+import importlib
+import json
+import os
+import re
+import sys
+import tempfile
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:
+    try:
+        import importlib_metadata
+    except ImportError:
+        importlib_metadata = None
+
+# Entry point groups that MultiQC uses. Others are not cached.
+entry_point_groups = [
+    'multiqc.modules.v1',
+    'multiqc.templates.v1',
+    'multiqc.hooks.v1',
+    'multiqc.cli_options.v1'
+]
+
+# Change this if the format of the cache file changes
+cache_format = 1
+
+_registry = None
+
+class LazyEntryPoint(object):
+    """ An entry point that is only imported when load() is called.
+    Used in place of pkg_resources.EntryPoint objects. """
+
+    def __init__(self, name, value, dist=None):
+        """
+        :param name: entry point name, eg. 'fastqc'
+        :param value: object reference, eg. 'multiqc.modules.fastqc:MultiqcModule'
+        :param dist: name of the distribution that provides the entry point
+        """
+        self.name = name
+        self.value = value
+        self.dist = dist
+        self._loaded = False
+        self._obj = None
+
+    def load(self):
+        """ Import the entry point (only the first time) and return the object """
+        if not self._loaded:
+            module_name, _, attrs = self.value.partition(':')
+            obj = importlib.import_module(module_name.strip())
+            # Drop any extras, eg. 'module:attr [extra]'
+            attrs = attrs.split('[')[0].strip()
+            if attrs:
+                for attr in attrs.split('.'):
+                    obj = getattr(obj, attr)
+            self._obj = obj
+            self._loaded = True
+        return self._obj
+
+    def __str__(self):
+        return '{} = {}'.format(self.name, self.value)
+
+    def __repr__(self):
+        return 'LazyEntryPoint({})'.format(self)
+
+def get_entry_points(group):
+    """
+    Get the entry points for a group, in the order that they were found.
+    :param group: entry point group name, eg. 'multiqc.modules.v1'
+    :return: list of LazyEntryPoint objects
+    """
+    return _get_registry()['entry_points'][group]
+
+def get_version():
+    """ Installed version of MultiQC. When it isn't installed (eg. run from a
+    source checkout on the PYTHONPATH), the version is read from setup.py """
+    return _get_registry()['version'] or _source_version() or 'unknown'
+
+def _source_version():
+    """ Version in the setup.py next to the multiqc package, or None if there isn't one """
+    setup_fn = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'setup.py')
+    try:
+        with open(setup_fn) as fh:
+            match = re.search(r'^version\s*=\s*[\'"]([^\'"]+)[\'"]', fh.read(), re.MULTILINE)
+    except (IOError, OSError):
+        return None
+    return match.group(1) if match else None
+
+def _get_registry():
+    """ Load the registry from the cache, or scan installed packages if the cache is out of date """
+    global _registry
+    if _registry is None:
+        cache_fn = user_cache_path('entry_points_{}.json')
+        cached = _read_cache(cache_fn)
+        if cached is None:
+            cached = _scan()
+            # Packages are just scanned again next time if this fails
+            write_cache_file(cache_fn, json.dumps(cached).encode('utf-8'))
+        _registry = {
+            'version': cached['version'],
+            'entry_points': OrderedDict([
+                (group, [ LazyEntryPoint(*ep) for ep in cached['entry_points'].get(group, []) ])
+                for group in entry_point_groups
+            ])
+        }
+    return _registry
+
+def user_cache_path(fn):
+    """ Path to a file in the MultiQC user cache directory. Separate files are
+    used for each Python installation so that different environments don't clash.
+    :param fn: file name, eg. 'entry_points_{}.json'. Any {} is replaced with the environment ID
+    """
+    if os.name == 'nt':
+        cache_dir = os.environ.get('LOCALAPPDATA', tempfile.gettempdir())
+    else:
+        cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    env_id = hashlib.sha1('{} {}'.format(sys.prefix, sys.version).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, 'multiqc', fn.format(env_id))
+
+def write_cache_file(cache_fn, data):
+    """
+    Save a file in the user cache directory. Failures are ignored, as cached
+    files can always be made again next time.
+    :param cache_fn: path to the file, from user_cache_path()
+    :param data: file contents, as bytes
+    """
+    try:
+        if not os.path.isdir(os.path.dirname(cache_fn)):
+            os.makedirs(os.path.dirname(cache_fn))
+        # Write to a temporary file first, so that other MultiQC runs never see half a file
+        tmp_fn = '{}.{}.tmp'.format(cache_fn, os.getpid())
+        with open(tmp_fn, 'wb') as fh:
+            fh.write(data)
+        # os.rename() can't replace files on Windows, os.replace() is Python 3 only
+        getattr(os, 'replace', os.rename)(tmp_fn, cache_fn)
+    except (IOError, OSError):
+        pass
+
+def _signature(files):
+    """ Modification times of everything that changes when packages are installed
+    or removed: the directories on the Python path and the entry point files read """
+    stamps = []
+    for path in [ p for p in sys.path if p != '' ] + list(files):
+        try:
+            stamps.append([path, os.stat(path).st_mtime])
+        except OSError:
+            stamps.append([path, None])
+    return stamps
+
+def _read_cache(cache_fn):
+    """ Return the cached registry, or None if it is missing or out of date """
+    try:
+        with open(cache_fn) as fh:
+            cached = json.load(fh)
+        if cached.get('format') != cache_format:
+            return None
+        if cached.get('signature') != _signature(cached.get('files', [])):
+            return None
+        if len(cached['entry_points'].get('multiqc.modules.v1', [])) == 0:
+            return None
+        return cached
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        return None
+
+def _scan():
+    """ Find entry points and the MultiQC version in the installed packages """
+    if importlib_metadata is not None:
+        entry_points, files, version = _scan_importlib_metadata()
+    else:
+        entry_points, files, version = _scan_pkg_resources()
+    return {
+        'format': cache_format,
+        'version': version,
+        'entry_points': entry_points,
+        'files': files,
+        'signature': _signature(files)
+    }
+
+def _scan_importlib_metadata():
+    """ Scan installed packages with importlib.metadata """
+    entry_points = dict([ (group, []) for group in entry_point_groups ])
+    files = []
+    version = None
+    seen = set()
+    for dist in importlib_metadata.distributions():
+        name = dist.metadata['Name']
+        if name is None:
+            continue
+        # Only the first copy of a package on the path is used, as with pkg_resources
+        key = re.sub(r'[-_.]+', '-', name).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        if key == 'multiqc':
+            version = dist.version
+        found = False
+        for ep in dist.entry_points:
+            if ep.group in entry_points:
+                entry_points[ep.group].append([ep.name, ep.value, name])
+                found = True
+        # Remember the metadata files so that the cache notices when they change
+        dist_path = getattr(dist, '_path', None)
+        if (found or key == 'multiqc') and dist_path is not None:
+            files.append(str(dist_path))
+            files.append(os.path.join(str(dist_path), 'entry_points.txt'))
+    return entry_points, files, version
+
+def _scan_pkg_resources():
+    """ Scan installed packages with pkg_resources, for Python versions without importlib.metadata """
+    import pkg_resources
+    entry_points = dict([ (group, []) for group in entry_point_groups ])
+    files = []
+    for group in entry_point_groups:
+        for ep in pkg_resources.iter_entry_points(group):
+            value = ep.module_name
+            if ep.attrs:
+                value = '{}:{}'.format(value, '.'.join(ep.attrs))
+            entry_points[group].append([ep.name, value, ep.dist.project_name])
+            egg_info = getattr(ep.dist, 'egg_info', None)
+            if egg_info is not None and egg_info not in files:
+                files.extend([egg_info, os.path.join(egg_info, 'entry_points.txt')])
+    try:
+        version = pkg_resources.get_distribution('multiqc').version
+    except pkg_resources.DistributionNotFound:
+        version = None
+    return entry_points, files, version
@@ -5,19 +5,44 @@ module. Is available to subsequent modules. Contains
 helper functions to generate markup for report. """
 
 from __future__ import print_function
+import base64
 from collections import defaultdict, OrderedDict
 import click
 import fnmatch
 import io
 import json
 import inspect
-import lzstring
 import mimetypes
+from multiprocessing.pool import ThreadPool
 import os
 import re
+import stat
+import sys
+import tarfile
+import time
 import yaml
+import zipfile
+import zlib
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 from multiqc import config
+from multiqc.utils import plot_encoding, util_functions
+from multiqc.utils.search_cache import SearchCache
+from multiqc.utils.search_profile import SearchProfile
 logger = config.logger
 
 # Treat defaultdict and OrderedDict as normal dicts for YAML output
@@ -29,28 +54,891 @@ try:
 except NameError:
     pass # Python 3
 
-# Set up global variables shared across modules
-general_stats_data = list()
-general_stats_headers = list()
-general_stats_html = ''
-data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
-plot_data = dict()
-html_ids = list()
-lint_errors = list()
-num_hc_plots = 0
-num_mpl_plots = 0
-saved_raw_data = dict()
-last_found_file = None
-
-# Make a dict of discovered files for each seach key
-searchfiles = list()
-files = dict()
+# Global variables shared across modules, set up by init()
+report_vars = [
+    'general_stats_data', 'general_stats_headers', 'general_stats_html', 'data_sources',
+    'plot_data', 'html_ids', 'lint_errors', 'num_hc_plots', 'num_mpl_plots', 'saved_raw_data',
+    'last_found_file', 'searchfiles', 'files', 'file_aliases', 'modules_output',
+    'plot_compressed_json', 'plot_data_files', 'multiqc_command'
+]
+
+def init():
+    """ Set up the report variables. Called when this module is first imported and
+    again at the end of each run, so that MultiQC can be run more than once in the
+    same process. """
+    global general_stats_data, general_stats_headers, general_stats_html, data_sources, \
+        plot_data, html_ids, lint_errors, num_hc_plots, num_mpl_plots, saved_raw_data, \
+        last_found_file, searchfiles, files, file_aliases, modules_output, \
+        plot_compressed_json, plot_data_files, multiqc_command
+    general_stats_data = list()
+    general_stats_headers = list()
+    general_stats_html = ''
+    data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
+    plot_data = dict()
+    html_ids = list()
+    lint_errors = list()
+    num_hc_plots = 0
+    num_mpl_plots = 0
+    saved_raw_data = dict()
+    last_found_file = None
+
+    # Make a dict of discovered files for each seach key
+    searchfiles = list()
+    files = dict()
+    # Other paths for files and directories that were found more than once
+    file_aliases = dict()
+
+    # Set by the main MultiQC run, for the report template
+    modules_output = list()
+    plot_compressed_json = ''
+    plot_data_files = dict()
+    multiqc_command = ''
+
+init()
+
+class Report(object):
+    """ The report variables at the end of a run (see init()), returned
+    by multiqc.run() after the report module has been set up again """
+
+    def __init__(self):
+        for k in report_vars:
+            setattr(self, k, globals()[k])
+
 def get_filelist(run_module_names):
     """
     Go through all supplied search directories and assembly a master
     list of files to search. Then fire search functions for each file.
     """
-    # Prep search patterns
+    # Prep search patterns and the file name and contents searches
+    search_rules = get_search_rules(run_module_names)
+    rule_keys = set([ key for key, sps in search_rules ])
+    for key in config.sp.keys():
+        if key in rule_keys:
+            files[key] = list()
+    filename_search, contents_search, exclude_rules = search_indexes(search_rules)
+
+    def add_file(fn, root, filesize=None, mtime=None, checked=False, only_keys=None):
+        """
+        Function applied to each file found when walking the analysis
+        directories. Runs through all search patterns and returns True
+        if a match is found. Files found by walk_dir() have already been
+        checked and come with their size, so no further stat calls are made.
+        :param checked: Skip checking the file on disk, even without a size
+        :param only_keys: Only search for these search pattern keys
+        """
+        f = {'fn': fn, 'root': root}
+        is_archive = config.search_archives and util_functions.is_archive(fn)
+        if only_keys is not None:
+            # Results of a partial search can't be cached
+            mtime = None
+
+        if filesize is None and not checked:
+            # Check that this is a file and not a pipe or anything weird
+            if not os.path.isfile(os.path.join(root, fn)):
+                return None
+
+            # Check that we don't want to ignore this file
+            if _ignore_file(fn):
+                logger.debug("Ignoring file as matched an ignore pattern: {}".format(fn))
+                return None
+
+            try:
+                fstat = os.stat(os.path.join(root,fn))
+                filesize = fstat.st_size
+                mtime = fstat.st_mtime
+            except (IOError, OSError, ValueError, UnicodeDecodeError):
+                logger.debug("Couldn't read file when checking filesize: {}".format(fn))
+
+        # Limit search to small files, to avoid 30GB FastQ files etc.
+        # Archives can be bigger, as only their members need to be small.
+        if filesize is not None:
+            f['filesize'] = filesize
+            if f['filesize'] > config.log_filesize_limit and not is_archive:
+                return False
+
+        # Use previous search results if the file hasn't changed
+        abs_path = os.path.abspath(os.path.join(root, fn))
+        cached_keys = search_cache.get(abs_path, filesize, mtime) if search_cache else None
+        if cached_keys is not None:
+            for key in cached_keys:
+                # Files found inside archives are saved as [key, member, size, offset]
+                if isinstance(key, list):
+                    files[key[0]].append(_archive_member_f(os.path.join(root, fn), *key[1:]))
+                else:
+                    files[key].append(f)
+            return
+
+        found_keys = list()
+        if f.get('filesize', 0) <= config.log_filesize_limit:
+            found_keys = search_f(f, only_keys=only_keys)
+
+        # Look inside archives that aren't log files themselves
+        if len(found_keys) == 0 and is_archive:
+            found_keys = search_archive(os.path.join(root, fn))
+
+        if search_cache:
+            search_cache.add(abs_path, filesize, mtime, found_keys)
+
+    def search_f(f, opener=None, only_keys=None):
+        """
+        Test a single file against all search patterns and add it to the
+        list of files for each module that it is found for.
+        :param opener: function to open the file as text, if it isn't on disk
+        :param only_keys: Only search for these search pattern keys
+        :return: list of the search pattern keys found
+        """
+        found_keys = list()
+
+        # Use mimetypes to exclude binary files where possible
+        if not _search_file_type(f):
+            return found_keys
+
+        # Test the file name for each search pattern, noting which need the contents
+        # searching. Stop early if we find a match that can't be shared with other modules.
+        # When profiling, each file name pattern is tested separately so that it can be timed.
+        fn_matches = filename_search.search(f['fn']) if profile is None else None
+        if fn_matches is not None and util_functions.strip_compression_ext(f['fn']) != f['fn']:
+            fn_matches.update(filename_search.search(util_functions.strip_compression_ext(f['fn'])))
+        fn_results = dict()
+        search_contents = set()
+        for key, sps in search_rules:
+            if only_keys is not None and key not in only_keys:
+                continue
+            if profile is not None:
+                start = time.time()
+            fn_matched = False
+            for idx, sp in enumerate(sps):
+                fn_results[(key, idx)] = _search_fn(sp, f, None if fn_matches is None else (key, idx) in fn_matches)
+                if fn_results[(key, idx)] is None:
+                    search_contents.add(contents_search.index[(key, idx)])
+                elif fn_results[(key, idx)] is True:
+                    fn_matched = True
+                    break
+            if profile is not None:
+                profile.add(key, files_tested=1, time=time.time() - start)
+            if fn_matched and not sp.get('shared', False):
+                break
+
+        # Search the file contents for all remaining patterns in a single pass.
+        # Lines that are read are kept so that exclusion patterns can use them.
+        lines = FileLines(f, opener)
+        try:
+            contents_matched = contents_search.search(lines, search_contents, profile)
+
+            # Go through the results in order of search pattern priority
+            for key, sps in search_rules:
+                if only_keys is not None and key not in only_keys:
+                    continue
+                for idx, sp in enumerate(sps):
+                    matched = fn_results.get((key, idx))
+                    if matched is None:
+                        matched = contents_search.index.get((key, idx)) in contents_matched
+                    # Don't look at other patterns for this module
+                    if matched:
+                        break
+                else:
+                    continue
+                # Check that we shouldn't exclude this file
+                if profile is not None:
+                    start = time.time()
+                excluded = exclude_file(sp, f, exclude_rules[(key, idx)], lines)
+                if profile is not None:
+                    profile.add(key, matches=0 if excluded else 1, time=time.time() - start)
+                if not excluded:
+                    # Looks good! Remember this file
+                    files[key].append(f)
+                    found_keys.append(key)
+                # Don't keep searching this file for other modules
+                if not sp.get('shared', False):
+                    break
+        finally:
+            lines.close()
+        return found_keys
+
+    def search_archive(path):
+        """
+        Search the members of a tar or zip archive without extracting it.
+        Tar archives are read in a single pass from start to finish, zip
+        archives are read using their index of members.
+        :return: list of [key, member, size, offset] for each match, to save in the search cache
+        """
+        found = list()
+        try:
+            if util_functions.is_tar(path):
+                with tarfile.open(path, 'r:*') as tar:
+                    for info in tar:
+                        if info.isfile() and not info.issparse():
+                            f = _archive_member_f(path, info.name, info.size, info.offset_data)
+                            opener = lambda info=info: util_functions.open_member_stream(tar.extractfile(info), info.name)
+                            found.extend(search_archive_member(f, opener))
+            else:
+                with zipfile.ZipFile(path) as zf:
+                    for info in zf.infolist():
+                        if not info.filename.endswith('/'):
+                            f = _archive_member_f(path, info.filename, info.file_size)
+                            opener = lambda info=info: util_functions.open_member_stream(zf.open(info), info.filename)
+                            found.extend(search_archive_member(f, opener))
+        except util_functions.log_read_errors as e:
+            logger.debug("Couldn't read archive when looking for output: {} ({})".format(path, e))
+        return found
+
+    def search_archive_member(f, opener):
+        """ Search a single member of an archive, as long as it isn't ignored or too big """
+        member_dirs = os.path.dirname(f['archive_member']).split('/')
+        if any([fnmatch.fnmatch(d, n.rstrip(os.sep)) for d in member_dirs for n in config.fn_ignore_dirs]):
+            return []
+        if _ignore_file(f['fn']) or f['filesize'] > config.log_filesize_limit:
+            return []
+        return [ [key, f['archive_member'], f['filesize'], f.get('archive_offset')] for key in search_f(f, opener) ]
+
+    def add_manifest(path):
+        """
+        Add the files listed in a manifest, without walking any directories.
+        Files listed with a search pattern key are added for that key directly.
+        Other files are searched as usual, only looking at the search patterns
+        for the module if a module name is given.
+        """
+        active_keys = [ key for key, sps in search_rules ]
+        num_files = 0
+        for fn, root, filesize, sp_key in _read_manifest(path):
+            num_files += 1
+            mtime = None
+            if not config.manifest_trust_metadata:
+                try:
+                    fstat = os.stat(os.path.join(root, fn))
+                except (IOError, OSError):
+                    logger.warning("Couldn't find file listed in manifest: {}".format(os.path.join(root, fn)))
+                    continue
+                if not stat.S_ISREG(fstat.st_mode):
+                    continue
+                filesize = fstat.st_size
+                mtime = fstat.st_mtime
+            if sp_key is None:
+                add_file(fn, root, filesize, mtime, checked=True)
+                continue
+            only_keys = set([ key for key in active_keys if key == sp_key or key.startswith('{}/'.format(sp_key)) ])
+            if only_keys == set([sp_key]):
+                f = {'fn': fn, 'root': root}
+                if filesize is not None:
+                    f['filesize'] = filesize
+                files[sp_key].append(f)
+            elif len(only_keys) > 0:
+                add_file(fn, root, filesize, mtime, checked=True, only_keys=only_keys)
+            else:
+                logger.debug("Skipping file in manifest as '{}' isn't being run: {}".format(sp_key, fn))
+        logger.info("Added {} files from manifest".format(num_files))
+
+    # Go through the analysis directories and get file list
+    # Files and directories are only used once, however many paths lead to them
+    file_aliases.clear()
+    seen = dict()
+    for path in config.analysis_dir:
+        if os.path.islink(path) and config.ignore_symlinks:
+            continue
+        elif os.path.isfile(path):
+            dev_ino = _dev_ino(path)
+            if dev_ino is not None and dev_ino in seen:
+                _add_alias(seen[dev_ino], path)
+                continue
+            seen[dev_ino] = path
+            searchfiles.append([os.path.basename(path), os.path.dirname(path)])
+        elif os.path.isdir(path):
+            # Skip the analysis directory itself if it matches ignore params
+            bname = os.path.basename(path.rstrip(os.sep))
+            if any([fnmatch.fnmatch(bname, n.rstrip(os.sep)) for n in config.fn_ignore_dirs]):
+                logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(bname))
+                continue
+            if any([fnmatch.fnmatch(path, n.rstrip(os.sep)) for n in config.fn_ignore_paths]):
+                logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(path))
+                continue
+            searchfiles.extend(walk_dir(path, seen))
+    searchfiles[:] = _skip_compressed_copies(searchfiles)
+
+    # Search through collected files
+    search_cache = None
+    profile = None
+    if config.filesearch_profile:
+        logger.info("Profiling file search, not using file search cache")
+        profile = SearchProfile()
+    elif not config.no_cache:
+        search_cache = SearchCache(dict(search_rules))
+    try:
+        # Keep the progress bar out of the report if it's being printed to stdout
+        progress_fh = sys.stderr if getattr(config, 'output_fn', None) is sys.stdout else None
+        with click.progressbar(searchfiles, label="Searching {} files..".format(len(searchfiles)), file=progress_fh) as sfiles:
+            for sf in sfiles:
+                add_file(*sf)
+        if config.manifest is not None:
+            add_manifest(config.manifest)
+    finally:
+        if search_cache:
+            search_cache.close()
+    if profile is not None:
+        profile.write()
+
+def _skip_compressed_copies(sfiles):
+    """ Drop compressed log files that were found next to their uncompressed
+    version (eg. 'x.txt.gz' next to 'x.txt'), so that the same log isn't used twice
+    :param sfiles: list of [fn, root, ...] for each file found
+    :return: list without the compressed copies
+    """
+    found = set([ (sf[1], sf[0]) for sf in sfiles ])
+    kept = list()
+    for sf in sfiles:
+        fn = util_functions.strip_compression_ext(sf[0])
+        if fn != sf[0] and (sf[1], fn) in found:
+            logger.debug("Ignoring file as the uncompressed version was also found: {}".format(os.path.join(sf[1], sf[0])))
+            continue
+        kept.append(sf)
+    return kept
+
+def _read_manifest(path):
+    """
+    Read a manifest of files to use instead of searching directories.
+    Each line has a file path, optionally followed by the file size and a
+    search pattern key or module name. Lines can be tab-separated or JSON
+    objects with 'path', 'filesize' and 'sp_key' keys. Blank lines and
+    lines starting with # are skipped. Use - as the path to read from stdin.
+    The manifest is read one line at a time, so it can be very long.
+    :return: Yields (fn, root, filesize, sp_key) for each file. Missing values are None.
+    """
+    fh = sys.stdin if path == '-' else io.open(path, 'r', encoding='utf-8')
+    try:
+        for n, line in enumerate(fh, 1):
+            line = line.rstrip('\r\n')
+            if line.strip() == '' or line.startswith('#'):
+                continue
+            try:
+                if line.lstrip().startswith('{'):
+                    entry = json.loads(line)
+                    fpath = entry['path']
+                    filesize = entry.get('filesize')
+                    sp_key = entry.get('sp_key')
+                else:
+                    cols = line.split('\t')
+                    if n == 1 and cols[0] == 'path':
+                        continue # Header row
+                    fpath = cols[0]
+                    filesize = cols[1] if len(cols) > 1 and cols[1] not in ['', '-', 'NA'] else None
+                    sp_key = cols[2] if len(cols) > 2 and cols[2] != '' else None
+                if filesize is not None:
+                    filesize = int(filesize)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                logger.warning("Couldn't read line {} of manifest '{}': {}".format(n, path, e))
+                continue
+            yield os.path.basename(fpath), os.path.dirname(fpath), filesize, sp_key
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+def walk_dir(path, seen=None):
+    """
+    Walk a directory tree and return a list of [fn, root, filesize, mtime] for
+    every regular file that it contains, skipping anything matching the
+    fn_ignore_dirs, fn_ignore_paths and fn_ignore_files config options.
+
+    Directories are listed with os.scandir in a pool of
+    config.filesearch_threads worker threads, so that slow network
+    filesystems can have many metadata requests in flight at once. Each
+    level of the tree is listed in parallel before moving on to the next.
+    Results are always returned in the same order (sorted by name, depth-first),
+    regardless of the number of threads used.
+
+    Directories and files are identified by their device and inode, so
+    anything reached through more than one path (symlinks, hard links) is
+    only returned once and symlink loops are not followed. The other paths
+    are saved in file_aliases. Where a directory can be reached by
+    several paths, the shallowest is used.
+    :param seen: dict of (st_dev, st_ino): path for everything found so far,
+                 to skip duplicates across several calls
+    """
+    if seen is None:
+        seen = dict()
+    num_threads = max(1, int(config.filesearch_threads or 1))
+    pool = ThreadPool(num_threads) if num_threads > 1 else None
+    listings = dict()
+    try:
+        dev_ino = _dev_ino(path)
+        if dev_ino in seen:
+            _add_alias(seen[dev_ino], path)
+            return list()
+        seen[dev_ino] = path
+        level = [path]
+        while len(level) > 0:
+            results = pool.map(_scan_dir, level) if pool is not None else [_scan_dir(d) for d in level]
+            # Go through the results in order so that the same paths are always kept
+            level = list()
+            for root, subdirs, files in results:
+                keep_subdirs = list()
+                for d, dev_ino in subdirs:
+                    if dev_ino is not None and dev_ino in seen:
+                        logger.debug("Skipping directory as already found at '{}': {}".format(seen[dev_ino], d))
+                        _add_alias(seen[dev_ino], d)
+                        continue
+                    if dev_ino is not None:
+                        seen[dev_ino] = d
+                    keep_subdirs.append(d)
+                listings[root] = (keep_subdirs, files)
+                level.extend(keep_subdirs)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Put the file lists back together in a deterministic, depth-first order
+    filelist = list()
+    stack = [path]
+    while len(stack) > 0:
+        root = stack.pop()
+        subdirs, files = listings[root]
+        for fn, froot, filesize, mtime, dev_ino in files:
+            if dev_ino is not None:
+                if dev_ino in seen:
+                    logger.debug("Skipping file as already found at '{}': {}".format(seen[dev_ino], os.path.join(froot, fn)))
+                    _add_alias(seen[dev_ino], os.path.join(froot, fn))
+                    continue
+                seen[dev_ino] = os.path.join(froot, fn)
+            filelist.append([fn, froot, filesize, mtime])
+        stack.extend(reversed(subdirs))
+    return filelist
+
+def _scan_dir(root):
+    """
+    List a single directory for walk_dir(). Returns a tuple with the
+    directory path, a list of (path, (st_dev, st_ino)) for the sub-directories
+    to descend into and a list of [fn, root, filesize, mtime, (st_dev, st_ino)]
+    for the files. Uses the stat info cached by os.scandir where possible
+    instead of making extra stat calls.
+    Never raises, as this is run in worker threads.
+    """
+    subdirs = list()
+    files = list()
+    try:
+        entries = sorted(_scandir(root), key=lambda e: e.name)
+    except Exception as e:
+        logger.debug("Couldn't list directory '{}': {}".format(root, e))
+        entries = []
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                # Don't follow symlinked directories if asked not to
+                if config.ignore_symlinks and entry.is_symlink():
+                    continue
+                # Skip any sub-directories matching ignore params
+                if any([fnmatch.fnmatch(entry.name, n.rstrip(os.sep)) for n in config.fn_ignore_dirs]):
+                    logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(entry.path))
+                    continue
+                if any([fnmatch.fnmatch(entry.path, n.rstrip(os.sep)) for n in config.fn_ignore_paths]):
+                    logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(entry.path))
+                    continue
+                try:
+                    dstat = entry.stat()
+                    subdirs.append((entry.path, (dstat.st_dev, dstat.st_ino)))
+                except (IOError, OSError):
+                    subdirs.append((entry.path, None))
+            # Check that this is a file and not a pipe or anything weird
+            elif entry.is_file():
+                # Check that we don't want to ignore this file
+                if _ignore_file(entry.name):
+                    logger.debug("Ignoring file as matched an ignore pattern: {}".format(entry.name))
+                    continue
+                try:
+                    fstat = entry.stat()
+                    files.append([entry.name, root, fstat.st_size, fstat.st_mtime, (fstat.st_dev, fstat.st_ino)])
+                except (IOError, OSError):
+                    logger.debug("Couldn't read file when checking filesize: {}".format(entry.name))
+                    files.append([entry.name, root, None, None, None])
+        except Exception as e:
+            logger.debug("Couldn't check path '{}': {}".format(entry.path, e))
+    return root, subdirs, files
+
+def _dev_ino(path):
+    """ Get the (st_dev, st_ino) that identify a file or directory, or None if it can't be read """
+    try:
+        pstat = os.stat(path)
+        return (pstat.st_dev, pstat.st_ino)
+    except (IOError, OSError):
+        return None
+
+def _add_alias(path, alias):
+    """ Remember that a file or directory was also found at another path """
+    file_aliases.setdefault(os.path.abspath(path), list()).append(os.path.abspath(alias))
+
+def get_aliases(path):
+    """
+    Get the other paths that a file was found at, including paths
+    through aliases of the directories that it is in.
+    """
+    aliases = list(file_aliases.get(path, []))
+    parent = os.path.dirname(path)
+    while parent and parent != os.path.dirname(parent):
+        for a in file_aliases.get(parent, []):
+            aliases.append(a + path[len(parent):])
+        parent = os.path.dirname(parent)
+    return aliases
+
+def _archive_member_f(archive, member, filesize, offset=None):
+    """ Make the file dict for a file found inside a tar or zip archive.
+    The root directory is the archive path plus any directories within it. """
+    f = {
+        'fn': os.path.basename(member),
+        'root': os.path.join(archive, os.path.dirname(member)).rstrip(os.sep),
+        'filesize': filesize,
+        'archive': archive,
+        'archive_member': member
+    }
+    if offset is not None:
+        f['archive_offset'] = offset
+    return f
+
+def _ignore_file(fn):
+    """ Check a file name against the fn_ignore_files config option.
+    Compressed files are also checked without their compression extension. """
+    fns = set([fn, util_functions.strip_compression_ext(fn)])
+    return any([fnmatch.fnmatch(n, pat) for n in fns for pat in config.fn_ignore_files])
+
+class _DirEntry(object):
+    """ Minimal stand-in for os.DirEntry, for Python versions without os.scandir """
+    def __init__(self, root, name):
+        self.name = name
+        self.path = os.path.join(root, name)
+    def is_dir(self):
+        return os.path.isdir(self.path)
+    def is_file(self):
+        return os.path.isfile(self.path)
+    def is_symlink(self):
+        return os.path.islink(self.path)
+    def stat(self):
+        return os.stat(self.path)
+
+def _scandir(root):
+    if scandir is not None:
+        return scandir(root)
+    return [_DirEntry(root, name) for name in os.listdir(root)]
+
+def search_file (pattern, f):
+    """
+    Function to searach a single file for a single search pattern.
+    """
+    if not _search_file_type(f):
+        return False
+    matched = _search_fn(pattern, f)
+    if matched is None:
+        contents_search = ContentSearch([(None, [pattern])])
+        lines = FileLines(f)
+        try:
+            matched = len(contents_search.search(lines, [0])) > 0
+        finally:
+            lines.close()
+    return matched
+
+def _search_file_type(f):
+    """
+    Use mimetypes to exclude binary files where possible.
+    Returns False if the file should not be searched at all.
+    """
+    (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
+    if encoding is not None and util_functions.strip_compression_ext(f['fn']) == f['fn']:
+        return False
+    # Tar archives are searched member by member, not as text
+    if ftype == 'application/x-tar':
+        return False
+    if ftype is not None and ftype.startswith('image'):
+        return False
+    return True
+
+def _search_fn(pattern, f, fn_matched=None):
+    """
+    Check the parts of a search pattern that don't need the file to be opened.
+    Returns True or False if this settles whether the file matches, or None
+    if the file contents also need to be searched.
+    :param fn_matched: Result of the file name search, if already known
+                       (see FilenameSearch). Checked here if not supplied.
+    """
+
+    # Search pattern specific filesize limit
+    if pattern.get('max_filesize') is not None and 'filesize' in f:
+        if f['filesize'] > pattern.get('max_filesize'):
+            return False
+
+    # Search by file name (glob or regex)
+    # Compressed files can match with or without their compression extension
+    if pattern.get('fn') is None and pattern.get('fn_re') is None:
+        fn_matched = None
+    elif fn_matched is None:
+        fn_matched = False
+        for fn in set([f['fn'], util_functions.strip_compression_ext(f['fn'])]):
+            if pattern.get('fn') is not None and fnmatch.fnmatch(fn, pattern['fn']):
+                fn_matched = True
+            if pattern.get('fn_re') is not None and re.match(pattern['fn_re'], fn):
+                fn_matched = True
+
+    # No need to look inside the file if we only have a file name pattern
+    if pattern.get('contents') is None and pattern.get('contents_re') is None:
+        return fn_matched is True
+    if fn_matched is False:
+        return False
+    return None
+
+class FilenameSearch(object):
+    """
+    Index of the file name search patterns (fn and fn_re), so that each file name
+    can be checked against all of them without looping through every pattern.
+
+    Glob patterns without wildcards are looked up in a hash table, patterns that
+    are a wildcard followed by a fixed ending (eg. '*.log') or a fixed start
+    followed by a wildcard (eg. 'short_summary_*') are looked up by their
+    ending / start. Anything else is first checked with a single combined regex,
+    and only tested individually if that matches.
+    """
+
+    def __init__(self, search_rules):
+        """
+        :param search_rules: list of (sp key, list of search patterns) tuples
+        """
+        self.exact = defaultdict(list)
+        self.suffixes = defaultdict(lambda:defaultdict(list))
+        self.prefixes = defaultdict(lambda:defaultdict(list))
+        self.globs = list()
+        self.regexes = list()
+        for key, sps in search_rules:
+            for idx, sp in enumerate(sps):
+                if sp.get('fn') is not None:
+                    pattern = os.path.normcase(sp['fn'])
+                    if not re.search(r'[*?[]', pattern):
+                        self.exact[pattern].append((key, idx))
+                    elif pattern.startswith('*') and not re.search(r'[*?[]', pattern[1:]):
+                        self.suffixes[len(pattern) - 1][pattern[1:]].append((key, idx))
+                    elif pattern.endswith('*') and not re.search(r'[*?[]', pattern[:-1]):
+                        self.prefixes[len(pattern) - 1][pattern[:-1]].append((key, idx))
+                    else:
+                        self.globs.append((re.compile(fnmatch.translate(pattern)), (key, idx)))
+                if sp.get('fn_re') is not None:
+                    self.regexes.append((re.compile(sp['fn_re']), (key, idx)))
+        self.globs_prefilter = _combine_regexes([r.pattern for r, i in self.globs])
+        self.regexes_prefilter = _combine_regexes([r.pattern for r, i in self.regexes])
+
+    def search(self, fn):
+        """
+        Find the search patterns with a file name (fn or fn_re) that matches.
+        :param fn: The file name to search for
+        :return: set of (sp key, pattern index) tuples that matched
+        """
+        matched = set()
+        fn_case = os.path.normcase(fn)
+        matched.update(self.exact.get(fn_case, []))
+        for length, suffixes in self.suffixes.items():
+            if len(fn_case) >= length:
+                matched.update(suffixes.get(fn_case[len(fn_case)-length:], []))
+        for length, prefixes in self.prefixes.items():
+            if len(fn_case) >= length:
+                matched.update(prefixes.get(fn_case[:length], []))
+        if len(self.globs) > 0 and (self.globs_prefilter is None or self.globs_prefilter.match(fn_case)):
+            matched.update([i for r, i in self.globs if r.match(fn_case)])
+        if len(self.regexes) > 0 and (self.regexes_prefilter is None or self.regexes_prefilter.match(fn)):
+            matched.update([i for r, i in self.regexes if r.match(fn)])
+        return matched
+
+class ContentSearch(object):
+    """
+    Searches file contents for many search patterns in a single pass.
+
+    Each file is opened once and read line by line, only as far as the largest
+    num_lines of the patterns being looked for. Every line is first checked
+    against a single combined search for all string patterns (an Aho-Corasick
+    automaton if the pyahocorasick package is installed, otherwise one regex
+    alternation) and one combined alternation of all regex patterns. Only
+    lines that hit are then checked against the individual patterns.
+    """
+
+    def __init__(self, search_rules):
+        """
+        :param search_rules: list of (sp key, list of search patterns) tuples
+        """
+        self.index = dict()
+        self.keys = dict()
+        self.strings = dict()
+        self.regexes = dict()
+        self.num_lines = dict()
+        for key, sps in search_rules:
+            for idx, sp in enumerate(sps):
+                if sp.get('contents') is None and sp.get('contents_re') is None:
+                    continue
+                i = len(self.index)
+                self.index[(key, idx)] = i
+                self.keys[i] = key
+                self.num_lines[i] = sp.get('num_lines') or None
+                if sp.get('contents') is not None:
+                    self.strings[i] = sp['contents']
+                else:
+                    self.regexes[i] = re.compile(sp['contents_re'])
+
+        # Combined searches, used to quickly skip lines that can't match anything
+        self.strings_automaton = None
+        self.strings_prefilter = None
+        if ahocorasick is not None and len(self.strings) > 0:
+            self.strings_automaton = ahocorasick.Automaton()
+            for i, string in self.strings.items():
+                if string in self.strings_automaton:
+                    self.strings_automaton.get(string).append(i)
+                else:
+                    self.strings_automaton.add_word(string, [i])
+            self.strings_automaton.make_automaton()
+        elif len(self.strings) > 0:
+            self.strings_prefilter = _combine_regexes([re.escape(s) for s in set(self.strings.values())])
+        self.regexes_prefilter = None
+        if len(self.regexes) > 0:
+            self.regexes_prefilter = _combine_regexes([r.pattern for r in self.regexes.values()])
+
+    def search(self, lines, indices, profile=None):
+        """
+        Search the contents of a single file for several patterns at once.
+        :param lines: FileLines object for the file being searched
+        :param indices: the patterns to look for, as values of self.index
+        :param profile: optional SearchProfile to record the work done for each pattern
+        :return: set with the indices of patterns that matched
+        """
+        matched = set()
+        pending_strings = set([i for i in indices if i in self.strings])
+        pending_regexes = set([i for i in indices if i in self.regexes])
+        if len(pending_strings) + len(pending_regexes) == 0:
+            return matched
+        if profile is not None:
+            return self._search_profiled(lines, indices, profile)
+
+        # Patterns stop being looked for after their num_lines
+        max_lines = 0
+        expiry = sorted([ (self.num_lines[i], i) for i in indices if self.num_lines[i] is not None ])
+        if len(expiry) == len(pending_strings) + len(pending_regexes):
+            max_lines = expiry[-1][0]
+
+        l = 1
+        for line in lines:
+            while len(expiry) > 0 and expiry[0][0] < l:
+                pending_strings.discard(expiry[0][1])
+                pending_regexes.discard(expiry[0][1])
+                expiry.pop(0)
+
+            # Search by file contents (string)
+            if len(pending_strings) > 0:
+                if self.strings_automaton is not None:
+                    for end_idx, hits in self.strings_automaton.iter(line):
+                        matched.update(pending_strings.intersection(hits))
+                elif self.strings_prefilter is None or self.strings_prefilter.search(line):
+                    matched.update([i for i in pending_strings if self.strings[i] in line])
+                pending_strings.difference_update(matched)
+
+            # Search by file contents (regex)
+            if len(pending_regexes) > 0:
+                if self.regexes_prefilter is None or self.regexes_prefilter.search(line):
+                    matched.update([i for i in pending_regexes if self.regexes[i].search(line)])
+                pending_regexes.difference_update(matched)
+
+            # Break if we've found everything or searched enough lines
+            if len(pending_strings) + len(pending_regexes) == 0:
+                break
+            if max_lines and l >= max_lines:
+                break
+            l += 1
+        return matched
+
+    def _search_profiled(self, lines, indices, profile):
+        """
+        Same as search(), but tests every pattern separately on each line
+        and records the time taken and amount of the file read for each.
+        """
+        matched = set()
+        pending = set(indices)
+        l = 1
+        for line in lines:
+            line_bytes = len(line.encode('utf-8'))
+            for i in list(pending):
+                if self.num_lines[i] is not None and l > self.num_lines[i]:
+                    pending.discard(i)
+                    continue
+                start = time.time()
+                if i in self.strings:
+                    hit = self.strings[i] in line
+                else:
+                    hit = self.regexes[i].search(line) is not None
+                profile.add(self.keys[i], bytes_read=line_bytes, lines_read=1, evaluations=1, time=time.time() - start)
+                if hit:
+                    matched.add(i)
+                    pending.discard(i)
+            if len(pending) == 0:
+                break
+            l += 1
+        return matched
+
+class FileLines(object):
+    """
+    Lines of a file being searched, read on demand and kept once read.
+    The contents search and the exclusion patterns iterate over the same
+    object, so the start of each file is only read from disk once and
+    exclusion only reads further if it needs to.
+    """
+
+    def __init__(self, f, opener=None):
+        """
+        :param f: dict with the file name (fn) and directory (root)
+        :param opener: function to open the file as text. Defaults to
+                       util_functions.open_found_file(f)
+        """
+        self.f = f
+        self.opener = opener
+        self.lines = list()
+        self.fh = None
+        self.finished = False
+        # Compressed files can be much bigger once decompressed, so stop reading
+        # them once we've had as much as log_filesize_limit allows on disk
+        self.max_chars = None
+        if util_functions.strip_compression_ext(f['fn']) != f['fn']:
+            self.max_chars = config.log_filesize_limit
+        self.num_chars = 0
+
+    def __iter__(self):
+        l = 0
+        while l < len(self.lines) or self._read_line():
+            yield self.lines[l]
+            l += 1
+
+    def _read_line(self):
+        """ Read the next line from disk. Returns False at the end of the file """
+        if self.finished:
+            return False
+        try:
+            if self.fh is None:
+                self.fh = self.opener() if self.opener is not None else util_functions.open_found_file(self.f)
+            line = self.fh.readline()
+        except util_functions.log_read_errors:
+            if config.report_readerrors:
+                logger.debug("Couldn't read file when looking for output: {}".format(self.f['fn']))
+            line = ''
+        if self.max_chars is not None:
+            self.num_chars += len(line)
+            if self.num_chars > self.max_chars:
+                logger.debug("Stopped reading compressed file after {} characters: {}".format(self.max_chars, self.f['fn']))
+                line = ''
+        if line == '':
+            self.close()
+            return False
+        self.lines.append(line)
+        return True
+
+    def close(self):
+        """ Close the file handle. Lines already read are kept """
+        self.finished = True
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+def get_search_rules(run_module_names):
+    """
+    Get the search patterns for the modules being run, sorted so that the
+    quickest patterns are tried first.
+    :param run_module_names: names of the modules being run
+    :return: list of (sp key, list of search patterns) tuples
+    """
     spatterns = [{},{},{},{},{},{},{}]
     epatterns = [{}, {}]
     ignored_patterns = []
@@ -59,7 +947,6 @@ def get_filelist(run_module_names):
         if mod_name.lower() not in [m.lower() for m in run_module_names]:
             ignored_patterns.append(key)
             continue
-        files[key] = list()
         if not isinstance(sps, list):
             sps = [sps]
 
@@ -102,195 +989,99 @@ def get_filelist(run_module_names):
     if len(ignored_patterns) > 0:
         logger.debug("Ignored search patterns as didn't match running modules: {}".format(', '.join(ignored_patterns)))
 
-    def add_file(fn, root):
-        """
-        Function applied to each file found when walking the analysis
-        directories. Runs through all search patterns and returns True
-        if a match is found.
-        """
-        f = {'fn': fn, 'root': root}
-
-        # Check that this is a file and not a pipe or anything weird
-        if not os.path.isfile(os.path.join(root, fn)):
-            return None
-
-        # Check that we don't want to ignore this file
-        i_matches = [n for n in config.fn_ignore_files if fnmatch.fnmatch(fn, n)]
-        if len(i_matches) > 0:
-            logger.debug("Ignoring file as matched an ignore pattern: {}".format(fn))
-            return None
-
-        # Limit search to small files, to avoid 30GB FastQ files etc.
-        try:
-            f['filesize'] = os.path.getsize(os.path.join(root,fn))
-        except (IOError, OSError, ValueError, UnicodeDecodeError):
-            logger.debug("Couldn't read file when checking filesize: {}".format(fn))
-        else:
-            if f['filesize'] > config.log_filesize_limit:
-                return False
-
-        # Test file for each search pattern
-        for patterns in spatterns:
-            for key, sps in patterns.items():
-                for sp in sps:
-                    if search_file (sp, f):
-                        # Check that we shouldn't exclude this file
-                        if not exclude_file(sp, f):
-                            # Looks good! Remember this file
-                            files[key].append(f)
-                        # Don't keep searching this file for other modules
-                        if not sp.get('shared', False):
-                            return
-                        # Don't look at other patterns for this module
-                        else:
-                            break
+    # Flatten the search patterns in order of priority
+    return [ (key, sps) for patterns in spatterns for key, sps in patterns.items() ]
 
-    # Go through the analysis directories and get file list
-    for path in config.analysis_dir:
-        if os.path.islink(path) and config.ignore_symlinks:
-            continue
-        elif os.path.isfile(path):
-            searchfiles.append([os.path.basename(path), os.path.dirname(path)])
-        elif os.path.isdir(path):
-            for root, dirnames, filenames in os.walk(path, followlinks=(not config.ignore_symlinks), topdown=True):
-                bname = os.path.basename(root)
-
-                # Skip any sub-directories matching ignore params
-                orig_dirnames = dirnames[:]
-                for n in config.fn_ignore_dirs:
-                    dirnames[:] = [d for d in dirnames if not fnmatch.fnmatch(d, n.rstrip(os.sep))]
-                    if len(orig_dirnames) != len(dirnames):
-                        removed_dirs = [os.path.join(root, d) for d in set(orig_dirnames).symmetric_difference(set(dirnames))]
-                        logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(", ".join(removed_dirs)))
-                        orig_dirnames = dirnames[:]
-                for n in config.fn_ignore_paths:
-                    dirnames[:] = [d for d in dirnames if not fnmatch.fnmatch(os.path.join(root, d), n.rstrip(os.sep))]
-                    if len(orig_dirnames) != len(dirnames):
-                        removed_dirs = [os.path.join(root, d) for d in set(orig_dirnames).symmetric_difference(set(dirnames))]
-                        logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(", ".join(removed_dirs)))
-
-                # Skip *this* directory if matches ignore params
-                d_matches = [n for n in config.fn_ignore_dirs if fnmatch.fnmatch(bname, n.rstrip(os.sep))]
-                if len(d_matches) > 0:
-                    logger.debug("Ignoring directory as matched fn_ignore_dirs: {}".format(bname))
-                    continue
-                p_matches = [n for n in config.fn_ignore_paths if fnmatch.fnmatch(root, n.rstrip(os.sep))]
-                if len(p_matches) > 0:
-                    logger.debug("Ignoring directory as matched fn_ignore_paths: {}".format(root))
-                    continue
-                # Search filenames in this directory
-                for fn in filenames:
-                    searchfiles.append([fn, root])
-    # Search through collected files
-    with click.progressbar(searchfiles, label="Searching {} files..".format(len(searchfiles))) as sfiles:
-        for sf in sfiles:
-            add_file(sf[0], sf[1])
-
-def search_file (pattern, f):
+def search_indexes(search_rules):
     """
-    Function to searach a single file for a single search pattern.
+    Build the file name and contents search indexes and exclusion rules for a set
+    of search patterns. These are kept in memory, so that running MultiQC again
+    in the same process (eg. with 'multiqc serve') doesn't need to build them again.
+    :param search_rules: list of (sp key, list of search patterns) tuples, in order of priority
+    :return: (FilenameSearch, ContentSearch, dict of compile_exclude_rules() results)
     """
+    rules_key = json.dumps(search_rules, sort_keys=True, default=str)
+    if rules_key not in _search_indexes:
+        _search_indexes.clear()
+        _search_indexes[rules_key] = (
+            FilenameSearch(search_rules),
+            ContentSearch(search_rules),
+            dict([ ((key, idx), compile_exclude_rules(sp)) for key, sps in search_rules for idx, sp in enumerate(sps) ])
+        )
+    return _search_indexes[rules_key]
 
-    fn_matched = False
-    contents_matched = False
-
-    # Use mimetypes to exclude binary files where possible
-    (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
-    if encoding is not None:
-        return False
-    if ftype is not None and ftype.startswith('image'):
-        return False
-
-    # Search pattern specific filesize limit
-    if pattern.get('max_filesize') is not None and 'filesize' in f:
-        if f['filesize'] > pattern.get('max_filesize'):
-            return False
+_search_indexes = dict()
 
-    # Search by file name (glob)
-    if pattern.get('fn') is not None:
-        if fnmatch.fnmatch(f['fn'], pattern['fn']):
-            fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
-
-    # Search by file name (regex)
-    if pattern.get('fn_re') is not None:
-        if re.match( pattern['fn_re'], f['fn']):
-            fn_matched = True
-            if pattern.get('contents') is None and pattern.get('contents_re') is None:
-                return True
-
-    # Search by file contents
-    if pattern.get('contents') is not None or pattern.get('contents_re') is not None:
-        if pattern.get('contents_re') is not None:
-            repattern = re.compile(pattern['contents_re'])
-        try:
-            with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as f:
-                l = 1
-                for line in f:
-                    # Search by file contents (string)
-                    if pattern.get('contents') is not None:
-                        if pattern['contents'] in line:
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Search by file contents (regex)
-                    elif pattern.get('contents_re') is not None:
-                        if re.search(repattern, line):
-                            contents_matched = True
-                            if pattern.get('fn') is None and pattern.get('fn_re') is None:
-                                return True
-                            break
-                    # Break if we've searched enough lines for this pattern
-                    if pattern.get('num_lines') and l >= pattern.get('num_lines'):
-                        break
-                    l += 1
-        except (IOError, OSError, ValueError, UnicodeDecodeError):
-            if config.report_readerrors:
-                logger.debug("Couldn't read file when looking for output: {}".format(f['fn']))
-                return False
+def _combine_regexes(patterns):
+    """ Compile a list of regex strings into a single alternation.
+    Returns None if this isn't safe, eg. with inline flags or backreferences """
+    for p in patterns:
+        if re.search(r'\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=', p):
+            return None
+    try:
+        return re.compile('|'.join(['(?:{})'.format(p) for p in patterns]))
+    except (re.error, AssertionError, OverflowError):
+        return None
 
-    return fn_matched and contents_matched
+def compile_exclude_rules(sp):
+    """
+    Prepare the special exclude_ search pattern keys of a single search
+    pattern, so that they can be checked against many files without
+    compiling anything again. Returns None if the pattern has no exclusions.
+    """
+    rules = dict()
+    for k in ['exclude_fn', 'exclude_fn_re', 'exclude_contents', 'exclude_contents_re']:
+        if sp.get(k) is not None:
+            pats = sp[k] if isinstance(sp[k], list) else [sp[k]]
+            if k.endswith('_re'):
+                pats = [re.compile(pat) for pat in pats]
+            rules[k] = pats
+    if len(rules) == 0:
+        return None
+    return rules
 
-def exclude_file(sp, f):
+def exclude_file(sp, f, rules=None, lines=None):
     """
     Exclude discovered files if they match the special exclude_
     search pattern keys
+    :param rules: Result of compile_exclude_rules(sp), if already known
+    :param lines: FileLines object for the file, to reuse lines that have already been read
     """
-    # Make everything a list if it isn't already
-    for k in sp:
-        if k in ['exclude_fn', 'exclude_fn_re' 'exclude_contents', 'exclude_contents_re']:
-            if not isinstance(sp[k], list):
-                sp[k] = [sp[k]]
+    if rules is None:
+        rules = compile_exclude_rules(sp)
+    if rules is None:
+        return False
 
     # Search by file name (glob)
-    if 'exclude_fn' in sp:
-        for pat in sp['exclude_fn']:
-            if fnmatch.fnmatch(f['fn'], pat):
-                return True
+    for pat in rules.get('exclude_fn', []):
+        if fnmatch.fnmatch(f['fn'], pat):
+            return True
 
     # Search by file name (regex)
-    if 'exclude_fn_re' in sp:
-        for pat in sp['exclude_fn_re']:
-            if re.match( pat, f['fn']):
-                return True
+    for pat in rules.get('exclude_fn_re', []):
+        if pat.match(f['fn']):
+            return True
 
     # Search the contents of the file
-    if 'exclude_contents' in sp or 'exclude_contents_re' in sp:
-        # Compile regex patterns if we have any
-        if 'exclude_contents_re' in sp:
-            sp['exclude_contents_re'] = [re.compile(pat) for pat in sp['exclude_contents_re']]
-        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
-            for line in fh:
-                if 'exclude_contents' in sp:
-                    for pat in sp['exclude_contents']:
-                        if pat in line:
-                            return True
-                if 'exclude_contents_re' in sp:
-                    for pat in sp['exclude_contents_re']:
-                        if re.search(pat, line):
-                            return True
+    if 'exclude_contents' in rules or 'exclude_contents_re' in rules:
+        own_lines = lines is None
+        if own_lines:
+            lines = FileLines(f)
+        try:
+            l = 1
+            for line in lines:
+                if config.filesearch_exclude_num_lines and l > config.filesearch_exclude_num_lines:
+                    break
+                for pat in rules.get('exclude_contents', []):
+                    if pat in line:
+                        return True
+                for pat in rules.get('exclude_contents_re', []):
+                    if pat.search(line):
+                        return True
+                l += 1
+        finally:
+            if own_lines:
+                lines.close()
     return False
 
 def data_sources_tofile ():
@@ -362,9 +1153,56 @@ def save_htmlid(html_id, skiplint=False):
 
 
 def compress_json(data):
-    """ Take a Python data object. Convert to JSON and compress using lzstring """
+    """
+    Convert the plot data to JSON and compress it for the report. Compressed with
+    zlib by default, or with lzstring if config.plot_data_codec is 'lzstring'.
+    Decompressed by mqc_decompress_plotdata() in multiqc_plotting.js.
+    :param data: plot data
+    :return: compressed string. zlib data is base64 encoded, starting with 'zlib:'
+    """
+    start = time.time()
     json_string = json.dumps(data).encode('utf-8', 'ignore').decode('utf-8')
     # JSON.parse() doesn't handle `NaN`, but it does handle `null`.
     json_string = json_string.replace('NaN', 'null');
-    x = lzstring.LZString()
-    return x.compressToBase64(json_string)
+    codec = config.plot_data_codec
+    if codec == 'lzstring':
+        # Pure Python, so very slow for big reports
+        import lzstring
+        compressed = lzstring.LZString().compressToBase64(json_string)
+    else:
+        if codec != 'zlib':
+            logger.warning("Unknown plot_data_codec '{}', using 'zlib'".format(codec))
+            codec = 'zlib'
+        # Raw deflate data, without the zlib header and checksum
+        compressor = zlib.compressobj(config.plot_data_compression_level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(json_string.encode('utf-8')) + compressor.flush()
+        compressed = 'zlib:{}'.format(base64.b64encode(deflated).decode('ascii'))
+    logger.debug("Compressed plot data with {}: {:.2f} MB to {:.2f} MB ({:.1f}%) in {:.2f}s".format(
+        codec, len(json_string) / 1048576.0, len(compressed) / 1048576.0,
+        100.0 * len(compressed) / max(len(json_string), 1), time.time() - start))
+    return compressed
+
+def write_plot_data_files(plot_data_dir):
+    """
+    Save the data for each plot to its own file, for reports made with
+    config.split_plot_data. Each file is a small script that passes the
+    compressed data to mqc_plot_data_loaded() in multiqc_plotting.js, so
+    that the report can load it when the plot is shown, even when the
+    report is opened from disk instead of a web server.
+    :param plot_data_dir: directory for the files, next to the report
+    :return: None. The file paths, relative to the report, are added to plot_data_files
+    """
+    if not os.path.exists(plot_data_dir):
+        os.makedirs(plot_data_dir)
+    fns = set()
+    for pid, data in plot_data.items():
+        fn_base = re.sub(r'[^\w-]+', '_', pid)
+        fn = '{}.js'.format(fn_base)
+        num = 1
+        while fn.lower() in fns:
+            fn = '{}_{}.js'.format(fn_base, num)
+            num += 1
+        fns.add(fn.lower())
+        with io.open(os.path.join(plot_data_dir, fn), 'w', encoding='utf-8') as f:
+            f.write(u'mqc_plot_data_loaded({}, "{}");\n'.format(json.dumps(pid), compress_json(plot_encoding.encode_plot(data))))
+        plot_data_files[pid] = '{}/{}'.format(os.path.basename(plot_data_dir), fn)
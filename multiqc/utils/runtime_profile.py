@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+""" MultiQC run time profiler. Records the wall time, CPU time and
+memory use of each stage of a MultiQC run, each module and each plot
+and report section, to help find out where a slow run spends its time. """
+
+from __future__ import print_function
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # Python 2
+
+from multiqc.utils import config
+
+logger = logging.getLogger(__name__)
+
+# Python 2 doesn't have the better clocks
+wall_clock = getattr(time, 'perf_counter', time.time)
+cpu_clock = getattr(time, 'process_time', time.clock if sys.version_info[0] < 3 else time.time)
+
+# Finished events, in the order that they finished
+events = list()
+
+_active = False
+_start_time = None
+_local = threading.local()
+
+def start():
+    """ Start recording. Called at the start of a MultiQC run, before the
+    config is loaded, so profiling is always on and only written if asked for. """
+    global _active, _start_time
+    _active = True
+    _start_time = wall_clock()
+    del events[:]
+
+def start_tracemalloc():
+    """ Trace Python memory allocations, if asked for in the config. Called once the config is loaded. """
+    if config.profile_runtime and config.profile_runtime_tracemalloc:
+        if tracemalloc is None:
+            logger.warning("Memory allocations can't be traced with this version of Python")
+        elif not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+@contextmanager
+def stage(name, category='stage', **args):
+    """
+    Record the time taken by a block of code, eg.
+        with runtime_profile.stage('discovery'):
+            report.get_filelist(run_module_names)
+    :param name: event name
+    :param category: event category, eg. 'stage', 'module', 'plot' or 'section'
+    :param args: any extra details to save with the event
+    """
+    if not _active:
+        yield
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = list()
+    frame = { 'child_peak': 0 }
+    _reset_tracemalloc_peak(stack)
+    stack.append(frame)
+    start_wall = wall_clock()
+    start_cpu = cpu_clock()
+    try:
+        yield
+    finally:
+        end_wall = wall_clock()
+        end_cpu = cpu_clock()
+        stack.pop()
+        event = OrderedDict()
+        event['name'] = name
+        event['category'] = category
+        event['start'] = round(start_wall - _start_time, 6)
+        event['wall_time'] = round(end_wall - start_wall, 6)
+        event['cpu_time'] = round(end_cpu - start_cpu, 6)
+        event['peak_rss_mb'] = _peak_rss_mb()
+        event['tracemalloc_peak_mb'] = _tracemalloc_peak_mb(frame, stack)
+        event['depth'] = len(stack)
+        event['pid'] = os.getpid()
+        event['tid'] = threading.current_thread().ident
+        event['args'] = args
+        events.append(event)
+
+def profiled(category):
+    """ Decorator to record every call of a plot function ('plot') or
+    of BaseMultiqcModule.add_section() ('section') """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active:
+                return fn(*args, **kwargs)
+            if category == 'plot':
+                name, details = _plot_details(fn, args, kwargs)
+            else:
+                name, details = _section_details(args, kwargs)
+            with stage(name, category, **details):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _plot_details(fn, args, kwargs):
+    """ Plot type and ID, from the pconfig argument of a plot() function """
+    pconfig = kwargs.get('pconfig')
+    arg_names = fn.__code__.co_varnames[:fn.__code__.co_argcount]
+    if pconfig is None and 'pconfig' in arg_names and len(args) > arg_names.index('pconfig'):
+        pconfig = args[arg_names.index('pconfig')]
+    plot_type = fn.__module__.split('.')[-1]
+    details = { 'plot_type': plot_type }
+    if isinstance(pconfig, dict) and pconfig.get('id') is not None:
+        details['id'] = pconfig['id']
+    return '{}: {}'.format(plot_type, details.get('id', '(no ID)')), details
+
+def _section_details(args, kwargs):
+    """ Module and section name, from the arguments to add_section() """
+    module = args[0] if len(args) > 0 else None
+    section_name = kwargs.get('name', args[1] if len(args) > 1 else None)
+    if section_name is None:
+        section_name = kwargs.get('anchor', args[2] if len(args) > 2 else None)
+    details = { 'module': getattr(module, 'name', None), 'section': section_name }
+    return 'section: {} - {}'.format(details['module'], section_name), details
+
+def _peak_rss_mb():
+    """ Highest resident memory use of this process so far, or None if not available """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    if sys.platform == 'darwin':
+        maxrss = maxrss / 1024.0
+    return round(maxrss / 1024.0, 2)
+
+def _reset_tracemalloc_peak(stack):
+    """ Start measuring the peak for a new event, remembering the peak so far
+    for the enclosing event. Only possible with Python 3.9+ """
+    if tracemalloc is None or not tracemalloc.is_tracing() or not hasattr(tracemalloc, 'reset_peak'):
+        return
+    if len(stack) > 0:
+        stack[-1]['child_peak'] = max(stack[-1]['child_peak'], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+
+def _tracemalloc_peak_mb(frame, stack):
+    """ Peak memory allocated by Python during an event, or None if not tracing.
+    With Python < 3.9 the peak can't be reset, so this is the peak for the whole run so far. """
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    peak = max(tracemalloc.get_traced_memory()[1], frame['child_peak'])
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        if len(stack) > 0:
+            stack[-1]['child_peak'] = max(stack[-1]['child_peak'], peak)
+    return round(peak / 1048576.0, 2)
+
+def write():
+    """ Write the profile to the data directory and print a summary to the log """
+    if not _active or not config.profile_runtime:
+        return
+    total_wall = wall_clock() - _start_time
+    stages = [ e for e in events if e['category'] == 'stage' and e['depth'] == 0 ]
+    logger.info("Run time profile: {:.2f}s in total".format(total_wall))
+    for e in stages:
+        logger.info("Run time profile: {:>8.3f}s  {:>8.3f}s CPU  {}".format(e['wall_time'], e['cpu_time'], e['name']))
+    slowest = sorted([ e for e in events if e['category'] != 'stage' ], key=lambda e: e['wall_time'], reverse=True)[:5]
+    for e in slowest:
+        logger.debug("Run time profile: {:>8.3f}s  {:>8.3f}s CPU  {}".format(e['wall_time'], e['cpu_time'], e['name']))
+
+    if config.data_dir is None or not os.path.isdir(config.data_dir):
+        logger.warning("No data directory, so the run time profile was not saved")
+        return
+    profile = OrderedDict()
+    profile['multiqc_version'] = config.version
+    profile['total_wall_time'] = round(total_wall, 6)
+    profile['peak_rss_mb'] = _peak_rss_mb()
+    profile['events'] = sorted(events, key=lambda e: e['start'])
+    _write_json(profile, 'multiqc_timings.json')
+    if config.profile_runtime_trace:
+        _write_json(trace_events(), 'multiqc_timings_trace.json')
+        logger.info("Run time profile written to multiqc_timings.json and multiqc_timings_trace.json")
+    else:
+        logger.info("Run time profile written to multiqc_timings.json")
+
+def trace_events():
+    """ Events in the Chrome trace event format, which can be viewed at
+    chrome://tracing or https://ui.perfetto.dev """
+    trace = list()
+    main_pid = os.getpid()
+    for pid in sorted(set([ e['pid'] for e in events ])):
+        trace.append({
+            'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+            'args': { 'name': 'MultiQC' if pid == main_pid else 'MultiQC worker {}'.format(pid) }
+        })
+    for e in sorted(events, key=lambda e: e['start']):
+        args = dict(e['args'])
+        args['cpu_time'] = e['cpu_time']
+        args['peak_rss_mb'] = e['peak_rss_mb']
+        if e['tracemalloc_peak_mb'] is not None:
+            args['tracemalloc_peak_mb'] = e['tracemalloc_peak_mb']
+        trace.append({
+            'name': e['name'],
+            'cat': e['category'],
+            'ph': 'X',
+            'ts': int(e['start'] * 1000000),
+            'dur': int(e['wall_time'] * 1000000),
+            'pid': e['pid'],
+            'tid': e['tid'],
+            'args': args
+        })
+    return { 'traceEvents': trace, 'displayTimeUnit': 'ms' }
+
+def _write_json(data, fn):
+    with io.open(os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+        jsonstr = json.dumps(data, indent=4, default=str, ensure_ascii=False)
+        print(jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+""" MultiQC file search cache. Remembers which search patterns
+matched each file on previous runs, so that files that have not
+changed since then don't need to be searched again. """
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import time
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from multiqc import config
+from multiqc.utils import registry
+logger = config.logger
+
+# Config options that change which files match the search patterns
+search_config = [
+    'decompress_logs',
+    'search_archives',
+    'filesearch_exclude_num_lines',
+    'log_filesize_limit',
+    'fn_ignore_files',
+    'fn_ignore_dirs'
+]
+
+def get_cache_dir():
+    """ Directory used for all MultiQC caches. Defaults to a directory in the
+    MultiQC user cache directory, so that nothing is added to the analysis
+    or output directories. """
+    if config.cache_dir is not None:
+        return os.path.abspath(config.cache_dir)
+    return registry.user_cache_path('cache_{}')
+
+class SearchCache(object):
+    """
+    On-disk SQLite cache of file search results. Each file is stored with its
+    absolute path, size and modification time, plus the search pattern keys
+    that it was found for. Results are saved with a signature of the MultiQC
+    version, the search patterns and the search config (see search_config), so
+    runs with different modules or config keep separate results in the same
+    cache. Results that haven't been used recently are removed when the cache
+    is bigger than config.search_cache_max_size (in megabytes).
+    """
+
+    def __init__(self, search_patterns):
+        """
+        :param search_patterns: dict with the search patterns in use (key: list of patterns)
+        """
+        self.db = None
+        self.new_results = list()
+        self.used_paths = list()
+        if sqlite3 is None:
+            logger.debug("Python sqlite3 library not available, not using file search cache")
+            return
+
+        # Anything that changes the search results should change the signature
+        self.signature = hashlib.sha1(json.dumps({
+            'version': config.version,
+            'search_patterns': search_patterns,
+            'search_config': [ getattr(config, c, None) for c in search_config ]
+        }, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+        cache_dir = get_cache_dir()
+        cache_fn = os.path.join(cache_dir, 'search_cache.sqlite')
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self.db = sqlite3.connect(cache_fn, timeout=30)
+            # Tables used by earlier versions, with one signature for the whole cache
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS meta")
+            self.db.execute("CREATE TABLE IF NOT EXISTS search_results (signature TEXT, path TEXT, filesize INTEGER, mtime REAL, sp_keys TEXT, size INTEGER, last_used REAL, PRIMARY KEY (signature, path))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS search_results_last_used ON search_results (last_used)")
+            self.db.commit()
+            logger.debug("Using file search cache: {}".format(cache_fn))
+        except (sqlite3.Error, IOError, OSError) as e:
+            logger.warning("Could not open file search cache '{}': {}".format(cache_fn, e))
+            self.db = None
+
+    def get(self, path, filesize, mtime):
+        """ Return the list of search pattern keys for a file, or None if
+        the file is not in the cache or has changed since it was cached. """
+        if self.db is None or mtime is None:
+            return None
+        try:
+            row = self.db.execute("SELECT filesize, mtime, sp_keys FROM search_results WHERE signature = ? AND path = ?", (self.signature, path)).fetchone()
+        except sqlite3.Error as e:
+            logger.debug("Could not read from file search cache: {}".format(e))
+            return None
+        if row is None or row[0] != filesize or row[1] != mtime:
+            return None
+        self.used_paths.append(path)
+        return json.loads(row[2])
+
+    def add(self, path, filesize, mtime, sp_keys):
+        """ Remember the search pattern keys found for a file. Saved on close() """
+        if self.db is not None and mtime is not None:
+            sp_keys = json.dumps(sp_keys)
+            # Rough size of the row on disk, for evict()
+            size = len(self.signature) + len(path.encode('utf-8')) + len(sp_keys) + 32
+            self.new_results.append((path, filesize, mtime, sp_keys, size))
+
+    def close(self):
+        """ Write new results to disk, then remove the least recently used
+        results if the cache is too big """
+        if self.db is None:
+            return
+        now = time.time()
+        try:
+            self.db.executemany("INSERT OR REPLACE INTO search_results (signature, path, filesize, mtime, sp_keys, size, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [ (self.signature, path, filesize, mtime, sp_keys, size, now) for path, filesize, mtime, sp_keys, size in self.new_results ])
+            self.db.executemany("UPDATE search_results SET last_used = ? WHERE signature = ? AND path = ?",
+                [ (now, self.signature, path) for path in self.used_paths ])
+            self.evict()
+            self.db.commit()
+            self.db.close()
+        except sqlite3.Error as e:
+            logger.warning("Could not save file search cache: {}".format(e))
+        logger.debug("File search cache: {} files unchanged, {} files searched".format(len(self.used_paths), len(self.new_results)))
+        self.db = None
+        self.new_results = list()
+        self.used_paths = list()
+
+    def evict(self):
+        """ Remove the least recently used results until the cache fits in config.search_cache_max_size """
+        max_size = float(config.search_cache_max_size) * 1048576
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM search_results").fetchone()[0]
+        if total_size <= max_size:
+            return
+        removed = 0
+        for signature, path, size in self.db.execute("SELECT signature, path, size FROM search_results ORDER BY last_used ASC").fetchall():
+            if total_size <= max_size:
+                break
+            self.db.execute("DELETE FROM search_results WHERE signature = ? AND path = ?", (signature, path))
+            total_size -= size
+            removed += 1
+        logger.debug("Removed {} old results from the file search cache".format(removed))
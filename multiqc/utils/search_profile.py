@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+""" MultiQC file search profiler. Records how much work each
+search pattern causes when looking for log files, to help
+find slow or badly-specified search patterns. """
+
+from __future__ import print_function
+from collections import OrderedDict
+import logging
+
+from multiqc.utils import config, util_functions
+
+logger = logging.getLogger(__name__)
+
+class SearchProfile(object):
+    """ Counters for each search pattern key, filled in by report.get_filelist() """
+
+    fields = ['files_tested', 'bytes_read', 'lines_read', 'evaluations', 'matches', 'time']
+
+    def __init__(self):
+        self.stats = OrderedDict()
+
+    def add(self, key, **counts):
+        """ Add to the counters for a search pattern key """
+        if key not in self.stats:
+            self.stats[key] = OrderedDict([ (k, 0) for k in self.fields ])
+        for k, v in counts.items():
+            self.stats[key][k] += v
+
+    def write(self):
+        """ Write the profile to the data directory and print a summary to the log """
+        for key in self.stats:
+            self.stats[key]['time'] = round(self.stats[key]['time'], 6)
+        util_functions.write_data_file(self.stats, 'multiqc_search_profile', data_format='tsv')
+        util_functions.write_data_file(self.stats, 'multiqc_search_profile', data_format='json')
+
+        total_time = sum([s['time'] for s in self.stats.values()])
+        logger.info("Search profile: {} search patterns took {:.2f}s in total".format(len(self.stats), total_time))
+        slowest = sorted(self.stats.items(), key=lambda x: x[1]['time'], reverse=True)[:5]
+        for key, s in slowest:
+            logger.info("Search profile: {:>8.3f}s  {:>7} files  {:>10} lines  {:>6} matches  {}".format(
+                s['time'], s['files_tested'], s['lines_read'], s['matches'], key))
+        if config.data_dir is not None:
+            logger.info("Search profile written to multiqc_search_profile.{}".format(config.data_format_extensions['tsv']))
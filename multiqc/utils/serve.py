@@ -0,0 +1,540 @@
+#!/usr/bin/env python
+
+""" MultiQC daemon. Keeps the MultiQC modules, report templates and search
+pattern indexes loaded in memory and runs report jobs sent to it over a
+local UNIX socket or HTTP on localhost. Each job runs in its own worker
+process, forked from the daemon so that it starts with everything loaded. """
+
+from __future__ import print_function
+import binascii
+import click
+import errno
+import hmac
+import jinja2
+from jinja2 import bccache
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    import SocketServer as socketserver # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib2 import Request, urlopen, HTTPError
+
+from multiqc import __version__
+from multiqc.utils import config, parallel, registry, report, util_functions
+
+logger = logging.getLogger(__name__)
+
+class TemplateCache(bccache.BytecodeCache):
+    """ In-memory cache of compiled Jinja templates. Templates are copied to a new
+    temporary directory for every report, so they are cached by their name and
+    contents instead of by file path. Used by every run, but only really helps
+    when several reports are made in one process, eg. with 'multiqc serve'. """
+
+    def __init__(self):
+        self.code = dict()
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        bucket = bccache.Bucket(environment, '{}:{}'.format(name, checksum), checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket):
+        code = self.code.get(bucket.key)
+        if code is not None:
+            bucket.bytecode_from_string(code)
+
+    def dump_bytecode(self, bucket):
+        self.code[bucket.key] = bucket.bytecode_to_string()
+
+template_cache = TemplateCache()
+
+def warm_up():
+    """ Load everything that report jobs need, so that the worker processes
+    forked for each job start with it already in memory """
+    start = time.time()
+
+    # Modules
+    for name, entry_point in config.avail_modules.items():
+        try:
+            entry_point.load()
+        except Exception as e:
+            logger.warning("Could not load module '{}': {}".format(name, e))
+
+    # Libraries that are otherwise only imported when first needed
+    from multiqc.modules import base_module
+    base_module.render_markdown('')
+    try:
+        import spectra
+    except ImportError:
+        pass
+    try:
+        util_functions.get_pyplot()
+    except Exception:
+        pass # Flat plots fall back to interactive plots, as usual
+
+    # Search pattern indexes, for jobs that run all modules with the default search patterns
+    report.search_indexes(report.get_search_rules(list(config.avail_modules.keys())))
+
+    # Report templates
+    for name in config.avail_templates:
+        try:
+            compile_template(name)
+        except Exception as e:
+            logger.warning("Could not load template '{}': {}".format(name, e))
+
+    logger.info("Loaded {} modules and {} templates in {:.2f}s".format(len(config.avail_modules), len(config.avail_templates), time.time() - start))
+
+def compile_template(name):
+    """ Compile all of the Jinja files in a template into template_cache. Template
+    modules can change the config when they are imported, so they are found
+    without being imported and only loaded by the jobs that use them. """
+    module_name = config.avail_templates[name].value.split(':')[0].strip()
+    template_dir = None
+    try:
+        from importlib.util import find_spec
+        spec = find_spec(module_name)
+        if spec is not None and spec.submodule_search_locations:
+            template_dir = list(spec.submodule_search_locations)[0]
+    except ImportError:
+        import pkgutil # Python 2
+        loader = pkgutil.get_loader(module_name)
+        if loader is not None and loader.is_package(module_name):
+            template_dir = os.path.dirname(loader.get_filename())
+    if template_dir is None:
+        logger.debug("Could not find the files for template '{}'".format(name))
+        return
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir), bytecode_cache=template_cache)
+    for fn in env.list_templates(filter_func=lambda fn: fn.endswith('.html')):
+        try:
+            env.get_template(fn)
+        except jinja2.TemplateError as e:
+            logger.debug("Could not compile '{}' in template '{}': {}".format(fn, name, e))
+
+def job_args(job, verbose=0):
+    """
+    Make the MultiQC command line arguments for a job
+    :param job: dict with a list of 'analysis_dir', plus optional 'args' (list
+                of command line options) and 'config' (dict of config overrides)
+    :param verbose: verbosity of the daemon. Jobs only log warnings unless this is set
+    :return: list of command line arguments
+    """
+    if not isinstance(job, dict):
+        raise ValueError("Job must be a JSON object")
+    analysis_dir = job.get('analysis_dir', [])
+    if not isinstance(analysis_dir, list):
+        analysis_dir = [analysis_dir]
+    args = job.get('args', [])
+    if not isinstance(args, list):
+        raise ValueError("Job 'args' must be a list of command line options")
+    args = [ str(a) for a in args ]
+    if job.get('config'):
+        if not isinstance(job['config'], dict):
+            raise ValueError("Job 'config' must be a JSON object")
+        args.extend(['--cl-config', json.dumps(job['config'])])
+    if not verbose and not any([ a in ['-q', '--quiet'] or a.startswith('-v') or a == '--verbose' for a in args ]):
+        args.append('--quiet')
+    if len(analysis_dir) > 0:
+        args.append('--')
+        args.extend([ str(d) for d in analysis_dir ])
+    return args
+
+def run_job(command, job, verbose=0, timeout=None):
+    """
+    Run a report job in a worker process
+    :param command: the MultiQC click command, used to read the job's command line options
+    :param job: job dict, see job_args()
+    :param verbose: verbosity of the daemon
+    :param timeout: stop the job if it takes longer than this many seconds
+    :return: dict with the 'exit_code', 'report' and 'data_dir' paths, 'run_time' and any 'error'
+    """
+    start = time.time()
+    ctx = parallel.fork_context()
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    worker = ctx.Process(target=_job_worker, args=(command, job, verbose, send_conn))
+    worker.start()
+    send_conn.close()
+    try:
+        if recv_conn.poll(timeout):
+            result = recv_conn.recv()
+        else:
+            worker.terminate()
+            result = { 'exit_code': 1, 'error': "Job took longer than {}s and was stopped".format(timeout) }
+    except EOFError:
+        result = { 'exit_code': 1, 'error': "Worker process exited without a result" }
+    finally:
+        recv_conn.close()
+        worker.join()
+    if worker.exitcode not in [0, None] and result.get('error') is None:
+        result['error'] = "Worker process exited with code {}".format(worker.exitcode)
+    result['run_time'] = round(time.time() - start, 3)
+    return result
+
+def _job_worker(command, job, verbose, conn):
+    """ Run a single job in a forked worker process and send back the results """
+    result = { 'exit_code': 1, 'report': None, 'data_dir': None, 'plots_dir': None, 'plot_data_dir': None, 'error': None }
+    try:
+        # Use the job's own log handlers, not the daemon's
+        for handler in list(config.logger.handlers):
+            config.logger.removeHandler(handler)
+        args = job_args(job, verbose)
+        if job.get('cwd') is not None:
+            os.chdir(job['cwd'])
+        sys.argv = ['multiqc'] + args
+        # Start from the defaults for this working directory and time
+        config.reset()
+        # Don't check multiqc.info for a new version for every job
+        config.no_version_check = True
+        from multiqc.multiqc import run
+        try:
+            ctx = command.make_context('multiqc', args)
+            multiqc_run = run(**ctx.params)
+        except click.exceptions.Exit as e:
+            # --help or --version
+            result['exit_code'] = getattr(e, 'exit_code', 0)
+        except click.ClickException as e:
+            result['exit_code'] = e.exit_code
+            result['error'] = e.format_message()
+        except SystemExit as e:
+            result['exit_code'] = e.code if isinstance(e.code, int) else 1
+        else:
+            result['exit_code'] = multiqc_run.sys_exit_code
+            result['report'] = multiqc_run.output_fn
+            result['data_dir'] = multiqc_run.data_dir
+            result['plots_dir'] = multiqc_run.plots_dir
+            result['plot_data_dir'] = multiqc_run.plot_data_dir
+        if result['exit_code'] != 0 and result['error'] is None:
+            result['error'] = "MultiQC exited with code {}".format(result['exit_code'])
+    except Exception as e:
+        result['exit_code'] = 1
+        result['error'] = traceback.format_exc()
+    conn.send(result)
+    conn.close()
+
+class Daemon(object):
+    """ Runs jobs for the UNIX socket and HTTP servers, up to a given number at once """
+
+    def __init__(self, command, jobs=4, timeout=None, verbose=0):
+        self.command = command
+        self.jobs = jobs
+        self.timeout = timeout
+        self.verbose = verbose
+        self.slots = threading.BoundedSemaphore(jobs)
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_running = 0
+        self.num_done = 0
+        self.num_failed = 0
+
+    def handle(self, request):
+        """
+        Handle a request from a client
+        :param request: JSON string, either a job or {"action": "status"}
+        :return: response dict
+        """
+        try:
+            job = json.loads(request)
+            if isinstance(job, dict) and job.get('action') == 'status':
+                return self.status()
+            job_args(job)
+        except ValueError as e:
+            return { 'exit_code': 1, 'error': "Invalid job: {}".format(e) }
+        analysis_dir = job.get('analysis_dir', [])
+        if not isinstance(analysis_dir, list):
+            analysis_dir = [analysis_dir]
+        logger.info("Job received: {}".format(', '.join([ str(d) for d in analysis_dir ]) or '(no analysis directories)'))
+        with self.slots:
+            with self.lock:
+                self.num_running += 1
+            try:
+                result = run_job(self.command, job, self.verbose, self.timeout)
+            finally:
+                with self.lock:
+                    self.num_running -= 1
+                    self.num_done += 1
+        if result['exit_code'] != 0:
+            with self.lock:
+                self.num_failed += 1
+            logger.warning("Job failed after {:.2f}s: {}".format(result['run_time'], result.get('error')))
+        else:
+            logger.info("Job finished in {:.2f}s: {}".format(result['run_time'], result.get('report')))
+        return result
+
+    def status(self):
+        """ Details of the daemon, for {"action": "status"} requests """
+        with self.lock:
+            return {
+                'multiqc_version': __version__,
+                'pid': os.getpid(),
+                'uptime': round(time.time() - self.start_time, 3),
+                'max_jobs': self.jobs,
+                'jobs_running': self.num_running,
+                'jobs_done': self.num_done,
+                'jobs_failed': self.num_failed
+            }
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class _UnixHandler(socketserver.StreamRequestHandler):
+    """ One JSON request per connection, on a single line. The response is sent back the same way. """
+
+    def handle(self):
+        request = self.rfile.readline().decode('utf-8')
+        response = self.server.multiqc_daemon.handle(request)
+        self.wfile.write('{}\n'.format(json.dumps(response)).encode('utf-8'))
+
+class _HTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    """ POST a job to /run, or GET /status. Every request needs the daemon's
+    token in an X-MultiQC-Token header. Requests from web pages (with an Origin
+    header) are refused, so that other sites open in a browser can't send jobs. """
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        if self.path.rstrip('/') in ['', '/status']:
+            self._respond(200, self.server.multiqc_daemon.status())
+        else:
+            self._respond(404, { 'error': "Not found: {}".format(self.path) })
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ['', '/run']:
+            self._respond(404, { 'error': "Not found: {}".format(self.path) })
+            return
+        if not self._authorised():
+            return
+        content_type = self.headers.get('Content-Type') or ''
+        if content_type.split(';')[0].strip().lower() != 'application/json':
+            self._respond(415, { 'exit_code': 1, 'error': "Jobs must be sent with 'Content-Type: application/json'" })
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        request = self.rfile.read(length).decode('utf-8')
+        response = self.server.multiqc_daemon.handle(request)
+        self._respond(200 if response['exit_code'] == 0 else 500, response)
+
+    def _authorised(self):
+        """ Check the Origin and token headers, and send an error response if they are not allowed """
+        if self.headers.get('Origin') is not None:
+            self._respond(403, { 'exit_code': 1, 'error': "Requests from web pages are not accepted" })
+            return False
+        token = self.headers.get('X-MultiQC-Token') or ''
+        if not hmac.compare_digest(token.encode('utf-8'), self.server.token.encode('utf-8')):
+            self._respond(403, { 'exit_code': 1, 'error': "Missing or incorrect X-MultiQC-Token header" })
+            return False
+        return True
+
+    def _respond(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("HTTP: {}".format(format % args))
+
+def default_socket_path():
+    """ UNIX socket used if neither --socket nor --port are given """
+    return registry.user_cache_path('multiqc_serve.sock')
+
+def token_path(port):
+    """ File with the token needed to send jobs to the daemon's HTTP server on this port """
+    return registry.user_cache_path('multiqc_serve_{}.token'.format(port))
+
+def _write_token(token_fn):
+    """ Make a new random token and save it in a file that only this user can read """
+    token = binascii.hexlify(os.urandom(32)).decode('ascii')
+    if not os.path.isdir(os.path.dirname(token_fn)):
+        os.makedirs(os.path.dirname(token_fn))
+    if os.path.exists(token_fn):
+        os.remove(token_fn)
+    fd = os.open(token_fn, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(token)
+    return token
+
+def _remove_stale_socket(socket_path):
+    """ Remove a socket file left behind by a daemon that is no longer running """
+    if not os.path.exists(socket_path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (IOError, OSError):
+        os.remove(socket_path)
+    else:
+        raise click.UsageError("A MultiQC daemon is already listening on '{}'".format(socket_path))
+    finally:
+        sock.close()
+
+def submit(job, socket_path=None, port=None, timeout=None, token=None):
+    """
+    Send a job to a running MultiQC daemon and wait for the result
+    :param job: dict with a list of 'analysis_dir', plus optional 'args', 'config' and 'cwd'
+    :param socket_path: UNIX socket of the daemon. Default: default_socket_path()
+    :param port: HTTP port of the daemon on localhost, instead of a UNIX socket
+    :param timeout: seconds to wait for the result
+    :param token: token for the HTTP server. Default: read from token_path(port)
+    :return: result dict, see run_job()
+    """
+    request = json.dumps(job).encode('utf-8')
+    if port is not None:
+        if token is None:
+            with open(token_path(port)) as fh:
+                token = fh.read().strip()
+        headers = { 'Content-Type': 'application/json', 'X-MultiQC-Token': token }
+        req = Request('http://127.0.0.1:{}/run'.format(port), data=request, headers=headers)
+        try:
+            response = urlopen(req, timeout=timeout).read()
+        except HTTPError as e:
+            response = e.read()
+        return json.loads(response.decode('utf-8'))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(request + b'\n')
+        response = b''
+        while not response.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    finally:
+        sock.close()
+    return json.loads(response.decode('utf-8'))
+
+@click.command(
+    context_settings = dict( help_option_names = ['-h', '--help'] )
+)
+@click.option('--socket', 'socket_path',
+                    type = str,
+                    help = "Listen for jobs on this UNIX socket. Default: {}".format(default_socket_path())
+)
+@click.option('--port',
+                    type = int,
+                    help = "Listen for jobs over HTTP on this port on localhost. Requests need the token saved in {}".format(token_path('<port>'))
+)
+@click.option('-j', '--jobs',
+                    type = int,
+                    default = 4,
+                    help = "Number of jobs to run at the same time. Default: 4"
+)
+@click.option('--timeout',
+                    type = int,
+                    help = "Stop jobs that take longer than this many seconds"
+)
+@click.option('-v', '--verbose',
+                    count = True,
+                    default = 0,
+                    help = "Increase output verbosity, including the output of each job."
+)
+@click.pass_context
+def serve(ctx, socket_path, port, jobs, timeout, verbose):
+    """ Run MultiQC as a daemon, to make many reports quickly.
+
+        Modules and templates are loaded once, then report jobs are accepted
+        as JSON on a UNIX socket (one job per line) or HTTP on localhost
+        (POST to /run, with the token from the file shown at start up in an
+        X-MultiQC-Token header). Each job is run in its own worker process and
+        the paths of the report and data directory are sent back.
+
+        Example job: {"analysis_dir": ["/path/to/results"], "args": ["-f"], "config": {"title": "My report"}}
+
+        See http://multiqc.info for more details.
+    """
+    # Log to the console only, jobs save their own log files
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)-7s] %(message)s'))
+    config.logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    config.logger.addHandler(console)
+
+    if parallel.fork_context() is None:
+        raise click.UsageError("'multiqc serve' needs to fork worker processes, which isn't possible on this system")
+    if jobs < 1:
+        raise click.UsageError("--jobs must be at least 1")
+    if socket_path is None and port is None:
+        socket_path = default_socket_path()
+
+    logger.info("This is MultiQC v{} (daemon)".format(__version__))
+    warm_up()
+    daemon = Daemon(ctx.obj['command'], jobs, timeout, verbose)
+
+    servers = list()
+    token_fn = None
+    try:
+        if socket_path is not None:
+            if not os.path.isdir(os.path.dirname(os.path.abspath(socket_path))):
+                os.makedirs(os.path.dirname(os.path.abspath(socket_path)))
+            _remove_stale_socket(socket_path)
+            # Only this user can send jobs
+            old_umask = os.umask(0o177)
+            try:
+                server = _UnixServer(socket_path, _UnixHandler)
+            finally:
+                os.umask(old_umask)
+            servers.append(server)
+            logger.info("Listening on UNIX socket: {}".format(socket_path))
+        if port is not None:
+            server = _HTTPServer(('127.0.0.1', port), _HTTPHandler)
+            servers.append(server)
+            token_fn = token_path(server.server_address[1])
+            server.token = _write_token(token_fn)
+            logger.info("Listening on http://127.0.0.1:{}".format(server.server_address[1]))
+            logger.info("HTTP requests need the token saved in: {}".format(token_fn))
+    except (IOError, OSError) as e:
+        for server in servers:
+            server.server_close()
+        _remove_file(token_fn)
+        raise click.UsageError("Could not start the daemon: {}".format(e))
+
+    # Stop cleanly on SIGTERM as well as Ctrl-C
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    threads = list()
+    for server in servers:
+        server.multiqc_daemon = daemon
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        while any([ t.is_alive() for t in threads ]):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        logger.info("Stopping MultiQC daemon")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        _remove_file(socket_path)
+        _remove_file(token_fn)
+
+def _remove_file(fn):
+    """ Remove the socket or token file when the daemon stops """
+    if fn is None:
+        return
+    try:
+        os.remove(fn)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
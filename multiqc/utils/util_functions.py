@@ -3,6 +3,9 @@
 """ MultiQC Utility functions, used in a variety of places. """
 
 from __future__ import print_function
+import bz2
+import codecs
+import gzip
 import io
 import json
 import os
@@ -10,9 +13,28 @@ import yaml
 import time
 import shutil
 import sys
+import tarfile
+import zipfile
+import zlib
+try:
+    import lzma
+except ImportError:
+    lzma = None
 
 from multiqc import config
 
+# Compressed log files that can be read without decompressing them to disk
+log_compression_exts = ['.gz', '.bz2', '.xz']
+
+# Archives that can be searched for log files without extracting them to disk
+archive_exts = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz']
+
+# Exceptions that can be raised when reading a (possibly compressed) log file
+log_read_errors = (IOError, OSError, ValueError, UnicodeDecodeError, EOFError, zlib.error,
+                   tarfile.TarError, zipfile.BadZipfile)
+if lzma is not None:
+    log_read_errors += (lzma.LZMAError,)
+
 def robust_rmtree(path, logger=None, max_retries=10):
     """Robustly tries to delete paths.
     Retries several times (with increasing delays) if an OSError
@@ -93,6 +115,37 @@ def write_data_file(data, fn, sort_cols=False, data_format=None):
 
                 print( body.encode('utf-8', 'ignore').decode('utf-8'), file=f)
 
+def write_template(template, fn, **context):
+    """ Render a Jinja template straight to a file (or stdout), a piece at a
+    time, so that the whole rendered report is never held in memory.
+    Files are written under a temporary name first, so that a report is
+    never left half written if rendering fails.
+    :param: template - Jinja template object
+    :param: fn - output file path, or sys.stdout
+    :param: context - variables for the template
+    :return: None """
+
+    stream = template.stream(**context)
+    if fn is sys.stdout:
+        # Write bytes, to print the same UTF-8 whatever the terminal encoding is
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+        stream.dump(out, encoding='utf-8')
+        out.write(b'\n')
+        out.flush()
+        return
+    tmp_fn = '{}.tmp'.format(fn)
+    try:
+        with io.open(tmp_fn, 'wb', buffering=config.report_write_buffer_size) as f:
+            stream.dump(f, encoding='utf-8')
+            f.write(b'\n')
+        if os.path.exists(fn):
+            os.remove(fn) # os.rename() doesn't overwrite on Windows
+        os.rename(tmp_fn, fn)
+    except:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+        raise
+
 def view_all_tags(ctx, param, value):
     """ List available tags and associated modules
     Called by eager click option: --view-tags
@@ -114,3 +167,118 @@ def view_all_tags(ctx, param, value):
         for ttgs in avail_tags[t]:
             print ("   - {}".format(ttgs))
     ctx.exit()
+
+
+def get_pyplot():
+    """ Import MatPlotLib and return matplotlib.pyplot. This is slow, so is only done
+    the first time that a flat plot is made, instead of whenever MultiQC starts.
+    Raises the original exception if MatPlotLib can't be loaded. """
+    global _pyplot, _pyplot_error
+    if _pyplot is None:
+        if _pyplot_error is not None:
+            raise _pyplot_error
+        try:
+            # Import matplot lib but avoid default X environment
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            _pyplot = plt
+        except Exception as e:
+            # MatPlotLib can break in a variety of ways. Fake an error message and continue without it if so.
+            # The plotting functions fall back to interactive plots when this happens.
+            print("##### ERROR! MatPlotLib library could not be loaded!    #####", file=sys.stderr)
+            print("##### Flat plots will instead be plotted as interactive #####", file=sys.stderr)
+            print(e)
+            _pyplot_error = e
+            raise
+    return _pyplot
+
+_pyplot = None
+_pyplot_error = None
+
+def strip_compression_ext(fn):
+    """ Return a file name without the compression extension, if it is a
+    compressed log file that MultiQC can read (eg. 'mylog.txt.gz' becomes
+    'mylog.txt'). Other file names are returned unchanged. """
+    if config.decompress_logs:
+        for ext in log_compression_exts:
+            if fn.endswith(ext) and len(fn) > len(ext):
+                return fn[:-len(ext)]
+    return fn
+
+
+def open_log_file(path, encoding='utf-8'):
+    """ Open a log file to read as text. Files compressed with gzip, bzip2
+    or xz are decompressed as they are read, so only the part of the file
+    that is actually read needs to be decompressed. """
+    if strip_compression_ext(path) == path:
+        return io.open(path, "r", encoding=encoding)
+    if path.endswith('.gz'):
+        fh = gzip.GzipFile(path, 'rb')
+    elif path.endswith('.bz2'):
+        fh = bz2.BZ2File(path, 'rb')
+    else:
+        if lzma is None:
+            raise IOError("Python lzma library not available, can't read file: {}".format(path))
+        fh = lzma.LZMAFile(path, 'rb')
+    return _text_stream(fh, encoding)
+
+
+def open_member_stream(fh, member, encoding='utf-8'):
+    """ Read a binary file object for a file inside an archive as text,
+    decompressing it as it is read if the member is itself compressed. """
+    if strip_compression_ext(member) != member:
+        if member.endswith('.gz'):
+            fh = gzip.GzipFile(fileobj=fh, mode='rb')
+        elif member.endswith('.bz2'):
+            if sys.version_info[0] >= 3:
+                fh = bz2.BZ2File(fh, 'rb')
+            else:
+                fh = io.BytesIO(bz2.decompress(fh.read()))
+        else:
+            if lzma is None:
+                raise IOError("Python lzma library not available, can't read file: {}".format(member))
+            fh = lzma.LZMAFile(fh, 'rb')
+    return _text_stream(fh, encoding)
+
+
+def open_found_file(f, encoding='utf-8'):
+    """ Open a file found by the file search to read as text. Handles
+    compressed files and files inside tar and zip archives.
+    :param f: dict with the file name (fn) and directory (root). Files found
+              inside archives also have the archive path (archive), the
+              path inside the archive (archive_member) and for tar archives,
+              the position of the member data (archive_offset).
+    """
+    if f.get('archive') is None:
+        return open_log_file(os.path.join(f['root'], f['fn']), encoding)
+    # Matched archive members are small log files, so are read into memory.
+    # This means that the archive doesn't need to stay open.
+    if is_tar(f['archive']):
+        with tarfile.open(f['archive'], 'r:*') as tar:
+            if f.get('archive_offset') is not None and f.get('filesize') is not None:
+                tar.fileobj.seek(f['archive_offset'])
+                data = tar.fileobj.read(f['filesize'])
+            else:
+                data = tar.extractfile(f['archive_member']).read()
+    else:
+        with zipfile.ZipFile(f['archive']) as zf:
+            data = zf.read(f['archive_member'])
+    return open_member_stream(io.BytesIO(data), f['archive_member'], encoding)
+
+
+def is_archive(fn):
+    """ Check whether a file is a tar or zip archive that can be searched """
+    return any([fn.endswith(ext) for ext in archive_exts])
+
+
+def is_tar(fn):
+    """ Check whether an archive is a tar archive, rather than a zip archive """
+    return is_archive(fn) and not fn.endswith('.zip')
+
+
+def _text_stream(fh, encoding):
+    """ Read a binary file object as text """
+    if sys.version_info[0] >= 3:
+        return io.TextIOWrapper(fh, encoding=encoding)
+    return codecs.getreader(encoding)(fh)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+""" Memory benchmark for writing the HTML report.
+
+Renders the default report template with a large amount of (random) plot
+data, either all at once into a string and then printed to the file, as
+MultiQC used to do, or streamed straight to the file with
+util_functions.write_template(). Each way is run in a new process, and the
+extra memory used on top of the report data is printed.
+
+Usage: python test/benchmark_report_memory.py [--mb 200]
+"""
+
+from __future__ import print_function
+import argparse
+import base64
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+
+def peak_rss_mb():
+    """ Highest resident memory use of this process so far """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    if sys.platform == 'darwin':
+        maxrss = maxrss / 1024.0
+    return maxrss / 1024.0
+
+def write_report(mode, mb):
+    """ Write a report with mb megabytes of plot data, rendered with mode 'render' or 'stream' """
+    import jinja2
+    from multiqc.utils import config, report, util_functions
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # Set up the template as MultiQC does
+        template_mod = config.avail_templates['default'].load()
+        template_dir = os.path.join(tmp_dir, 'template')
+        shutil.copytree(template_mod.template_dir, template_dir)
+        def include_file(name, fdir=template_dir, b64=False):
+            if fdir is None:
+                fdir = ''
+            if b64:
+                with io.open(os.path.join(fdir, name), "rb") as f:
+                    return base64.b64encode(f.read()).decode('utf-8')
+            with io.open(os.path.join(fdir, name), "r", encoding='utf-8') as f:
+                return f.read()
+        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
+        env.globals['include_file'] = include_file
+        j_template = env.get_template(template_mod.base_fn)
+
+        # Random plot data, which is the biggest part of large reports
+        report.plot_compressed_json = 'zlib:{}'.format(base64.b64encode(os.urandom(int(mb * 1048576 * 3 / 4))).decode('ascii'))
+        output_fn = os.path.join(tmp_dir, 'multiqc_report.html')
+
+        before = peak_rss_mb()
+        start = time.time()
+        if mode == 'render':
+            report_output = j_template.render(report=report, config=config)
+            with io.open(output_fn, "w", encoding='utf-8') as f:
+                print(report_output, file=f)
+        else:
+            util_functions.write_template(j_template, output_fn, report=report, config=config)
+        run_time = time.time() - start
+        report_mb = os.path.getsize(output_fn) / 1048576.0
+        print("{:<8} report {:>8.1f} MB   peak memory {:>8.1f} MB   extra memory {:>8.1f} MB   {:.2f}s".format(
+            mode, report_mb, peak_rss_mb(), peak_rss_mb() - before, run_time))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--mb', type=float, default=200, help="Megabytes of plot data in the report. Default: 200")
+    parser.add_argument('--mode', choices=['render', 'stream'], help="Only run one way, in this process")
+    args = parser.parse_args()
+    if resource is None:
+        sys.exit("The resource module is needed to measure memory use, which isn't available on this system")
+    if args.mode is not None:
+        write_report(args.mode, args.mb)
+        return
+    for mode in ['render', 'stream']:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), '--mb', str(args.mb), '--mode', mode])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+""" Round trip check for mqc_inflate() in multiqc_plotting.js, which
+decompresses the zlib plot data in the report. The function is run with
+Node.js on data compressed by Python's zlib, including streams that mix
+stored and compressed blocks. Skipped if Node.js isn't installed.
+
+Usage: python test/test_plot_data_inflate.py (or with pytest)
+"""
+
+from __future__ import print_function
+import base64
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zlib
+
+JS_FN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+    'multiqc', 'templates', 'default', 'assets', 'js', 'multiqc_plotting.js')
+
+# Decompresses each line of base64 on stdin and prints the result as base64
+JS_RUNNER = """
+var lines = require('fs').readFileSync(0, 'utf8').split('\\n').filter(function(l){ return l.length > 0; });
+lines.forEach(function(l){
+  var out = mqc_inflate(new Uint8Array(Buffer.from(l, 'base64')));
+  process.stdout.write(Buffer.from(out).toString('base64') + '\\n');
+});
+"""
+
+def node_path():
+    for name in ['node', 'nodejs']:
+        for d in os.environ.get('PATH', '').split(os.pathsep):
+            if os.path.isfile(os.path.join(d, name)):
+                return os.path.join(d, name)
+    return None
+
+def js_inflate(streams):
+    """ Decompress a list of raw deflate streams with mqc_inflate() """
+    with open(JS_FN) as fh:
+        js = fh.read()
+    start = js.index('function mqc_inflate(src){')
+    fn = js[start:js.index('\n}\n', start) + 3]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        script = os.path.join(tmp_dir, 'inflate.js')
+        with open(script, 'w') as fh:
+            fh.write(fn + JS_RUNNER)
+        proc = subprocess.Popen([node_path(), script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate('\n'.join([ base64.b64encode(s).decode('ascii') for s in streams ]).encode('ascii'))
+        if proc.returncode != 0:
+            raise RuntimeError(err.decode('utf-8'))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return [ base64.b64decode(l) for l in out.decode('ascii').split('\n') if l != '' ]
+
+def deflate(parts, level=6, flush_parts=False):
+    """ Raw deflate, as in report.compress_json(). With flush_parts, each part
+    ends its own block, so incompressible parts become stored blocks. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    if flush_parts:
+        data = b''.join([ compressor.compress(p) + compressor.flush(zlib.Z_FULL_FLUSH) for p in parts ])
+    else:
+        data = compressor.compress(b''.join(parts))
+    return data + compressor.flush()
+
+class _BitWriter(object):
+    """ Writes a deflate bit stream, least significant bit first """
+    def __init__(self):
+        self.data = bytearray()
+        self.buf = 0
+        self.count = 0
+
+    def bits(self, val, n):
+        self.buf |= val << self.count
+        self.count += n
+        while self.count >= 8:
+            self.data.append(self.buf & 255)
+            self.buf >>= 8
+            self.count -= 8
+
+    def code(self, code, length):
+        """ Huffman codes are written most significant bit first """
+        self.bits(int('{:0{}b}'.format(code, length)[::-1], 2), length)
+
+    def align(self):
+        if self.count > 0:
+            self.bits(0, 8 - self.count)
+
+def _canonical_codes(lengths):
+    """ Huffman codes for a list of code lengths (RFC 1951, 3.2.2) """
+    count = [0] * 16
+    for l in lengths:
+        count[l] += 1
+    count[0] = 0
+    next_code = [0] * 16
+    code = 0
+    for bits in range(1, 16):
+        code = (code + count[bits - 1]) << 1
+        next_code[bits] = code
+    codes = dict()
+    for sym, l in enumerate(lengths):
+        if l > 0:
+            codes[sym] = (next_code[l], l)
+            next_code[l] += 1
+    return codes
+
+def huffman_then_stored(stored_data):
+    """
+    A dynamic Huffman block followed by a stored block. The end of block code
+    is 1 bit long and the longest code is 15 bits, so a decoder that reads
+    codes ahead has more than a byte buffered when the stored block starts.
+    :return: (raw deflate stream, data that it decompresses to)
+    """
+    # End of block: 1 bit, 'a': 2 bits, 'b': 3 bits ... 'n': 15 bits, 'o': 15 bits
+    lit_lengths = [0] * 257
+    lit_lengths[256] = 1
+    for i in range(14):
+        lit_lengths[ord('a') + i] = i + 2
+    lit_lengths[ord('o')] = 15
+    dist_lengths = [1]
+    lit_codes = _canonical_codes(lit_lengths)
+    dist_codes = _canonical_codes(dist_lengths)
+    # Code length codes 0 to 15 are all 4 bits long
+    cl_order = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15]
+    cl_codes = _canonical_codes([4] * 16)
+
+    w = _BitWriter()
+    w.bits(0, 1) # Not the final block
+    w.bits(2, 2) # Dynamic Huffman codes
+    w.bits(len(lit_lengths) - 257, 5)
+    w.bits(len(dist_lengths) - 1, 5)
+    w.bits(19 - 4, 4)
+    for sym in cl_order:
+        w.bits(4 if sym < 16 else 0, 3)
+    for l in lit_lengths + dist_lengths:
+        w.code(*cl_codes[l])
+    w.code(*lit_codes[ord('a')])
+    w.code(*lit_codes[256])
+
+    w.bits(1, 1) # Final block
+    w.bits(0, 2) # Stored
+    w.align()
+    w.bits(len(stored_data), 16)
+    w.bits(len(stored_data) ^ 0xffff, 16)
+    w.data.extend(stored_data)
+    return bytes(w.data), b'a' + stored_data
+
+@unittest.skipIf(node_path() is None, "Node.js is not installed")
+class InflateTest(unittest.TestCase):
+
+    def test_stored_after_huffman(self):
+        stream, expected = huffman_then_stored(b'{"stored": "block"}')
+        self.assertEqual(zlib.decompress(stream, -15), expected)
+        self.assertEqual(js_inflate([stream]), [expected])
+
+    def test_mixed_blocks(self):
+        rnd = random.Random(1)
+        random_bytes = bytes(bytearray([ rnd.randint(0, 255) for _ in range(70000) ]))
+        json_bytes = json.dumps({ 'x': [ rnd.random() for _ in range(5000) ] }).encode('utf-8')
+        cases = list()
+        for parts in [ [random_bytes, json_bytes], [json_bytes, random_bytes], [json_bytes, random_bytes, json_bytes] ]:
+            for flush_parts in [False, True]:
+                cases.append((b''.join(parts), deflate(parts, flush_parts=flush_parts)))
+        results = js_inflate([ stream for data, stream in cases ])
+        for (data, stream), result in zip(cases, results):
+            self.assertEqual(result, data)
+
+if __name__ == '__main__':
+    unittest.main()